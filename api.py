@@ -1,12 +1,17 @@
 import logging
-from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from typing import BinaryIO, Literal
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 import os
 import json
+import hmac
+import time
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -14,7 +19,40 @@ from os import environ
 
 import sys
 sys.path.append('./code')
-from sdk.models import LCSCEvent, LCSCExecutive
+from sdk.models import (
+    LCSCEvent,
+    LCSCEventChanges,
+    LCSCEventContainer,
+    LCSCEventPage,
+    LCSCExecutive,
+    LCSCExecutiveChanges,
+    LCSCExecutiveContainer,
+    LCSCExecutivePage,
+    SyncStatus
+)
+from sdk.change_log import ChangeLogReader, changes_since, covers
+from sdk.change_stream import export_events
+from sdk.compression import pick_encoding
+from sdk.export_store import ExportSnapshot, ExportStore, StaticFileStore
+from sdk.http_cache import CALENDAR_CACHE_CONTROL, JSON_CACHE_CONTROL, encoded_etag, is_not_modified
+from sdk.ical import calendar_path
+from sdk.image_cache import image_cache_from_environ, parse_range
+from sdk.image_index import ImageFile, ImageIndex, open_listed
+from sdk.lazy_images import FAILURE_BACKOFF, LazyImages, image_mode, image_sources_path
+from sdk.metrics import (
+    BACKEND_METRICS_FILE,
+    EXPORT_RESPONSES,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    HTTP_RESPONSE_BYTES,
+    IMAGE_RESPONSES,
+    METRICS_FOLDER,
+    api_metrics
+)
+from sdk.queries import DEFAULT_LIMIT, MAX_LIMIT, EventIndexes, ExecutiveIndexes, decode_cursor, next_cursor, parse_event_time
+from sdk.store import SQLiteReader, sqlite_path, store_kind
+from sdk.sync_queue import QUEUE_FOLDER, SyncRequest, enqueue_sync, sync_request_from_webhook, verify_notion_signature
+from sdk.helpers import read_sync_status
 
 logger = logging.getLogger("lcsc.api")
 
@@ -26,14 +64,62 @@ if "API_URL" not in environ:
     logger.error("Please provide the URL of the API as an environment variable.")
     sys.exit(1)
 
+# GZipMiddleware that never touches routes serving images (already compressed, gzipping them only costs cpu)
+# routes that send precompressed bodies set Content-Encoding, which the gzip middleware leaves alone
+class SelectiveGZipMiddleware:
+    def __init__(self, app:ASGIApp, minimum_size:int = 500, skip_prefixes:tuple[str, ...] = ()) -> None:
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self.skip_prefixes = skip_prefixes
+
+    async def __call__(self, scope:Scope, receive:Receive, send:Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        await self.gzip(scope, receive, send)
+
+# records latency, status and response size per route for /metrics
+# routes are labelled by their template (ie /events/images/{filename}) so every image doesn't get its own series
+class MetricsMiddleware:
+    def __init__(self, app:ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope:Scope, receive:Receive, send:Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        sent = 0
+
+        async def send_wrapper(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the router adds the matched route to the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(route=route, status=str(status))
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route)
+            HTTP_RESPONSE_BYTES.inc(sent, route=route)
+
 app = FastAPI(
     title="LCSC Executives API",
     description="Gets LCSC executives from the internal Notion database.",
     redoc_url="/"
     )
 
-# gzip images so we don't get ddosed (might need more optimizations / move to cloudflare)
-app.add_middleware(GZipMiddleware, minimum_size=500)
+# gzip json so we don't get ddosed (might need more optimizations / move to cloudflare)
+# images are already compressed so they skip this, and event streams would be held back by the compressor's buffering
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=500, skip_prefixes=("/events/images/", "/executives/images/", "/events/stream", "/executives/stream"))
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,114 +129,474 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# added last so it wraps everything else, and counts the bytes actually sent after compression
+app.add_middleware(MetricsMiddleware)
 
 
-def is_safe_path(basedir, path, follow_symlinks=True):
-    # Resolve the absolute path
-    if follow_symlinks:
-        resolved_path = os.path.realpath(path)
-    else:
-        resolved_path = os.path.abspath(path)
 
-    # Ensure the resolved path is within the base directory
-    return resolved_path.startswith(basedir)
+DATA_DIRECTORY = "./data"
 
+# exports are kept parsed (and indexed) in memory and reloaded whenever the backend writes a new file
+events_store = ExportStore(f"{DATA_DIRECTORY}/json/events_export.json", LCSCEventContainer, EventIndexes, records=lambda c: c.events)
+execs_store = ExportStore(f"{DATA_DIRECTORY}/json/execs_export.json", LCSCExecutiveContainer, ExecutiveIndexes, records=lambda c: c.executives)
 
+# with LCSC_STORE=sqlite the query routes read the backend's database (read only, one connection per threadpool thread)
+# instead of the in memory indexes, everything else is still served from the exports
+sqlite_reader = SQLiteReader(sqlite_path(DATA_DIRECTORY)) if store_kind() == "sqlite" else None
 
+events_change_log = ChangeLogReader(f"{DATA_DIRECTORY}/json/events_changes.json")
+execs_change_log = ChangeLogReader(f"{DATA_DIRECTORY}/json/execs_changes.json")
 
+event_images = ImageIndex(f"{DATA_DIRECTORY}/event_images")
+exec_images = ImageIndex(f"{DATA_DIRECTORY}/exec_images")
 
+# with IMAGE_MODE=lazy the backend only records where images are, and they're fetched here on their first request
+lazy_event_images = None
+lazy_exec_images = None
+if image_mode() == "lazy":
+    lazy_event_images = LazyImages(event_images, image_sources_path(DATA_DIRECTORY, "event_images"), "events", f"{DATA_DIRECTORY}/{QUEUE_FOLDER}")
+    lazy_exec_images = LazyImages(exec_images, image_sources_path(DATA_DIRECTORY, "exec_images"), "executives", f"{DATA_DIRECTORY}/{QUEUE_FOLDER}")
 
+# small, frequently requested images are served from memory when IMAGE_CACHE_MB is set (see sdk/image_cache.py)
+image_cache = image_cache_from_environ()
 
+# calendar feeds, the whole feed and one per semester, created as they are first requested
+calendar_stores:dict[str, StaticFileStore] = {}
 
-DATA_DIRECTORY = "./data"
+def calendar_store(semester:str | None) -> StaticFileStore | None:
+    path = calendar_path(DATA_DIRECTORY, semester)
+    if path not in calendar_stores:
+        if not os.path.isfile(path):
+            return None # so made up semesters don't each get a store
+        calendar_stores[path] = StaticFileStore(path)
+    return calendar_stores[path]
 
-@app.get(
-    "/executives/all", 
-    summary="Returns a list of all LCSC executives.",
-)
-async def executives_all() -> list[LCSCExecutive]:
-    # get all executives from local json file
-    path = f"{DATA_DIRECTORY}/json/execs_export.json"
-    response = FileResponse(path)
-    return response
-
-# @app.get(
-#     "/executives/active", 
-#     summary="Returns a list of all non-retired LCSC executives.",
-# )
-# async def executives_active() -> list[LCSCExecutive]:
-#     path = f"{DATA_DIRECTORY}/json/execs_export.json"
-    
-#     with open(path, "r") as fi:
-#         data = json.loads(fi.read())
-        
-#     new_arr = []
+async def require_snapshot(store:ExportStore) -> ExportSnapshot:
+    snapshot = await store.get_async()
+    if snapshot == None:
+        raise HTTPException(status_code=503, detail="Data has not been downloaded from Notion yet.")
+    return snapshot
+
+async def query_events(**filters) -> tuple[list[LCSCEvent], int]:
+    if sqlite_reader == None:
+        indexes: EventIndexes = (await require_snapshot(events_store)).indexes
+        return indexes.query(**filters)
     
-#     for e in data:
-#         if e["current_status"] != "Retired":
-#             new_arr.append(e)
+    results = await run_in_threadpool(sqlite_reader.query_events, **filters)
+    if results == None:
+        raise HTTPException(status_code=503, detail="Data has not been downloaded from Notion yet.")
+    return results
+
+async def query_executives(**filters) -> tuple[list[LCSCExecutive], int]:
+    if sqlite_reader == None:
+        indexes: ExecutiveIndexes = (await require_snapshot(execs_store)).indexes
+        return indexes.query(**filters)
     
-#     return new_arr
+    results = await run_in_threadpool(sqlite_reader.query_executives, **filters)
+    if results == None:
+        raise HTTPException(status_code=503, detail="Data has not been downloaded from Notion yet.")
+    return results
+
+IMAGE_CHUNK_SIZE = 64 * 1024 # bytes read at a time when streaming an image from disk
 
-# @app.get(
-#     "/executives/retired",
-#     summary="Returns a list of all retired LCSC executives.",
-# )
-# async def executives_retired() -> list[LCSCExecutive]:
-#     path = f"{DATA_DIRECTORY}/json/execs_export.json"
+# looked up in memory, so unknown names (and anything outside the folder) are a 404 without touching the disk
+# files are served with the stat from the listing, the only disk access is opening the file that's sent
+async def image_response(index:ImageIndex, lazy:LazyImages | None, filename:str, width:int | None, request:Request) -> Response:
+    await index.update()
+    if lazy != None:
+        await lazy.ensure(filename)
+    accept = request.headers.get("accept", "")
+    
+    # the listing can be a moment behind the folder, so a file that's gone by the time it's opened is picked again from a fresh one
+    # (fetching it again in lazy mode, ie the backend removed it because notion has a newer image)
+    for attempt in range(2):
+        if attempt > 0:
+            await index.update(force=True)
+            if lazy != None:
+                await lazy.ensure(filename)
+        picked = index.pick(filename, width, accept)
+        if picked == None:
+            if lazy != None:
+                continue
+            break
+        file, is_variant = picked
         
-#     with open(path, "r") as fi:
-#         data = json.loads(fi.read())
+        # the same url can return different formats, so caches need to key on the accept header too
+        headers = {"Vary": "Accept", "ETag": file.etag, "Last-Modified": file.last_modified}
+        if is_not_modified(request.headers, file.etag, file.last_modified):
+            return Response(status_code=304, headers=headers)
+        byte_range = requested_range(file, request)
+        if byte_range == "unsatisfiable":
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{file.stat.st_size}"})
         
-#     new_arr = []
+        if image_cache != None and image_cache.cacheable(file):
+            body = image_cache.get(file)
+            if body == None:
+                body = await run_in_threadpool(image_cache.load, file)
+            if body != None:
+                IMAGE_RESPONSES.inc(format=file.media_type if is_variant else "original", result="variant" if is_variant else "original")
+                return cached_image_response(body, file, headers, byte_range)
+        
+        fi = await run_in_threadpool(open_listed, file)
+        if fi != None:
+            IMAGE_RESPONSES.inc(format=file.media_type if is_variant else "original", result="variant" if is_variant else "original")
+            return streamed_image_response(fi, file, headers, byte_range)
+    
+    if lazy != None and await lazy.has_source(filename):
+        # the image exists in notion but couldn't be fetched, it's tried again after a while
+        raise HTTPException(status_code=503, detail="Image could not be fetched from Notion, try again later.", headers={"Retry-After": str(FAILURE_BACKOFF)})
+    raise HTTPException(status_code=404, detail="Image not found.")
+
+# the part of an image the client asked for: None for all of it, (start, end) inclusive or "unsatisfiable"
+# several ranges and malformed range headers are ignored and the whole image is sent, which http allows
+def requested_range(file:ImageFile, request:Request) -> tuple[int, int] | str | None:
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header == None or (if_range != None and if_range not in (file.etag, file.last_modified)):
+        return None
+    return parse_range(range_header, file.stat.st_size)
+
+# returns (status, headers) for the whole image or the given range
+def image_headers(file:ImageFile, headers:dict[str, str], byte_range:tuple[int, int] | None) -> tuple[int, dict[str, str]]:
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    if byte_range == None:
+        headers["Content-Length"] = str(file.stat.st_size)
+        return 200, headers
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{file.stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return 206, headers
+
+def cached_image_response(body:bytes, file:ImageFile, headers:dict[str, str], byte_range:tuple[int, int] | None) -> Response:
+    status, headers = image_headers(file, headers, byte_range)
+    if byte_range != None:
+        body = body[byte_range[0]:byte_range[1] + 1]
+    return Response(body, status_code=status, media_type=file.media_type, headers=headers)
+
+# streams a file opened by open_listed, reading it on worker threads
+def streamed_image_response(fi:BinaryIO, file:ImageFile, headers:dict[str, str], byte_range:tuple[int, int] | None) -> Response:
+    status, headers = image_headers(file, headers, byte_range)
+    start, end = byte_range if byte_range != None else (0, file.stat.st_size - 1)
+
+    async def chunks():
+        try:
+            await run_in_threadpool(fi.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await run_in_threadpool(fi.read, min(IMAGE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            fi.close()
+
+    return StreamingResponse(chunks(), status_code=status, media_type=file.media_type, headers=headers)
+
+def parse_cursor(cursor:str | None) -> int:
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# sends the in memory copy of an export, already compressed if the client accepts it
+# clients that already have the current version get an empty 304
+async def json_export_response(store:ExportStore, request:Request) -> Response:
+    snapshot = await store.get_async()
+    if snapshot == None:
+        return JSONResponse({"detail": "Data has not been downloaded from Notion yet."}, status_code=503)
+    
+    encoding = pick_encoding(request.headers.get("accept-encoding", ""), snapshot.encoded)
+    
+    headers = {
+        "ETag": encoded_etag(snapshot.etag, encoding),
+        "Cache-Control": JSON_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if snapshot.last_modified:
+        headers["Last-Modified"] = snapshot.last_modified
+    
+    export = os.path.basename(store.path)
+    if is_not_modified(request.headers, snapshot.etag, snapshot.last_modified):
+        EXPORT_RESPONSES.inc(export=export, encoding=encoding or "identity", result="not_modified")
+        return Response(status_code=304, headers=headers)
+    
+    EXPORT_RESPONSES.inc(export=export, encoding=encoding or "identity", result="sent")
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(snapshot.encoded[encoding], media_type="application/json", headers=headers)
+    return Response(snapshot.body, media_type="application/json", headers=headers)
+
+# records changed since the version a client has, as of the export currently being served
+# returns (version, changed records, deleted ids)
+async def export_changes(store:ExportStore, reader:ChangeLogReader, since:int) -> tuple[int, list, list[str]]:
+    snapshot = await require_snapshot(store)
+    version = snapshot.container.metadata.version
+    if since == version:
+        return version, [], []
     
-#     for e in data:
-#         if e["current_status"] == "Retired":
-#             new_arr.append(e)
+    log = await reader.get_async(version)
+    if not covers(log, since, version):
+        raise HTTPException(status_code=410, detail="Changes since that version are no longer available, fetch everything again.")
+    
+    changed, deleted = changes_since(log, since, version)
+    by_id = snapshot.indexes.by_id
+    upserted = [by_id[id] for id in changed if id in by_id]
+    deleted += [id for id in changed if id not in by_id] # shouldn't happen, but the client can't have a record we don't
+    return version, upserted, deleted
+
+# server-sent events telling clients when an export changes, so they only refetch when there is something new
+def export_stream_response(store:ExportStore, request:Request) -> StreamingResponse:
+    return StreamingResponse(
+        export_events(store, request.is_disconnected, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no", # stop nginx from buffering the stream
+        },
+    )
+
+@app.get(
+    "/metrics",
+    summary="Prometheus metrics for the api and the backend.",
+    include_in_schema=False,
+)
+async def metrics() -> Response:
+    body = api_metrics.render()
+    try:
+        with open(f"{DATA_DIRECTORY}/{METRICS_FOLDER}/{BACKEND_METRICS_FILE}", "r") as fi:
+            body += fi.read()
+    except FileNotFoundError:
+        pass
+    return Response(body, media_type="text/plain; version=0.0.4")
+
+@app.get(
+    "/status",
+    summary="Returns when the backend last checked Notion for updates and when the data last changed.",
+)
+async def status() -> dict[str, SyncStatus | None]:
+    return {
+        "events": read_sync_status(f"{DATA_DIRECTORY}/json/events_status.json"),
+        "executives": read_sync_status(f"{DATA_DIRECTORY}/json/execs_status.json"),
+    }
+
+@app.get(
+    "/executives/all", 
+    summary="Returns a list of all LCSC executives.",
+)
+async def executives_all(request: Request) -> list[LCSCExecutive]:
+    return await json_export_response(execs_store, request)
+
+@app.get(
+    "/executives",
+    summary="Returns LCSC executives filtered by status and/or role, one page at a time.",
+)
+async def executives_query(
+    status: str | None = Query(default=None, description="Only executives with this current status, ie `Active` or `Retired`."),
+    role: str | None = Query(default=None, description="Only executives currently holding this role, ie `President`."),
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = Query(default=None, description="`next_cursor` from the previous page."),
+) -> LCSCExecutivePage:
+    offset = parse_cursor(cursor)
     
-#     return new_arr
+    results, total = await query_executives(status=status, role=role, offset=offset, limit=limit)
+    return LCSCExecutivePage(results=results, total=total, next_cursor=next_cursor(offset, limit, total))
+
+@app.get(
+    "/executives/active", 
+    summary="Returns a list of all non-retired LCSC executives.",
+)
+async def executives_active() -> list[LCSCExecutive]:
+    return (await query_executives(exclude_status="Retired", limit=None))[0]
+
+@app.get(
+    "/executives/retired",
+    summary="Returns a list of all retired LCSC executives.",
+)
+async def executives_retired() -> list[LCSCExecutive]:
+    return (await query_executives(status="Retired", limit=None))[0]
+
+@app.get(
+    "/executives/changes",
+    summary="Returns executives added or edited since a version, and the ids of executives deleted since then.",
+    description="`since` is `metadata.version` from `/executives/all` or `version` from a previous call. Answers 410 if the version is too old, in which case fetch `/executives/all` again.",
+)
+async def executives_changes(since: int = Query(ge=0)) -> LCSCExecutiveChanges:
+    version, upserted, deleted = await export_changes(execs_store, execs_change_log, since)
+    return LCSCExecutiveChanges(version=version, upserted=upserted, deleted=deleted)
+
+@app.get(
+    "/executives/stream",
+    summary="Streams a notification (new ETag and changed executive ids) whenever the executives change.",
+    description="A `text/event-stream` of `version` and `change` events. Refetch `/executives/all` (or just the changed ids) when a `change` arrives.",
+    response_class=StreamingResponse,
+)
+async def executives_stream(request: Request):
+    return export_stream_response(execs_store, request)
 
 @app.get(
     "/executives/images/{filename}", 
     summary="Returns the executive image with the given filename.",
+    description="Pass `w` to get a smaller copy at least that many pixels wide. WebP / AVIF copies are returned if the `Accept` header allows them, otherwise JPEG and PNG images are resized in their own format.",
+)
+async def executives_image(filename, request: Request, w: int | None = Query(default=None, gt=0)):
+    return await image_response(exec_images, lazy_exec_images, filename, w, request)
+
+@app.get(
+    "/events/all",
+    summary="Returns all events organized by the LCSC."
+)
+async def events_all(request: Request) -> list[LCSCEvent]:
+    return await json_export_response(events_store, request)
+
+@app.get(
+    "/events",
+    summary="Returns events filtered by semester and/or date, one page at a time.",
+    description="Events are sorted by start date, soonest first for `when=upcoming` and newest first otherwise. Date filters only match events that have a start date.",
 )
-async def executives_image(filename):
+async def events_query(
+    semester: str | None = Query(default=None, description="Only events in this semester, ie `2024 Fall`."),
+    start_after: str | None = Query(default=None, description="Only events starting at or after this ISO date / datetime."),
+    start_before: str | None = Query(default=None, description="Only events starting at or before this ISO date / datetime."),
+    when: Literal["upcoming", "past"] | None = Query(default=None, description="Only events that haven't started yet / already started."),
+    order: Literal["asc", "desc"] | None = Query(default=None),
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = Query(default=None, description="`next_cursor` from the previous page."),
+) -> LCSCEventPage:
+    offset = parse_cursor(cursor)
     
-    path = f"{DATA_DIRECTORY}/exec_images/{filename}"
+    after = parse_event_time(start_after)
+    before = parse_event_time(start_before)
+    if (start_after and after == None) or (start_before and before == None):
+        raise HTTPException(status_code=422, detail="start_after and start_before must be ISO dates or datetimes.")
     
-    if not os.path.isfile(path):
-        return 404
+    results, total = await query_events(
+        semester=semester,
+        start_after=after,
+        start_before=before,
+        when=when,
+        order=order,
+        offset=offset,
+        limit=limit,
+    )
+    return LCSCEventPage(results=results, total=total, next_cursor=next_cursor(offset, limit, total))
+
+@app.get(
+    "/events/changes",
+    summary="Returns events added or edited since a version, and the ids of events deleted since then.",
+    description="`since` is `metadata.version` from `/events/all` or `version` from a previous call. Answers 410 if the version is too old, in which case fetch `/events/all` again.",
+)
+async def events_changes(since: int = Query(ge=0)) -> LCSCEventChanges:
+    version, upserted, deleted = await export_changes(events_store, events_change_log, since)
+    return LCSCEventChanges(version=version, upserted=upserted, deleted=deleted)
+
+@app.get(
+    "/events/calendar.ics",
+    summary="Returns LCSC events as an iCalendar feed, to subscribe to from a calendar app.",
+    description="Recurring events are expanded into their upcoming occurrences. Pass `semester` (ie `2024 Fall`) to only get that semester's events.",
+    response_class=Response,
+)
+async def events_calendar(request: Request, semester: str | None = Query(default=None)):
+    store = calendar_store(semester)
+    feed = await store.get_async() if store != None else None
+    if feed == None:
+        if semester != None:
+            raise HTTPException(status_code=404, detail="No events found for that semester.")
+        raise HTTPException(status_code=503, detail="Data has not been downloaded from Notion yet.")
     
+    encoding = pick_encoding(request.headers.get("accept-encoding", ""), feed.encoded)
+    headers = {
+        "ETag": encoded_etag(feed.etag, encoding),
+        "Cache-Control": CALENDAR_CACHE_CONTROL,
+        "Last-Modified": feed.last_modified,
+        "Vary": "Accept-Encoding",
+    }
+    if is_not_modified(request.headers, feed.etag, feed.last_modified):
+        return Response(status_code=304, headers=headers)
     
-    response = FileResponse(path)
-    return response
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(feed.encoded[encoding], media_type="text/calendar; charset=utf-8", headers=headers)
+    return Response(feed.body, media_type="text/calendar; charset=utf-8", headers=headers)
 
 @app.get(
-    "/events/all",
-    summary="Returns all events organized by the LCSC."
+    "/events/stream",
+    summary="Streams a notification (new ETag and changed event ids) whenever the events change.",
+    description="A `text/event-stream` of `version` and `change` events. Refetch `/events/all` (or just the changed ids) when a `change` arrives.",
+    response_class=StreamingResponse,
 )
-async def events_all() -> list[LCSCEvent]:
-    path = f"{DATA_DIRECTORY}/json/events_export.json"
-    response = FileResponse(path)
-    return response
+async def events_stream(request: Request):
+    return export_stream_response(events_store, request)
 
 @app.get(
     "/events/images/{filename}",
     summary="Returns the event image with the given filename.",
+    description="Pass `w` to get a smaller copy at least that many pixels wide. WebP / AVIF copies are returned if the `Accept` header allows them, otherwise JPEG and PNG images are resized in their own format.",
 )
-async def event_image(filename):
-    
-    base_dir = os.path.realpath(f"{DATA_DIRECTORY}/event_images/")
-    path = os.path.join(base_dir, filename)
-    if not is_safe_path(base_dir, path) or not os.path.isfile(path):
-        return 404
-    
-        
-    if not os.path.isfile(path):
-        return 404
+async def event_image(filename, request: Request, w: int | None = Query(default=None, gt=0)):
+    return await image_response(event_images, lazy_event_images, filename, w, request)
+
+# WEBHOOKS
+# the backend only polls notion every few minutes, these let a change be picked up within seconds
+# requests are handed to the backend through the queue folder on the shared volume
+
+MAX_LOGGED_TOKEN_LENGTH = 128 # notion's verification tokens are well under this
+
+@app.post(
+    "/webhooks/notion",
+    summary="Receives Notion webhook events and asks the backend to sync the page that changed.",
+    include_in_schema=False,
+)
+async def notion_webhook(request: Request):
+    body = await request.body()
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Expected a JSON body.")
+    if not isinstance(event, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON object.")
+
+    secret = environ.get("NOTION_WEBHOOK_SECRET")
     
-    response = FileResponse(path)
-    return response
+    # when a subscription is created notion sends a one-off verification token, which has to be pasted back into notion
+    # and is then used to sign every event
+    if "verification_token" in event:
+        if secret:
+            logger.info("Received a Notion webhook verification request, but NOTION_WEBHOOK_SECRET is already set.")
+        else:
+            # the endpoint is public, so whatever was sent is cleaned up before it goes anywhere near the logs
+            token = "".join(c for c in str(event["verification_token"])[:MAX_LOGGED_TOKEN_LENGTH] if c.isprintable())
+            logger.warning(f"Notion webhook verification token: {token} (set it as NOTION_WEBHOOK_SECRET)")
+        return {"ok": True}
+
+    if not secret:
+        raise HTTPException(status_code=503, detail="Webhooks are not configured.")
+    if not verify_notion_signature(secret, body, request.headers.get("x-notion-signature")):
+        raise HTTPException(status_code=401, detail="Invalid signature.")
+
+    sync_request = sync_request_from_webhook(event)
+    if sync_request == None:
+        return {"queued": False}
+
+    enqueue_sync(f"{DATA_DIRECTORY}/{QUEUE_FOLDER}", sync_request)
+    return {"queued": True}
+
+@app.post(
+    "/webhooks/refresh",
+    summary="Asks the backend to sync a database (or one page of it) now.",
+    description="Requires `Authorization: Bearer <REFRESH_TOKEN>`.",
+)
+async def refresh(sync_request: SyncRequest, request: Request):
+    token = environ.get("REFRESH_TOKEN")
+    if not token:
+        raise HTTPException(status_code=503, detail="Refreshing is not configured.")
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid token.")
+
+    if not sync_request.reason:
+        sync_request.reason = "manual refresh"
+    enqueue_sync(f"{DATA_DIRECTORY}/{QUEUE_FOLDER}", sync_request)
+    return {"queued": True}
 
 if __name__ == "__main__":
     import uvicorn
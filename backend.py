@@ -1,16 +1,26 @@
+import asyncio
 import logging
 from dotenv import load_dotenv
 from os import environ
-import schedule
-import time
 
 import sys
 sys.path.append('code/')
-from sdk.helpers import create_folder_if_not_existing
+from sdk.helpers import create_folder_if_not_existing, write_file_atomic
+from sdk.metrics import BACKEND_METRICS_FILE, METRICS_FOLDER, backend_metrics
 from sdk.fetch_events import updateDataFromNotion as fetch_events
 from sdk.fetch_execs import updateDataFromNotion as fetch_execs
-
-REFRESH_TIME = 60  # seconds
+from sdk.scheduler import SyncPipeline
+from sdk.sync_queue import QUEUE_FOLDER, drain_queue
+
+REFRESH_TIME = 60  # seconds, how often to check while things are changing
+MAX_REFRESH_TIME = 15 * 60 # seconds, how often to check after a long time without changes
+REFRESH_JITTER = 5 # seconds, so the databases aren't always polled at the exact same moment
+SYNC_DEADLINE = 600 # seconds, a sync taking longer than this is cancelled and retried on the next poll
+FULL_SYNC_INTERVAL = 60 * 60 # seconds, how often a poll pulls the whole database so deleted pages are noticed
+WEBHOOK_REFRESH_TIME = 10 * 60 # seconds, with webhooks set up polling is only a fallback for missed events
+WEBHOOK_MAX_REFRESH_TIME = 60 * 60
+QUEUE_CHECK_TIME = 1 # seconds, how often to look for sync requests from the api (webhooks / manual refreshes)
+METRICS_WRITE_TIME = 15 # seconds, how often metrics are written out for the api to serve on /metrics
 
 # Create a custom handler
 console_handler = logging.StreamHandler()
@@ -25,9 +35,14 @@ logger.setLevel(logging.INFO)
 logger.addHandler(console_handler)
 
 
-logger.info(f"Launching Notion downloader backend service. Pulling new data now and every {REFRESH_TIME} seconds.")
-
 load_dotenv()
+
+if environ.get("NOTION_WEBHOOK_SECRET"):
+    REFRESH_TIME = WEBHOOK_REFRESH_TIME
+    MAX_REFRESH_TIME = WEBHOOK_MAX_REFRESH_TIME
+
+logger.info(f"Launching Notion downloader backend service. Pulling new data now and every {REFRESH_TIME} to {MAX_REFRESH_TIME} seconds.")
+
 if "NOTION_API_TOKEN" not in environ:
     logger.error("No Notion API token found in environment variables.")
     sys.exit(1)
@@ -47,43 +62,66 @@ if create_folder_if_not_existing(f"{WRITE_LOCATION}exec_images/"):
     logger.info(f"Creating directory at {WRITE_LOCATION}exec_images/")
 if create_folder_if_not_existing(f"{WRITE_LOCATION}json/"):
     logger.info(f"Creating directory at {WRITE_LOCATION}json/")
+if create_folder_if_not_existing(f"{WRITE_LOCATION}{QUEUE_FOLDER}/"):
+    logger.info(f"Creating directory at {WRITE_LOCATION}{QUEUE_FOLDER}/")
+if create_folder_if_not_existing(f"{WRITE_LOCATION}{METRICS_FOLDER}/"):
+    logger.info(f"Creating directory at {WRITE_LOCATION}{METRICS_FOLDER}/")
 
-events_log = 999
-execs_log = 999
 UPDATE_FREQUENCY = 20
 
-def fetch_events_wrapper():
-    global events_log
-    if events_log >= UPDATE_FREQUENCY:
-        logger.info("Checking events page for updates.")
-    if fetch_events():
-        updateDependencies()
-    else:
-        if events_log >= UPDATE_FREQUENCY:
-            logger.info("No new event updates found.")
-            events_log = 0
-        events_log += 1
-
-def fetch_execs_wrapper():
-    global execs_log
-    if execs_log >= UPDATE_FREQUENCY:
-        logger.info("Checking executives page for updates.")
-    if fetch_execs():
-        updateDependencies()
-    else:
-        if execs_log >= UPDATE_FREQUENCY:
-            logger.info("No new executive updates found.")
-            execs_log = 0
-        execs_log += 1
-
 def updateDependencies():
     pass
 
-fetch_events_wrapper()
-fetch_execs_wrapper()
-schedule.every(REFRESH_TIME).seconds.do(fetch_events_wrapper)
-schedule.every(REFRESH_TIME).seconds.do(fetch_execs_wrapper)
-
-while True:
-    schedule.run_pending()
-    time.sleep(1)
+# each database syncs on its own task, so a slow image batch for events doesn't hold up executives (and vice versa)
+pipelines = [
+    SyncPipeline(
+        "event",
+        fetch_events,
+        interval=REFRESH_TIME,
+        max_interval=MAX_REFRESH_TIME,
+        jitter=REFRESH_JITTER,
+        deadline=SYNC_DEADLINE,
+        full_sync_interval=FULL_SYNC_INTERVAL,
+        log_frequency=UPDATE_FREQUENCY,
+        on_update=updateDependencies,
+    ),
+    SyncPipeline(
+        "executive",
+        fetch_execs,
+        interval=REFRESH_TIME,
+        max_interval=MAX_REFRESH_TIME,
+        jitter=REFRESH_JITTER,
+        deadline=SYNC_DEADLINE,
+        full_sync_interval=FULL_SYNC_INTERVAL,
+        log_frequency=UPDATE_FREQUENCY,
+        on_update=updateDependencies,
+    ),
+]
+
+pipelines_by_database = {
+    "events": pipelines[0],
+    "executives": pipelines[1],
+}
+
+# hands sync requests queued by the api (webhooks, manual refreshes) to the right pipeline
+async def watch_queue():
+    queue_folder = f"{WRITE_LOCATION}{QUEUE_FOLDER}"
+    while True:
+        for request in drain_queue(queue_folder):
+            logger.info(f"Sync of {request.database} requested ({request.reason or 'no reason given'}).")
+            pipelines_by_database[request.database].trigger(request.page_id)
+        await asyncio.sleep(QUEUE_CHECK_TIME)
+
+# the backend has no http server, so the api serves these alongside its own metrics
+async def write_metrics():
+    while True:
+        write_file_atomic(f"{WRITE_LOCATION}{METRICS_FOLDER}/{BACKEND_METRICS_FILE}", backend_metrics.render().encode("utf-8"))
+        await asyncio.sleep(METRICS_WRITE_TIME)
+
+async def main():
+    await asyncio.gather(watch_queue(), write_metrics(), *(p.run_forever() for p in pipelines))
+
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    logger.info("Shutting down.")
@@ -0,0 +1,132 @@
+import asyncio
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# FAKE NOTION
+# a local stand in for the parts of the notion api the backend uses (database queries and retrieval, page retrieval)
+# and for the file hosting urls images are downloaded from, so syncs can be timed without the network or rate limits
+
+def normalize_id(notion_id:str) -> str:
+    return notion_id.replace("-", "").lower()
+
+def not_found(message:str) -> JSONResponse:
+    return JSONResponse({"object": "error", "status": 404, "code": "object_not_found", "message": message}, status_code=404)
+
+def matches_filter(page:dict, filter:dict | None) -> bool:
+    # only the last edited filter the backend sends is supported
+    if not filter:
+        return True
+    since = filter.get("last_edited_time", {}).get("on_or_after")
+    return since == None or page["last_edited_time"] >= since
+
+# serves a set of databases (database id : list of pages) and files (name : bytes)
+# the databases can be edited between syncs, the server always answers with their current contents
+class FakeNotion:
+    def __init__(self, databases:dict[str, list[dict]], files:dict[str, bytes], latency:float = 0.0) -> None:
+        self.databases = databases
+        self.files = files
+        self.latency = latency # seconds added to every notion api call, to mimic the round trip to notion
+        self.counts:dict[str, int] = {"query": 0, "retrieve": 0, "file": 0}
+        self.file_bytes = 0
+
+        self.app = self.create_app()
+        self.server:uvicorn.Server | None = None
+        self.url = ""
+
+    def database(self, database_id:str) -> list[dict] | None:
+        for id, pages in self.databases.items():
+            if normalize_id(id) == normalize_id(database_id):
+                return pages
+        return None
+
+    def reset_counts(self) -> None:
+        self.counts = {name: 0 for name in self.counts}
+        self.file_bytes = 0
+
+    def create_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1/databases/{database_id}/query")
+        async def query(database_id:str, request:Request):
+            self.counts["query"] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+            pages = self.database(database_id)
+            if pages == None:
+                return not_found(f"Could not find database with ID: {database_id}.")
+
+            body = await request.json()
+            matching = [p for p in pages if matches_filter(p, body.get("filter"))]
+            start = int(body.get("start_cursor") or 0)
+            size = min(int(body.get("page_size") or 100), 100)
+            more = start + size < len(matching)
+            return {
+                "object": "list",
+                "results": matching[start:start + size],
+                "has_more": more,
+                "next_cursor": str(start + size) if more else None,
+            }
+
+        # the columns are taken from the first page, every synthetic page has the same ones
+        @app.get("/v1/databases/{database_id}")
+        async def retrieve_database(database_id:str):
+            self.counts["retrieve"] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+            pages = self.database(database_id)
+            if pages == None:
+                return not_found(f"Could not find database with ID: {database_id}.")
+
+            properties = pages[0]["properties"] if pages else {}
+            return {
+                "object": "database",
+                "id": database_id,
+                "properties": {name: {"id": name, "name": name, "type": prop["type"]} for name, prop in properties.items()},
+            }
+
+        @app.get("/v1/pages/{page_id}")
+        async def retrieve(page_id:str):
+            self.counts["retrieve"] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+            for pages in self.databases.values():
+                for page in pages:
+                    if normalize_id(page["id"]) == normalize_id(page_id):
+                        return page
+            return not_found(f"Could not find page with ID: {page_id}.")
+
+        @app.get("/files/{name}")
+        async def file(name:str):
+            self.counts["file"] += 1
+            if name not in self.files:
+                return Response(status_code=404)
+            self.file_bytes += len(self.files[name])
+            return Response(self.files[name], media_type="image/jpeg")
+
+        return app
+
+    # runs the server on a free local port in a background thread
+    def start(self) -> str:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=self.server.run, daemon=True).start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    def stop(self) -> None:
+        if self.server != None:
+            self.server.should_exit = True
@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+# run from the repository root: python -m bench.run --sizes 10 100 1000 --output bench_results.json
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from bench.fake_notion import FakeNotion
+from bench.synthetic import SyntheticWorkspace
+from sdk import notion_query
+from sdk.fetch_events import updateDataFromNotion as fetch_events
+from sdk.fetch_execs import updateDataFromNotion as fetch_execs
+from sdk.helpers import VARIANT_FORMATS
+from sdk.rate_limit import TokenBucket
+
+# BENCHMARKS
+# times syncs against a fake notion server with synthetic databases, then load tests the api serving the result
+# everything runs locally, so results are comparable between runs on the same machine (not with production)
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+MAX_IMAGE_PAGES = 100 # larger databases are only benchmarked without images by default, compressing thousands of images takes a long time
+
+def percentile(values:list[float], p:float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# SYNCS
+
+def timed_sync(fake:FakeNotion, fetch, write_location:str, **kwargs) -> dict:
+    fake.reset_counts()
+    start = time.perf_counter()
+    changed = asyncio.run(fetch(write_location, **kwargs))
+    seconds = time.perf_counter() - start
+
+    return {
+        "seconds": round(seconds, 4),
+        "changed": changed,
+        "notion_queries": fake.counts["query"],
+        "notion_retrieves": fake.counts["retrieve"],
+        "files_downloaded": fake.counts["file"],
+        "file_bytes": fake.file_bytes,
+    }
+
+def bench_syncs(fake:FakeNotion, workspace:SyntheticWorkspace, write_location:str) -> dict:
+    results = {}
+    for name, fetch, pages in [("events", fetch_events, workspace.events), ("executives", fetch_execs, workspace.executives)]:
+        result = {}
+        result["cold"] = timed_sync(fake, fetch, write_location, full_sync=True)
+        result["warm"] = timed_sync(fake, fetch, write_location, full_sync=False)
+        result["warm_full"] = timed_sync(fake, fetch, write_location, full_sync=True)
+
+        workspace.edit_one(pages)
+        result["one_change"] = timed_sync(fake, fetch, write_location, full_sync=False)
+
+        # what a webhook triggers, only the edited page is fetched
+        edited = workspace.edit_one(pages)
+        result["one_change_targeted"] = timed_sync(fake, fetch, write_location, full_sync=False, page_ids=[edited["id"]])
+
+        results[name] = result
+    return results
+
+
+# API
+
+def start_api(data_root:str) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, NOTION_API_TOKEN="bench", API_URL=f"http://127.0.0.1:{port}")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--app-dir", REPO_ROOT, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=data_root, # the api reads ./data
+        env=env,
+    )
+
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            if httpx.get(f"{url}/status").status_code == 200:
+                return process, url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    process.kill()
+    raise Exception("The api didn't start.")
+
+def api_routes(write_location:str) -> dict[str, str]:
+    with open(f"{write_location}json/events_export.json") as fi:
+        events = json.load(fi)
+    with open(f"{write_location}json/execs_export.json") as fi:
+        executives = json.load(fi)
+
+    routes = {
+        "events_all": "/events/all",
+        "events_query": "/events?limit=50",
+        "events_upcoming": "/events?when=upcoming&limit=20",
+        "events_semester": "/events?semester=2024%20Fall&limit=50",
+        "events_changes": f"/events/changes?since={max(0, events['metadata']['version'] - 1)}",
+        "executives_all": "/executives/all",
+        "executives_active": "/executives/active",
+        "executives_query": "/executives?role=president",
+        "status": "/status",
+    }
+
+    thumbnails = [e["thumbnail"] for e in events["events"] if e.get("thumbnail")]
+    if thumbnails:
+        routes["events_image"] = "/events/images/" + thumbnails[0].rsplit("/", 1)[-1]
+        routes["events_image_320w"] = routes["events_image"] + "?w=320"
+    candids = [e["profile_picture"] for e in executives["executives"] if e.get("profile_picture")]
+    if candids:
+        routes["executives_image"] = "/executives/images/" + candids[0].rsplit("/", 1)[-1]
+    return routes
+
+async def load_route(client:httpx.AsyncClient, path:str, requests:int, concurrency:int, warmup:int) -> dict:
+    for _ in range(warmup):
+        await client.get(path)
+
+    latencies:list[float] = []
+    statuses:dict[int, int] = {}
+    response_bytes = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, response_bytes
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            response_bytes += int(response.headers.get("content-length") or len(response.content))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(seconds, 4),
+        "requests_per_second": round(requests / seconds, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+        "mean_response_bytes": round(response_bytes / requests),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+async def bench_api(url:str, routes:dict[str, str], requests:int, concurrency:int, warmup:int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # only ask for the encodings a browser would, so compressed responses are what gets measured
+    headers = {"Accept-Encoding": "br, gzip", "Accept": "image/avif,image/webp,*/*"}
+    async with httpx.AsyncClient(base_url=url, limits=limits, headers=headers, timeout=30) as client:
+        return {name: await load_route(client, path, requests, concurrency, warmup) for name, path in routes.items()}
+
+
+def run_case(pages:int, images:bool, args) -> dict:
+    print(f"Benchmarking {pages} pages {'with' if images else 'without'} images...", file=sys.stderr)
+
+    data_root = tempfile.mkdtemp(prefix="lcsc-bench-")
+    write_location = f"{data_root}/data/"
+    for folder in ["json", "event_images", "exec_images"]:
+        os.makedirs(write_location + folder)
+
+    fake = FakeNotion({}, {}, latency=args.notion_latency)
+    url = fake.start()
+    workspace = SyntheticWorkspace(pages, images, f"{url}/files")
+    fake.databases = workspace.databases()
+    fake.files = workspace.files
+    os.environ["NOTION_BASE_URL"] = url
+
+    api = None
+    try:
+        result = {"pages": pages, "images": images, "sync": bench_syncs(fake, workspace, write_location)}
+
+        if not args.skip_api:
+            api, api_url = start_api(data_root)
+            result["api"] = asyncio.run(bench_api(api_url, api_routes(write_location), args.requests, args.concurrency, args.warmup))
+        return result
+    finally:
+        if api != None:
+            api.terminate()
+            api.wait()
+        fake.stop()
+        if not args.keep_data:
+            shutil.rmtree(data_root, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark syncing and serving against a local fake Notion.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="number of pages in each synthetic database")
+    parser.add_argument("--images", choices=["with", "without", "both"], default="both")
+    parser.add_argument("--max-image-pages", type=int, default=MAX_IMAGE_PAGES, help="largest size benchmarked with images")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per api route")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--notion-latency", type=float, default=0.0, help="seconds added to every fake notion api call")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the real notion rate limit (3 requests per second)")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--keep-data", action="store_true", help="don't delete the synced data afterwards")
+    parser.add_argument("--output", default=None, help="file to write the json results to (default stdout)")
+    args = parser.parse_args()
+
+    os.environ["NOTION_API_TOKEN"] = "bench"
+    os.environ.setdefault("API_URL", "http://localhost:5000") # image urls in the exports
+    if not args.rate_limit:
+        # measure our own code, not how long we wait on notion's rate limit
+        notion_query.notion_limiter = TokenBucket(rate=1_000_000, burst=1_000_000)
+
+    cases = []
+    for pages in args.sizes:
+        if args.images in ("without", "both"):
+            cases.append((pages, False))
+        if args.images in ("with", "both") and pages <= args.max_image_pages:
+            cases.append((pages, True))
+
+    output = {
+        "meta": {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "image_formats": VARIANT_FORMATS,
+            "rate_limited": args.rate_limit,
+            "notion_latency": args.notion_latency,
+        },
+        "results": [run_case(pages, images, args) for pages, images in cases],
+    }
+
+    text = json.dumps(output, indent=4)
+    if args.output:
+        with open(args.output, "w") as fo:
+            fo.write(text)
+    else:
+        print(text)
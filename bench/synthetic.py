@@ -0,0 +1,158 @@
+import io
+import random
+from datetime import datetime, timedelta, timezone
+
+from PIL import Image
+
+from sdk.fetch_events import EVENTS_DB_ID, RECURRING_EVENTS_LIST_DB_ID
+from sdk.fetch_execs import EXECUTIVES_DB_ID, ROLES_DB_ID
+
+# SYNTHETIC DATABASES
+# pages shaped like the ones the notion api returns for our databases, with only the properties the fetchers read
+
+ROLE_NAMES = ["President", "Vice President Internal", "Vice President External", "Director of Technology", "Director of Events", "Director of Media", "Tech Lead", "Events Coordinator"]
+SEMESTERS = ["2023 Fall", "2024 Spring", "2024 Summer", "2024 Fall", "2025 Spring"]
+IMAGE_VARIETY = 8 # distinct images generated, pages cycle through them so large databases don't take forever to set up
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def notion_time(dt:datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+# which database a synthetic page belongs to, the last part of its id
+KINDS = {"event": 1, "recurring": 2, "executive": 3, "role": 4}
+
+def page_id(kind:str, i:int) -> str:
+    # notion ids are uuids, keep them unique and stable between runs
+    return f"{i:08x}-0000-4000-8000-{KINDS[kind]:012x}"
+
+def title(value:str | None) -> dict:
+    return {"type": "title", "title": [{"type": "text", "plain_text": value}] if value else []}
+
+def rich_text(value:str | None) -> dict:
+    return {"type": "rich_text", "rich_text": [{"type": "text", "plain_text": value}] if value else []}
+
+def select(value:str | None) -> dict:
+    return {"type": "select", "select": {"name": value} if value else None}
+
+def url(value:str | None) -> dict:
+    return {"type": "url", "url": value}
+
+def date(start:str | None, end:str | None = None) -> dict:
+    return {"type": "date", "date": {"start": start, "end": end} if start else None}
+
+def relation(ids:list[str]) -> dict:
+    return {"type": "relation", "relation": [{"id": id} for id in ids], "has_more": False}
+
+def files(name:str | None, file_url:str | None) -> dict:
+    if not name:
+        return {"type": "files", "files": []}
+    expiry = notion_time(datetime.now(timezone.utc) + timedelta(hours=1))
+    # notion file urls are signed and expire, the query string changes every time a page is fetched
+    return {"type": "files", "files": [{"name": name, "type": "file", "file": {"url": f"{file_url}?X-Amz-Signature={random.getrandbits(64):x}", "expiry_time": expiry}}]}
+
+def page(id:str, database_id:str, edited:str, properties:dict) -> dict:
+    return {
+        "object": "page",
+        "id": id,
+        "created_time": notion_time(BASE_TIME),
+        "last_edited_time": edited,
+        "archived": False,
+        "in_trash": False,
+        "parent": {"type": "database_id", "database_id": database_id},
+        "properties": properties,
+    }
+
+
+def make_image(i:int, width:int = 1600, height:int = 1200) -> bytes:
+    rng = random.Random(i)
+    image = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    # some structure so the encoders have real work to do
+    pixels = image.load()
+    for y in range(0, height, 4):
+        for x in range(0, width, 4):
+            pixels[x, y] = ((x * 7 + i) % 256, (y * 3) % 256, (x + y) % 256)
+
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+# a set of synthetic databases, with helpers for editing them between syncs
+class SyntheticWorkspace:
+    def __init__(self, pages:int, images:bool, files_url:str) -> None:
+        self.pages = pages
+        self.images = images
+        self.files_url = files_url      # root url file urls point at, ie the fake notion server's /files
+        self.files:dict[str, bytes] = {} # file name : bytes served from files_url
+        self.edits = 0
+
+        sources = [make_image(i) for i in range(IMAGE_VARIETY)] if images else []
+
+        self.roles = [
+            page(page_id("role", i), ROLES_DB_ID, notion_time(BASE_TIME), {"Name": title(name)})
+            for i, name in enumerate(ROLE_NAMES)
+        ]
+        self.recurring = [
+            page(page_id("recurring", i), RECURRING_EVENTS_LIST_DB_ID, notion_time(BASE_TIME), {"Title": title(f"Weekly Meetup {i}"), "Frequency": select("Weekly")})
+            for i in range(3)
+        ]
+
+        self.events = []
+        self.executives = []
+        for i in range(pages):
+            edited = notion_time(BASE_TIME + timedelta(minutes=i))
+
+            event_id = page_id("event", i)
+            thumbnail = None
+            if images:
+                thumbnail = f"{event_id}.jpg"
+                self.files[thumbnail] = sources[i % IMAGE_VARIETY]
+            start = BASE_TIME + timedelta(days=i % 700, hours=18)
+            self.events.append(page(event_id, EVENTS_DB_ID, edited, {
+                "Title": title(f"Event {i}"),
+                "Semester": select(SEMESTERS[i % len(SEMESTERS)]),
+                "Event Date": date(start.isoformat(), (start + timedelta(hours=2)).isoformat()),
+                "Location": rich_text(f"Room A{i % 300}"),
+                "Thumbnail": files(thumbnail, f"{files_url}/{thumbnail}"),
+                "Registration Link": url(f"https://example.com/register/{i}" if i % 2 else None),
+                "Info Link": url(None),
+            }))
+
+            exec_id = page_id("executive", i)
+            candid = None
+            if images:
+                candid = f"{exec_id}.jpg"
+                self.files[candid] = sources[(i + 3) % IMAGE_VARIETY]
+            self.executives.append(page(exec_id, EXECUTIVES_DB_ID, edited, {
+                "Name": title(f"Executive {i}"),
+                "Pronouns": rich_text("they/them"),
+                "Bio": rich_text(f"Executive {i} studies computer science."),
+                "LinkedIn": url(f"https://linkedin.com/in/exec{i}"),
+                "Instagram": url(None),
+                "Github": url(f"https://github.com/exec{i}" if i % 3 == 0 else None),
+                "Website": url(None),
+                "Candid": files(candid, f"{files_url}/{candid}"),
+                "Role": relation([self.roles[i % len(self.roles)]["id"]]),
+                "Prior Roles": relation([]),
+                "Term Start": select(SEMESTERS[i % len(SEMESTERS)]),
+                "Last Term": select(None),
+                "Status": select("Active" if i % 4 else "Retired"),
+            }))
+
+    def databases(self) -> dict[str, list[dict]]:
+        return {
+            EVENTS_DB_ID: self.events,
+            RECURRING_EVENTS_LIST_DB_ID: self.recurring,
+            EXECUTIVES_DB_ID: self.executives,
+            ROLES_DB_ID: self.roles,
+        }
+
+    # edits the text of one page, as if someone fixed a typo in notion
+    def edit_one(self, pages:list[dict]) -> dict:
+        self.edits += 1
+        edited = pages[len(pages) // 2]
+        edited["last_edited_time"] = notion_time(datetime.now(timezone.utc) + timedelta(minutes=self.edits))
+        name = "Title" if "Title" in edited["properties"] else "Name"
+        edited["properties"][name] = title(f"Edited page {self.edits}")
+        return edited
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import time
+
+from pydantic import BaseModel
+
+from sdk.export_store import CHECK_INTERVAL
+from sdk.helpers import write_file_atomic
+from sdk.models import ChangeLog, ChangeLogEntry
+
+logger = logging.getLogger("lcsc.changes")
+
+# CHANGE LOG
+# the backend appends the ids that changed every time it writes an export,
+# and the api answers /changes?since= from it instead of sending the whole export
+
+CHANGE_LOG_SIZE = 1000 # entries kept, clients further behind than this have to fetch everything again
+
+# returns (ids of records that are new or different, ids of records that are gone)
+def diff_records(old:list[BaseModel], new:list[BaseModel]) -> tuple[list[str], list[str]]:
+    old_by_id = {r.id: r for r in old}
+    new_ids = set(r.id for r in new)
+
+    changed = [r.id for r in new if old_by_id.get(r.id) != r]
+    removed = [id for id in old_by_id if id not in new_ids]
+    return changed, removed
+
+def load_change_log(path:str) -> ChangeLog:
+    try:
+        with open(path, "r") as fi:
+            return ChangeLog.model_validate_json(fi.read())
+    except FileNotFoundError:
+        return ChangeLog()
+    except Exception as e:
+        logger.error(f"Failed to read change log {path}, starting a new one: {e}")
+        return ChangeLog()
+
+# adds a new version to the change log and returns it
+# export_version is the version of the export being replaced, in case the log was lost or is behind it
+def record_changes(path:str, changed:list[str], removed:list[str], export_version:int = 0, size:int = CHANGE_LOG_SIZE) -> int:
+    log = load_change_log(path)
+
+    if log.version < export_version:
+        # the log doesn't cover the export clients may have, so nothing before it can be answered
+        log = ChangeLog(version=export_version, oldest_version=export_version)
+
+    version = log.version + 1
+    log.entries += [ChangeLogEntry(version=version, id=id) for id in changed]
+    log.entries += [ChangeLogEntry(version=version, id=id, deleted=True) for id in removed]
+    log.version = version
+
+    # drop whole versions from the front until the log fits
+    if len(log.entries) > size:
+        cutoff = log.entries[len(log.entries) - size - 1].version
+        log.entries = [e for e in log.entries if e.version > cutoff]
+        log.oldest_version = cutoff
+
+    write_file_atomic(path, log.model_dump_json().encode("utf-8"))
+    return version
+
+# keeps the change log parsed in memory in the api, reloading it when the backend replaces the file
+class ChangeLogReader:
+    def __init__(self, path:str, check_interval:float = CHECK_INTERVAL) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._log:ChangeLog | None = None
+        self._file_id:tuple | None = None
+        self._last_check = 0.0
+
+    # for async code: the file is checked (and reread, on a worker thread) at most every check_interval seconds,
+    # or straight away if the cached log is older than the export being served. the backend writes the log before the export,
+    # so by then the newer log is already on disk
+    async def get_async(self, version:int) -> ChangeLog | None:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval or self._log == None or self._log.version < version:
+            self._last_check = now
+            await asyncio.to_thread(self.get)
+        return self._log
+
+    def get(self) -> ChangeLog | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if file_id != self._file_id:
+            try:
+                with open(self.path, "r") as fi:
+                    self._log = ChangeLog.model_validate_json(fi.read())
+                self._file_id = file_id
+            except Exception as e:
+                logger.error(f"Failed to load change log {self.path}, keeping the previous version: {e}")
+        return self._log
+
+# whether the log still has every change between `since` and `version` (the export being served)
+def covers(log:ChangeLog | None, since:int, version:int) -> bool:
+    return log != None and log.oldest_version <= since <= version
+
+# the last thing that happened to each id after `since`, up to and including `until`
+# returns (ids that were added / edited, ids that were deleted)
+def changes_since(log:ChangeLog, since:int, until:int) -> tuple[list[str], list[str]]:
+    latest:dict[str, bool] = {} # id : deleted
+    for entry in log.entries:
+        if since < entry.version <= until:
+            latest.pop(entry.id, None) # so ids end up ordered by when they last changed
+            latest[entry.id] = entry.deleted
+
+    upserted = [id for id, deleted in latest.items() if not deleted]
+    deleted = [id for id, deleted in latest.items() if deleted]
+    return upserted, deleted
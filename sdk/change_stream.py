@@ -0,0 +1,64 @@
+import asyncio
+import json
+from typing import AsyncIterator, Awaitable, Callable
+
+from sdk.export_store import ExportSnapshot, ExportStore, diff_versions
+
+# SERVER-SENT EVENTS
+# lets clients keep one idle connection open and hear about new exports, instead of polling /events/all
+
+STREAM_CHECK_INTERVAL = 1.0 # seconds between checks for a new export (the store only stats the file this often anyway)
+STREAM_HEARTBEAT = 15.0     # seconds, comments sent while idle so proxies don't close the connection
+STREAM_RETRY = 5000         # milliseconds clients should wait before reconnecting
+
+def format_sse(event:str, data:dict, id:str | None = None) -> str:
+    message = f"event: {event}\n"
+    if id != None:
+        message += f"id: {id}\n"
+    return message + f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+# changes between the snapshot a client last saw and the current one
+# the store already worked them out if the client saw the previous snapshot, which is nearly always
+def snapshot_changes(seen:ExportSnapshot, current:ExportSnapshot) -> tuple[list[str], list[str]]:
+    if current.changes != None and current.changes[0] == seen.etag:
+        return current.changes[1], current.changes[2]
+    return diff_versions(seen.versions, current.versions)
+
+# yields sse messages for one client
+# a "version" event with the current etag first, then a "change" event (new etag and changed / removed ids) every time the export is replaced
+# last_event_id is the etag a reconnecting client saw last, so it isn't told about a version it already has
+async def export_events(store:ExportStore, is_disconnected:Callable[[], Awaitable[bool]], last_event_id:str | None = None,
+                        check_interval:float = STREAM_CHECK_INTERVAL, heartbeat:float = STREAM_HEARTBEAT) -> AsyncIterator[str]:
+    yield f"retry: {STREAM_RETRY}\n\n"
+
+    seen = await store.get_async()
+    if seen != None and seen.etag != last_event_id:
+        yield format_sse("version", {"etag": seen.etag}, id=seen.etag)
+
+    idle = 0.0
+    while not await is_disconnected():
+        await asyncio.sleep(check_interval)
+        idle += check_interval
+
+        current = await store.get_async()
+        if current == None or current is seen:
+            if idle >= heartbeat:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            continue
+        if seen != None and current.etag == seen.etag:
+            # rewritten without any changes
+            seen = current
+            continue
+
+        if seen == None:
+            # the first export since the client connected, everything in it is new
+            changed, removed = list(current.versions), []
+            previous = None
+        else:
+            changed, removed = snapshot_changes(seen, current)
+            previous = seen.etag
+
+        yield format_sse("change", {"etag": current.etag, "previous_etag": previous, "changed": changed, "removed": removed}, id=current.etag)
+        seen = current
+        idle = 0.0
@@ -0,0 +1,61 @@
+import gzip
+import logging
+import os
+
+try:
+    import brotli
+except ImportError: # brotli is optional, without it only .gz copies are written
+    brotli = None
+
+logger = logging.getLogger("lcsc.compression")
+
+# encodings that precompressed copies are written for, in order of preference
+# ie events_export.json -> events_export.json.br, events_export.json.gz
+PRECOMPRESSED_ENCODINGS = {
+    "br": ".br",
+    "gzip": ".gz",
+}
+
+def compress(data:bytes, encoding:str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    raise Exception(f"Unknown encoding {encoding}")
+
+def available_encodings() -> list[str]:
+    return [e for e in PRECOMPRESSED_ENCODINGS if e != "br" or brotli != None]
+
+# writes compressed copies of data next to path, call this after the file at path itself has been written
+# (the api only uses a copy if it matches the original)
+def write_precompressed(path:str, data:bytes) -> None:
+    for encoding in available_encodings():
+        compressed_path = path + PRECOMPRESSED_ENCODINGS[encoding]
+        temp_path = f"{compressed_path}.tmp"
+        with open(temp_path, "wb") as fi:
+            fi.write(compress(data, encoding))
+        os.replace(temp_path, compressed_path)
+
+# parses an Accept-Encoding header into the encodings the client accepts (ignoring any with q=0)
+def accepted_encodings(accept_encoding:str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name)
+    return accepted
+
+# returns the most preferred of the available encodings that the client accepts, or None for an uncompressed body
+def pick_encoding(accept_encoding:str, available) -> str | None:
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in PRECOMPRESSED_ENCODINGS:
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
@@ -0,0 +1,217 @@
+import asyncio
+import gzip
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Any, Callable, Generic, TypeVar
+
+from pydantic import BaseModel
+
+from sdk.compression import PRECOMPRESSED_ENCODINGS, available_encodings, brotli
+from sdk.http_cache import iso_to_http_date, make_etag
+from sdk.metrics import EXPORT_RELOADS
+
+logger = logging.getLogger("lcsc.store")
+
+CHECK_INTERVAL = 1.0 # seconds between checks for a new export file
+
+T = TypeVar("T", bound=BaseModel)
+
+# one parsed version of an export file
+# never modified after it is created, a new file means a new snapshot
+class ExportSnapshot(Generic[T]):
+    def __init__(self, container:T, body:bytes, encoded:dict[str, bytes], file_id:tuple, indexes:Any = None, versions:dict[str, str] | None = None) -> None:
+        self.container = container  # the validated export
+        self.indexes = indexes      # whatever the store's build_indexes made from the container
+        self.body = body            # the export exactly as the backend wrote it
+        self.encoded = encoded      # encoding : compressed body
+        self.file_id = file_id      # (inode, mtime, size) of the file this was loaded from
+        self.versions = versions or {} # record id : hash of the record, for working out what changed between snapshots
+        
+        # (etag of the snapshot this replaced, ids changed or added since then, ids removed since then)
+        # set by the store when this snapshot replaces an older one
+        self.changes:tuple[str, list[str], list[str]] | None = None
+        
+        # the etag only depends on the data, so it stays the same for as long as nothing in notion changes
+        # last_checked is when the backend wrote the export (it's only rewritten when something changed), which also covers changes
+        # no page edit explains (deleted pages, renamed roles, images that failed) unlike the newest last_edited_time
+        self.etag = make_etag(container.model_dump_json(exclude={"metadata": {"last_checked"}}).encode("utf-8"))
+        self.last_modified = iso_to_http_date(container.metadata.last_checked)
+
+# returns (ids that are new or were edited, ids that are gone) between two snapshots' versions
+def diff_versions(old:dict[str, str], new:dict[str, str]) -> tuple[list[str], list[str]]:
+    changed = [id for id, edited in new.items() if old.get(id) != edited]
+    removed = [id for id in old if id not in new]
+    return changed, removed
+
+
+def decompress(data:bytes, encoding:str) -> bytes:
+    if encoding == "br":
+        return brotli.decompress(data)
+    return gzip.decompress(data)
+
+def compress_fast(data:bytes, encoding:str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+def file_identity(stat:os.stat_result) -> tuple:
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+# reuse the backend's precompressed copy if it matches what we loaded, otherwise compress it ourselves
+def load_precompressed(path:str, body:bytes, encoding:str) -> bytes:
+    try:
+        with open(path + PRECOMPRESSED_ENCODINGS[encoding], "rb") as fi:
+            data = fi.read()
+        if decompress(data, encoding) == body:
+            return data
+    except Exception:
+        pass
+    return compress_fast(body, encoding)
+
+
+# keeps the latest export file parsed in memory and reloads it when the backend replaces the file
+# requests only pay for a stat() every CHECK_INTERVAL seconds instead of reading and parsing the file
+# build_indexes is called once per loaded export, so routes can filter without scanning the whole export
+# records returns the export's list of records (each with an id), so changes between versions can be found
+class ExportStore(Generic[T]):
+    def __init__(self, path:str, model:type[T], build_indexes:Callable[[T], Any] | None = None, check_interval:float = CHECK_INTERVAL,
+                 records:Callable[[T], list] | None = None) -> None:
+        self.path = path
+        self.model = model
+        self.build_indexes = build_indexes
+        self.check_interval = check_interval
+        self.records = records
+
+        self._snapshot:ExportSnapshot[T] | None = None
+        self._failed_id:tuple | None = None # identity of the last file that couldn't be loaded, so it isn't retried every check
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> ExportSnapshot[T] | None:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self._refresh()
+        return self._snapshot
+
+    # for async code: checking the file is a stat on the event loop, but loading a new export (reading, validating,
+    # indexing and compressing it) runs on a worker thread so requests already in flight aren't held up by it
+    async def get_async(self) -> ExportSnapshot[T] | None:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self._changed():
+                await asyncio.to_thread(self._refresh)
+        return self._snapshot
+
+    # whether the file on disk is one that hasn't been loaded (or tried) yet
+    def _changed(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+
+        file_id = file_identity(stat)
+        return file_id != self._failed_id and (self._snapshot == None or self._snapshot.file_id != file_id)
+
+    def _refresh(self) -> None:
+        if not self._changed():
+            return
+        file_id = file_identity(os.stat(self.path))
+
+        with self._lock:
+            if self._snapshot != None and self._snapshot.file_id == file_id:
+                return
+            snapshot = self._load()
+            EXPORT_RELOADS.inc(export=os.path.basename(self.path), result="failed" if snapshot == None else "ok")
+            if snapshot == None:
+                self._failed_id = file_id
+            else:
+                previous = self._snapshot
+                if previous != None:
+                    changed, removed = diff_versions(previous.versions, snapshot.versions)
+                    snapshot.changes = (previous.etag, changed, removed)
+                self._snapshot = snapshot # single assignment, so readers see either the old or the new snapshot
+
+    def _load(self) -> ExportSnapshot[T] | None:
+        try:
+            with open(self.path, "rb") as fi:
+                stat = os.fstat(fi.fileno())
+                body = fi.read()
+            container = self.model.model_validate_json(body)
+            indexes = self.build_indexes(container) if self.build_indexes else None
+            # hashed rather than compared by last_edited_time, since ie renaming a role changes executives whose page wasn't edited
+            versions = {r.id: make_etag(r.model_dump_json().encode("utf-8")) for r in self.records(container)} if self.records else None
+        except Exception as e:
+            # probably caught the file halfway through being written, keep serving the last good version
+            logger.error(f"Failed to load {self.path}, keeping the previous version: {e}")
+            return None
+
+        encoded = {}
+        for encoding in available_encodings():
+            encoded[encoding] = self._load_precompressed(body, encoding)
+
+        return ExportSnapshot(container, body, encoded, file_identity(stat), indexes, versions)
+
+    def _load_precompressed(self, body:bytes, encoding:str) -> bytes:
+        return load_precompressed(self.path, body, encoding)
+
+
+# a file the backend renders as is (ie the calendar feed), kept in memory with its compressed copies
+class StaticFile:
+    def __init__(self, body:bytes, encoded:dict[str, bytes], file_id:tuple, mtime:float) -> None:
+        self.body = body
+        self.encoded = encoded
+        self.file_id = file_id
+        self.etag = make_etag(body)
+        self.last_modified = format_datetime(datetime.fromtimestamp(mtime, timezone.utc), usegmt=True)
+
+# like ExportStore, but for files that are served exactly as they are on disk
+class StaticFileStore:
+    def __init__(self, path:str, check_interval:float = CHECK_INTERVAL) -> None:
+        self.path = path
+        self.check_interval = check_interval
+
+        self._file:StaticFile | None = None
+        self._last_check = 0.0
+
+    def get(self) -> StaticFile | None:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self._refresh()
+        return self._file
+
+    # like ExportStore.get_async, compressing a new version runs on a worker thread
+    async def get_async(self) -> StaticFile | None:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self._changed():
+                await asyncio.to_thread(self._refresh)
+        return self._file
+
+    def _changed(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self._file != None
+        return self._file == None or self._file.file_id != file_identity(stat)
+
+    def _refresh(self) -> None:
+        try:
+            with open(self.path, "rb") as fi:
+                stat = os.fstat(fi.fileno())
+                if self._file != None and self._file.file_id == file_identity(stat):
+                    return
+                body = fi.read()
+        except FileNotFoundError:
+            self._file = None
+            return
+
+        encoded = {encoding: load_precompressed(self.path, body, encoding) for encoding in available_encodings()}
+        self._file = StaticFile(body, encoded, file_identity(stat), stat.st_mtime)
@@ -1,170 +1,220 @@
-from datetime import datetime, timezone
+import asyncio
 from os import environ
 from os.path import exists
-import requests
 import logging
-from dotenv import load_dotenv
 
-from notion_client import Client
-from pydantic import BaseModel
 from sdk.helpers import (
-    attempt_compress_image,
     create_human_readable_date,
     image_filename_to_url,
-    propTextExtractor
+    current_iso_timestamp,
+    write_export,
+    write_sync_status
 )
+from sdk.images import (
+    ImageJob,
+    image_unchanged,
+    is_compressible,
+    process_images
+)
+from sdk.lazy_images import image_mode, update_image_sources
+from sdk.change_log import diff_records, record_changes
+from sdk.ical import update_calendar
+from sdk.metrics import PAGES_CHANGED, PAGES_SCANNED
+from sdk.notion_query import get_notion_client, query_database, retrieve_pages
 from sdk.models import LCSCEvent, EventPageMetadata, LCSCEventContainer
+from sdk.relations import RelatedDatabase
+from sdk.schema import Column, Schema
+from sdk.store import get_store
 
 logger = logging.getLogger("lcsc.events")
 
 EVENTS_DB_ID = "0260157bf43c4c96aefec1764d428030"
 RECURRING_EVENTS_LIST_DB_ID = "47bac84297d84de781b875be50020ef0"
 
-
-
-
-def updateDataFromNotion(writeLocation="data/") -> bool:
+# notion column -> field, renaming a column in notion only needs a change here
+EVENT_SCHEMA = Schema("events", [
+    Column("Title", "event_name"),
+    Column("Semester", "semester"),
+    Column("Event Date", "event_date", types=("date",)),
+    Column("Location", "location"),
+    Column("Thumbnail", "thumbnail", types=("files",)),
+    Column("Registration Link", "registration_link"),
+    Column("Info Link", "information_link"),
+])
+
+RECURRING_EVENT_SCHEMA = Schema("recurring events", [
+    Column("Title", "event_name"),
+    Column("Frequency", "frequency"),
+])
+
+# recurring event series, page_id : {"event_name", "frequency"}
+RECURRING_EVENTS = RelatedDatabase("recurring_events", RECURRING_EVENTS_LIST_DB_ID, RECURRING_EVENT_SCHEMA)
+
+
+# calendar problems shouldn't stop the export from being saved
+def try_update_calendar(writeLocation:str, events:list[LCSCEvent], recurring_events:dict[str, dict]) -> None:
+    try:
+        update_calendar(writeLocation, events, recurring_events)
+    except Exception as e:
+        logger.exception(f"Failed to update the events calendar: {e}")
+
+# when full_sync is False and local data exists, only pages edited since the last recorded edit are pulled from Notion
+# a full sync is needed to notice deleted pages, so the caller should request one every so often
+# page_ids limits the sync to just those pages (ie the ones a webhook reported), including noticing if they were deleted
+async def updateDataFromNotion(writeLocation="data/", full_sync:bool = True, page_ids:list[str] | None = None) -> bool:
     if "NOTION_API_TOKEN" not in environ:
         raise Exception("Please provide a Notion integration token.")
 
     # Load local data
-    local_data: LCSCEventContainer | None = None
-    if exists(f"{writeLocation}/json/events_export.json"):
-        with open(f"{writeLocation}/json/events_export.json", "r") as fi:
-            data = fi.read()
-            if data:
-                try:
-                    local_data = LCSCEventContainer.model_validate_json(data)
-                except Exception as e:
-                    logger.error(f"Failed to read existing local events data: {e}")
-
-    notion = Client(auth=environ.get("NOTION_API_TOKEN"))
-
-    event_pages = notion.databases.query(EVENTS_DB_ID)
+    # the store, exports and calendar are read and written on worker threads, so the other database's sync isn't held up meanwhile
+    store = get_store(writeLocation)
+    local_data:LCSCEventContainer | None = await asyncio.to_thread(store.load_events)
+
+    notion = get_notion_client()
+    await EVENT_SCHEMA.prepare(notion, EVENTS_DB_ID)
+
+    incremental = local_data != None and not full_sync and local_data.metadata.events_last_edited != ""
+    
+    # the pages we were asked about are all that needs checking, everything else is kept as is
+    removed_ids:set[str] = set()
+    recurring_changed = False
+    targeted = bool(page_ids) and local_data != None
+    if targeted:
+        incremental = True
+        event_pages, removed_ids = await retrieve_pages(notion, EVENTS_DB_ID, page_ids)
+    else:
+        # recurring series only affect the calendar, so they're checked on their own
+        recurring_changed = await RECURRING_EVENTS.refresh(notion, writeLocation, full_sync=not incremental)
+        since = local_data.metadata.events_last_edited if incremental else None
+        event_pages = [page async for page in query_database(notion, EVENTS_DB_ID, last_edited_after=since)]
+    
+    PAGES_SCANNED.inc(len(event_pages), database="events")
     
     update_count = 0
     events_latest_update = ""
     if local_data:
         events_latest_update = local_data.metadata.events_last_edited
     
+    # index the local events once, so checking a page is a single lookup
+    local_events:dict[str, LCSCEvent] = {}
     if local_data:
-        for page in event_pages["results"]:
-            p = page["properties"]
-            stale_data = False
-            
-            for event in local_data.events:
-                if event.id == page["id"]:
-                    found = True
-                    if event.last_edited_time == page["last_edited_time"]:
-                        stale_data = True
-                        break
-
-            if not stale_data:
-                update_count += 1
-                if page["last_edited_time"] > events_latest_update:
-                    events_latest_update = page["last_edited_time"]
+        local_events = {e.id: e for e in local_data.events}
+    
+    changed_pages = [
+        page for page in event_pages
+        if page["id"] not in local_events or local_events[page["id"]].last_edited_time != page["last_edited_time"]
+    ]
+    
+    PAGES_CHANGED.inc(len(changed_pages), database="events")
+    
+    # with lazy images the backend only records where each page's image is, the api downloads it when it's first requested
+    # every page notion returned is recorded (not just changed ones), so syncing a single page hands the api a fresh url
+    lazy_images = image_mode() == "lazy"
+    image_manifest = await asyncio.to_thread(store.load_manifest, "event_images")
+    if lazy_images:
+        deleted_ids = removed_ids if incremental else set(local_events) - set(page["id"] for page in event_pages)
+        await asyncio.to_thread(
+            update_image_sources,
+            writeLocation,
+            "event_images",
+            {page["id"]: EVENT_SCHEMA.extract_field(page, "thumbnail") for page in event_pages},
+            deleted_ids,
+            image_manifest,
+        )
+    
+    if local_data:
+        update_count = len(changed_pages) + len(removed_ids & set(local_events))
         
-        if len(local_data.events) != len(event_pages["results"]):
+        # deleted pages can only be noticed when we have the whole database
+        if not incremental and set(local_events) != set(page["id"] for page in event_pages):
             update_count += 1
         
         # if there are no new updates then we should save the time that we last checked and then exit.
+        # (in the status file, so the export itself is left alone)
         if update_count == 0:
-            current_time = datetime.now(timezone.utc)
-            iso_timestamp = current_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
-            local_data.metadata.last_checked = iso_timestamp
-            with open(f"{writeLocation}/json/events_export.json", "w") as fi:
-                fi.write(local_data.model_dump_json(indent=4))
+            if recurring_changed:
+                recurring_events = await RECURRING_EVENTS.rows(notion, writeLocation)
+                await asyncio.to_thread(try_update_calendar, writeLocation, local_data.events, recurring_events)
+            await asyncio.to_thread(write_sync_status, f"{writeLocation}/json/events_status.json", changed=False)
             return False
 
-    # Extract recurring events
-    recurring_pages = notion.databases.query(RECURRING_EVENTS_LIST_DB_ID)
-    
-    recurring_events = {}
-    for page in recurring_pages["results"]:
-        recurring_events[page["id"]] = {
-            "event_name": propTextExtractor(page["properties"]["Title"]),
-            "frequency": propTextExtractor(page["properties"]["Frequency"]),
-        }
-
     # Extract event data
     events = []
     event_images = {}
+    image_jobs:dict[str, ImageJob] = {} # page_id : job, downloaded together once every page is parsed
     
-    
-
-    for page in event_pages["results"]:
-        p = page["properties"]
+    # events whose page hasn't changed are reused as is, only changed pages are extracted again
+    # (an incremental sync only returns changed pages, so every other local event is kept,
+    # a full sync returns every page, so local events without a page have been deleted)
+    changed_ids = set(page["id"] for page in changed_pages)
+    returned_ids = set(page["id"] for page in event_pages)
+    for e in local_events.values():
+        if e.id not in changed_ids and e.id not in removed_ids and (incremental or e.id in returned_ids):
+            events.append(e)
+
+    for page in changed_pages:
+        row = EVENT_SCHEMA.extract(page)
 
         page_last_updated = page["last_edited_time"]
         page_id = page["id"]
         
-        stale_data = False
-        if local_data:
-            for event in local_data.events:
-                if event.id == page["id"]:  # Compare with page_id
-                    if page_last_updated == event.last_edited_time:
-                        stale_data = True
-
-        # Process image if present
+        # only a query of the database moves the watermark the next incremental sync starts from,
+        # a targeted sync would skip any earlier edit whose webhook never arrived
+        if not targeted and page_last_updated > events_latest_update:
+            events_latest_update = page_last_updated
         
-        # if data is stale then don't redownload the image
-        # yes this means that we aren't checking that the image specifically was updated, just the page
-        # but i don't care enough to architect it properly at this point
-        if p["Thumbnail"]["files"] and stale_data:
-            file_name = p["Thumbnail"]["files"][0]["name"]
+        # Process image if present
+        # the manifest tells us whether the image itself changed, so editing the text of an event doesn't redownload its image
+        if row["thumbnail"] != None:
+            file_name = row["thumbnail"]["name"]
             file_extension = file_name.split(".")[-1].lower()
-            event_images[page_id] = image_filename_to_url("events/images", f"{page_id}.{file_extension}")
             
-        elif p["Thumbnail"]["files"]:
-            file_name = p["Thumbnail"]["files"][0]["name"]
-            file_url = (
-                p["Thumbnail"]["files"][0]["file"]["url"]
-                if "file" in p["Thumbnail"]["files"][0]
-                else p["Thumbnail"]["files"][0]["external"]["url"]
+            job = ImageJob(
+                url=row["thumbnail"]["url"],
+                path=f"{writeLocation}/event_images/{page_id}.{file_extension}",
+                label=row["event_name"],
+                notion_name=file_name,
+                compress=is_compressible(file_extension),
             )
-            file_extension = file_name.split(".")[-1].lower()
             
-            known_filetype = True
-            if file_extension not in ["webp", "jpg", "png", "jpeg", "gif"]:
-                known_filetype = False
-                logger.warn(f"Saving image with unsupported image filetype for {propTextExtractor(p['Title'])} and skipping compression at {page_id}.{file_extension}")
-
-            file_path = f"{writeLocation}/event_images/{page_id}.{file_extension}"
-            with open(file_path, "wb") as fi:
-                r = requests.get(file_url)
-                fi.write(r.content)
-                event_images[page_id] = image_filename_to_url("events/images", f"{page_id}.{file_extension}")
-                
-            try:
-                if known_filetype:
-                    attempt_compress_image(file_path)
-            except Exception as e:
-                logger.warn(f"Failed to compress image for {propTextExtractor(p['Title'])} ({page_id}.{file_extension}) {e}")
+            if not lazy_images and not image_unchanged(image_manifest, job):
+                if not job.compress:
+                    logger.warning(f"Saving image with unsupported image filetype for {job.label} and skipping compression at {page_id}.{file_extension}")
+                image_jobs[page_id] = job
+            event_images[page_id] = image_filename_to_url("events/images", f"{page_id}.{file_extension}")
             
         else:
             event_images[page_id] = None
 
         # Extract date and create the event object
-        start, end = propTextExtractor(p["Event Date"])
+        start, end = row["event_date"]
         events.append(
             LCSCEvent(
-                event_name=propTextExtractor(p["Title"]),
+                event_name=row["event_name"],
                 event_date=create_human_readable_date(start, end),
-                semester=propTextExtractor(p["Semester"]),
+                semester=row["semester"],
                 event_start_date=start,
                 event_end_date=end,
-                location=propTextExtractor(p["Location"]),
+                location=row["location"],
                 thumbnail=event_images[page_id],
-                registration_link=propTextExtractor(p["Registration Link"]),
-                information_link=propTextExtractor(p["Info Link"]),
+                registration_link=row["registration_link"],
+                information_link=row["information_link"],
                 last_edited_time=page_last_updated,
                 id=page_id,
             )
         )
 
+    # download and compress all new images at once
+    failed_jobs = await process_images(list(image_jobs.values()), image_manifest)
+    if image_jobs:
+        await asyncio.to_thread(store.save_manifest, "event_images", image_manifest)
+    failed_ids = set(page_id for page_id, job in image_jobs.items() if job in failed_jobs)
+    for e in events:
+        if e.id in failed_ids and not exists(image_jobs[e.id].path):
+            e.thumbnail = None
+
     # Write data to file
-    current_time = datetime.now(timezone.utc)
-    iso_timestamp = current_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    iso_timestamp = current_iso_timestamp()
 
     metadata = EventPageMetadata(
         events_last_edited=events_latest_update,
@@ -176,8 +226,21 @@ def updateDataFromNotion(writeLocation="data/") -> bool:
         events=sorted(events, key=lambda e: e.event_start_date or "", reverse=True)
     )
     
-    with open(f"{writeLocation}/json/events_export.json", "w", encoding="utf-8") as fi:
-        fi.write(container.model_dump_json(indent=4))
+    # log what changed before writing the export, so the api never serves an export newer than its change log
+    changed, removed = diff_records(local_data.events if local_data else [], container.events)
+    container.metadata.version = await asyncio.to_thread(
+        record_changes,
+        f"{writeLocation}/json/events_changes.json",
+        changed,
+        removed,
+        export_version=local_data.metadata.version if local_data else 0,
+    )
+    
+    await asyncio.to_thread(store.save_events, container, changed, removed)
+    await asyncio.to_thread(write_export, f"{writeLocation}/json/events_export.json", container.model_dump_json(indent=4))
+    await asyncio.to_thread(write_sync_status, f"{writeLocation}/json/events_status.json", changed=True)
+    recurring_events = await RECURRING_EVENTS.rows(notion, writeLocation)
+    await asyncio.to_thread(try_update_calendar, writeLocation, container.events, recurring_events)
 
 
     if update_count > 0:
@@ -188,4 +251,4 @@ def updateDataFromNotion(writeLocation="data/") -> bool:
 
 
 if __name__ == "__main__":
-    updateDataFromNotion()
+    asyncio.run(updateDataFromNotion())
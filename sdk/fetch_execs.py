@@ -1,19 +1,21 @@
-from datetime import datetime
-import os
+import asyncio
 from dotenv import load_dotenv
 load_dotenv()
 import logging
 
-from datetime import datetime, timezone
-
 from os import environ
 from os.path import exists
-import json
-import requests
 
-from notion_client import Client
 
-from sdk.helpers import attempt_compress_image, create_human_readable_date, image_filename_to_url, propTextExtractor, multiplePropTextExtractor
+from sdk.helpers import current_iso_timestamp, image_filename_to_url, write_export, write_sync_status
+from sdk.lazy_images import image_mode, update_image_sources
+from sdk.images import ImageJob, image_unchanged, is_compressible, process_images
+from sdk.change_log import diff_records, record_changes
+from sdk.metrics import PAGES_CHANGED, PAGES_SCANNED
+from sdk.notion_query import get_notion_client, query_database, retrieve_pages
+from sdk.relations import RelatedDatabase
+from sdk.schema import Column, Schema
+from sdk.store import get_store
 
 logger = logging.getLogger("lcsc.execs")
 
@@ -22,162 +24,191 @@ from sdk.models import LCSCExecutive, LCSCExecutiveContainer, ExecPageMetadata
 EXECUTIVES_DB_ID = "23dbd8f8f9d84739aaf9c1f98c7cc842"
 ROLES_DB_ID = "64911354b5e24d639c00c3d39e54276c"
 
-# class so that if we need to change a table column in the notion db it doesn't take forever
-class t:
-    linkedin = "LinkedIn"
-    instagram = "Instagram"
-    github = "Github"
-    website = "Website"
+# notion column -> field, renaming a column in notion only needs a change here
+EXECUTIVE_SCHEMA = Schema("executives", [
+    Column("Name", "name"),
+    Column("Pronouns", "pronouns"),
+    Column("Bio", "bio"),
+    Column("LinkedIn", "linkedin"),
+    Column("Instagram", "instagram"),
+    Column("Github", "github"),
+    Column("Website", "website"),
+    Column("Candid", "profile_picture", types=("files",)),
+    Column("Role", "roles", types=("relation",)),
+    Column("Prior Roles", "prior_roles", types=("relation",)),
+    Column("Term Start", "first_term"),
+    Column("Last Term", "last_term"),
+    Column("Status", "current_status"),
+])
 
-    
-    
+ROLE_SCHEMA = Schema("roles", [
+    Column("Name", "name"),
+])
+
+# fields that end up in social_media_links when they're filled in
+SOCIAL_MEDIA_FIELDS = ["linkedin", "instagram", "github", "website"]
+
+# executives are listed by the highest ranked of their roles, in this order
+ROLE_CATEGORIES = ["president", "vice president", "director", "other"]
+
+def role_category(role:dict) -> dict:
+    name = (role["name"] or "").lower()
+    if "vice" in name:
+        category = "vice president"
+    elif "president" in name:
+        category = "president"
+    elif "director" in name or "tech lead" in name:
+        category = "director"
+    else:
+        category = "other"
+    return {"category": category, "rank": ROLE_CATEGORIES.index(category)}
 
+ROLES = RelatedDatabase("roles", ROLES_DB_ID, ROLE_SCHEMA, derive=role_category)
 
-def updateDataFromNotion(writeLocation="data/") -> bool:
+# rank_by_name is role name : rank, directors are grouped by their role and everyone else by name
+def executive_sort_key(e:LCSCExecutive, rank_by_name:dict[str, int]) -> tuple[int, str, str]:
+    other = ROLE_CATEGORIES.index("other")
+    rank = min([rank_by_name.get(r, other) for r in e.roles], default=other)
+    group = e.roles[0] if rank == ROLE_CATEGORIES.index("director") else ""
+    return (rank, group, e.name or "")
+
+
+# when full_sync is False and local data exists, only pages edited since the last recorded edit are pulled from Notion
+# a full sync is needed to notice deleted pages, so the caller should request one every so often
+# page_ids limits the sync to just those pages (ie the ones a webhook reported), including noticing if they were deleted
+async def updateDataFromNotion(writeLocation="data/", full_sync:bool = True, page_ids:list[str] | None = None) -> bool:
     if "NOTION_API_TOKEN" not in environ:
         raise Exception("Please provide a Notion integration token.")
     
-    local_data:LCSCExecutiveContainer|None = None
-    if exists(f"{writeLocation}/json/execs_export.json"):
-        with open(f"{writeLocation}/json/execs_export.json", "r") as fi:
-            data = fi.read()
-            if data:
-                try:
-                    local_data = LCSCExecutiveContainer.model_validate_json(data)
-                except Exception as e:
-                    logger.error(f"Failed to read existing local executive data: {e}")
-    
-    
-    notion = Client(auth=environ.get("NOTION_API_TOKEN"))
-    
+    # the store and exports are read and written on worker threads, so the other database's sync isn't held up meanwhile
+    store = get_store(writeLocation)
+    local_data:LCSCExecutiveContainer | None = await asyncio.to_thread(store.load_executives)
 
-    exec_pages = notion.databases.query(EXECUTIVES_DB_ID)
+    notion = get_notion_client()
+    await EXECUTIVE_SCHEMA.prepare(notion, EXECUTIVES_DB_ID)
 
+    incremental = local_data != None and not full_sync and local_data.metadata.execs_last_edited != ""
+    
+    # the pages we were asked about are all that needs checking, everything else is kept as is
+    removed_ids:set[str] = set()
+    roles_changed = False
+    targeted = bool(page_ids) and local_data != None
+    if targeted:
+        incremental = True
+        exec_pages, removed_ids = await retrieve_pages(notion, EXECUTIVES_DB_ID, page_ids)
+    else:
+        # a renamed role changes every executive that has it, so they're all pulled and extracted again
+        roles_changed = await ROLES.refresh(notion, writeLocation, full_sync=not incremental) and local_data != None
+        if roles_changed:
+            incremental = False
+        since = local_data.metadata.execs_last_edited if incremental else None
+        exec_pages = [page async for page in query_database(notion, EXECUTIVES_DB_ID, last_edited_after=since)]
+    
+    PAGES_SCANNED.inc(len(exec_pages), database="executives")
 
 
     # extract only the information that we need:
     executives: list[LCSCExecutive] = []
     executive_images: dict[str, str] = {}    
+    image_jobs: dict[str, ImageJob] = {} # page_id : job, downloaded together once every page is parsed
+    image_manifest = await asyncio.to_thread(store.load_manifest, "exec_images")
     update_count = 0
     execs_latest_update = ""
     if local_data:
         execs_latest_update = local_data.metadata.execs_last_edited
     
     
+    # index the local executives once, so checking a page is a single lookup
+    local_executives:dict[str, LCSCExecutive] = {}
+    if local_data:
+        local_executives = {e.id: e for e in local_data.executives}
+    
     # look for changes.
+    changed_pages = [
+        page for page in exec_pages
+        if roles_changed or page["id"] not in local_executives or local_executives[page["id"]].last_edited_time != page["last_edited_time"]
+    ]
+    
+    PAGES_CHANGED.inc(len(changed_pages), database="executives")
+    
+    # with lazy images the backend only records where each page's image is, the api downloads it when it's first requested
+    # every page notion returned is recorded (not just changed ones), so syncing a single page hands the api a fresh url
+    lazy_images = image_mode() == "lazy"
+    if lazy_images:
+        deleted_ids = removed_ids if incremental else set(local_executives) - set(page["id"] for page in exec_pages)
+        await asyncio.to_thread(
+            update_image_sources,
+            writeLocation,
+            "exec_images",
+            {page["id"]: EXECUTIVE_SCHEMA.extract_field(page, "profile_picture") for page in exec_pages},
+            deleted_ids,
+            image_manifest,
+        )
+    
     if local_data:
-        for page in exec_pages["results"]:
-            p = page["properties"]
-            stale_data = False
-            
-            for exec in local_data.executives:
-                if exec.id == page["id"]:  # Compare with page_id
-                    found = True
-                    if page["last_edited_time"] == exec.last_edited_time:
-                        stale_data = True
-                        break
-            
-            if not stale_data:
-                update_count += 1
-                if page["last_edited_time"] > execs_latest_update:
-                    execs_latest_update = page["last_edited_time"]
+        update_count = len(changed_pages) + len(removed_ids & set(local_executives))
         
-        if len(local_data.executives) != len(exec_pages["results"]):
+        # deleted pages can only be noticed when we have the whole database
+        if not incremental and set(local_executives) != set(page["id"] for page in exec_pages):
             update_count += 1
         
         # if there are no new updates then we should save the time that we last checked and then exit.
+        # (in the status file, so the export itself is left alone)
         if update_count == 0:
-            current_time = datetime.now(timezone.utc)
-            iso_timestamp = current_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
-            local_data.metadata.last_checked = iso_timestamp
-            with open(f"{writeLocation}/json/execs_export.json", "w") as fi:
-                fi.write(local_data.model_dump_json(indent=4))
+            await asyncio.to_thread(write_sync_status, f"{writeLocation}/json/execs_status.json", changed=False)
             return False
     
     
     
-     # extract roles from roles database
-    role_pages = notion.databases.query(ROLES_DB_ID)
+    rows = EXECUTIVE_SCHEMA.extract_all(changed_pages)
     
-    notion_id_to_role_name:dict[str, str] = {} # {'92bb0840-1a89-4c45-b767-911819e8ef04': 'Vice President'} etc.
-    for role in role_pages["results"]:
-        p = role["properties"]
-        notion_id_to_role_name[role["id"]] = propTextExtractor(p["Name"])
+    # role ids : role, from the local lookup table (only queried again if a role we haven't seen is linked)
+    linked_roles = set(id for row in rows for id in row["roles"] + row["prior_roles"])
+    roles = await ROLES.resolve(notion, writeLocation, linked_roles)
     
-    for page in exec_pages["results"]:   
-        p = page["properties"]
+    # executives whose page hasn't changed are reused as is, only changed pages are extracted again
+    # (an incremental sync only returns changed pages, so every other local executive is kept,
+    # a full sync returns every page, so local executives without a page have been deleted)
+    changed_ids = set(page["id"] for page in changed_pages)
+    returned_ids = set(page["id"] for page in exec_pages)
+    for e in local_executives.values():
+        if e.id not in changed_ids and e.id not in removed_ids and (incremental or e.id in returned_ids):
+            executives.append(e)
+    
+    for page, row in zip(changed_pages, rows):
         page_last_edited_time = page["last_edited_time"]
         page_id = page["id"]
         
-        stale_data = False
-        if local_data:
-            for exec in local_data.executives:
-                if exec.id == page["id"]:  # Compare with page_id
-                    if page_last_edited_time == exec.last_edited_time:
-                        stale_data = True
-         
-        # special code is needed to handle relations in the db
-        current_roles = multiplePropTextExtractor(p["Role"])
-        past_roles = multiplePropTextExtractor(p["Prior Roles"])
+        # only a query of the database moves the watermark the next incremental sync starts from,
+        # a targeted sync would skip any earlier edit whose webhook never arrived
+        if not targeted and page_last_edited_time > execs_latest_update:
+            execs_latest_update = page_last_edited_time
         
         # map Notion id's to the actual name of the role
-        if current_roles != None:
-            current_roles = [notion_id_to_role_name[x] for x in current_roles]
-        else:
-            current_roles = []
-        
-        if past_roles != None:
-            past_roles = [notion_id_to_role_name[x] for x in past_roles]
-        else:
-            past_roles = []
+        current_roles = [roles[x]["name"] for x in row["roles"] if x in roles]
+        past_roles = [roles[x]["name"] for x in row["prior_roles"] if x in roles]
         
         # SOCIAL MEDA LINKS
-        # yes they are hardcoded...
-        sc_links = {}
-        if (propTextExtractor(p[t.linkedin]) != None):
-            sc_links["linkedin"] = propTextExtractor(p["LinkedIn"])
-        
-        if (propTextExtractor(p[t.instagram]) != None):
-            sc_links["instagram"] = propTextExtractor(p["Instagram"])
-            
-        if (propTextExtractor(p[t.github]) != None):
-            sc_links["github"] = propTextExtractor(p["Github"])
-        
-        if (propTextExtractor(p[t.website]) != None):
-            sc_links["website"] = propTextExtractor(p["Website"])
-            
-        
+        sc_links = {name: row[name] for name in SOCIAL_MEDIA_FIELDS if row[name] != None}
         
         # download the image for each exec, if available
-        # don't actually request the image if we know it hasn't changed
-        if p["Candid"]["files"] != [] and stale_data:
-            file_name = p["Candid"]["files"][0]["name"]
-            file_extension = file_name.split(".")[-1].lower()
-            executive_images[page_id] = image_filename_to_url("executives/images", f"{page_id}.{file_extension}")
+        # the manifest tells us whether the image itself changed, so editing a bio doesn't redownload the image
+        if row["profile_picture"] != None:
+            file_name:str = row["profile_picture"]["name"]
+            file_extension:str = file_name.split('.')[-1].lower()
             
+            job = ImageJob(
+                url=row["profile_picture"]["url"],
+                path=f"{writeLocation}/exec_images/{page_id}.{file_extension}",
+                label=row["name"],
+                notion_name=file_name,
+                compress=is_compressible(file_extension),
+            )
             
-        if (p["Candid"]["files"] != []):
-            file_name:str = p["Candid"]["files"][0]["name"]
-            file_url:str = p["Candid"]["files"][0]["file"]["url"]
-            file_extension:str = file_name.split('.')[-1]
-            
-            known_filetype = True
-            if file_extension.lower() not in ["webp", "jpg", "png", "jpeg", "gif"]:
-                known_filetype = False
-                logger.warn(f"Saving image with unsupported image filetype for {propTextExtractor(p['Name'])} and skipping compression at {page_id}.{file_extension}")
-            
-            
-            file_path = f"data/exec_images/{page_id}.{file_extension}"
-            with open(file_path, "wb") as fi:
-                r = requests.get(file_url)
-                fi.write(r.content)            
-            
-            try:
-                if known_filetype:
-                    attempt_compress_image(file_path)
-            except Exception as e:
-                logger.warn(f"Failed to compress image for {propTextExtractor(p['Name'])} ({page_id}.{file_extension}) {e}")
-            
+            if not lazy_images and not image_unchanged(image_manifest, job):
+                if not job.compress:
+                    logger.warning(f"Saving image with unsupported image filetype for {job.label} and skipping compression at {page_id}.{file_extension}")
+                image_jobs[page_id] = job
             
             executive_images[page_id] = image_filename_to_url("executives/images", f"{page_id}.{file_extension}")
         else:
@@ -185,18 +216,17 @@ def updateDataFromNotion(writeLocation="data/") -> bool:
         
         
         e = LCSCExecutive(
-            name =              propTextExtractor(p["Name"]),
-            # full_name =         propTextExtractor(p["Legal Name"]), # not needed.
-            pronouns =          propTextExtractor(p["Pronouns"]),
+            name =              row["name"],
+            pronouns =          row["pronouns"],
             profile_picture =   executive_images[page_id],
             social_media_links= sc_links,
-            bio =               propTextExtractor(p["Bio"]),
+            bio =               row["bio"],
             
             roles =             current_roles,
             prior_roles =       past_roles,
-            first_term =        propTextExtractor(p["Term Start"]),
-            last_term =         propTextExtractor(p["Last Term"]),
-            current_status =    propTextExtractor(p["Status"]),
+            first_term =        row["first_term"],
+            last_term =         row["last_term"],
+            current_status =    row["current_status"],
             
             id =                page_id,  # Use page_id as id
             last_edited_time =      page_last_edited_time
@@ -205,41 +235,20 @@ def updateDataFromNotion(writeLocation="data/") -> bool:
         executives.append(e)
         
     
-    # sort the output
-    presidents:list[LCSCExecutive] = [] # list in case we ever have a copresident
-    vps:list[LCSCExecutive] = []
-    directors:list[LCSCExecutive] = []
-    other:list[LCSCExecutive] = []
-    
+    # download and compress all new images at once
+    failed_jobs = await process_images(list(image_jobs.values()), image_manifest)
+    if image_jobs:
+        await asyncio.to_thread(store.save_manifest, "exec_images", image_manifest)
+    failed_ids = set(page_id for page_id, job in image_jobs.items() if job in failed_jobs)
     for e in executives:
-        
-        r = str(e.roles).lower()
-        
-        if "President" in str(e.roles) and "Vice" not in str(e.roles):
-            presidents.append(e)
-        
-        elif "Vice" in str(e.roles):
-            vps.append(e)
-        
-        elif "Director" in str(e.roles) or "Tech Lead" in str(e.roles):
-            directors.append(e)
-        
-        else:
-            other.append(e)
-            
-    presidents = sorted(presidents, key=lambda e: e.name)
-    vps = sorted(vps, key=lambda e: e.name)
-    directors = sorted(directors, key=lambda e: e.roles[0] + e.name)
-    other = sorted(other, key=lambda e: e.name)
-            
-    executives_ordered:list[LCSCExecutive] = []
-    executives_ordered.extend(presidents)
-    executives_ordered.extend(vps)
-    executives_ordered.extend(directors)
-    executives_ordered.extend(other)
+        if e.id in failed_ids and not exists(image_jobs[e.id].path):
+            e.profile_picture = None
     
-    current_time = datetime.now(timezone.utc)
-    iso_timestamp = current_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    # sort the output
+    rank_by_name = {role["name"]: role["rank"] for role in roles.values()}
+    executives_ordered = sorted(executives, key=lambda e: executive_sort_key(e, rank_by_name))
+    
+    iso_timestamp = current_iso_timestamp()
     
     metadata = ExecPageMetadata(
         execs_last_edited=execs_latest_update,
@@ -252,9 +261,19 @@ def updateDataFromNotion(writeLocation="data/") -> bool:
         executives = executives_ordered
     )
     
+    # log what changed before writing the export, so the api never serves an export newer than its change log
+    changed, removed = diff_records(local_data.executives if local_data else [], executives_ordered)
+    out.metadata.version = await asyncio.to_thread(
+        record_changes,
+        f"{writeLocation}/json/execs_changes.json",
+        changed,
+        removed,
+        export_version=local_data.metadata.version if local_data else 0,
+    )
     
-    with open(f"{writeLocation}/json/execs_export.json", "w") as fi:
-        fi.write(out.model_dump_json(indent=4))
+    await asyncio.to_thread(store.save_executives, out, changed, removed)
+    await asyncio.to_thread(write_export, f"{writeLocation}/json/execs_export.json", out.model_dump_json(indent=4))
+    await asyncio.to_thread(write_sync_status, f"{writeLocation}/json/execs_status.json", changed=True)
     
     if update_count > 0:
         logger.info(f"{update_count} executive updates saved locally.")
@@ -264,4 +283,4 @@ def updateDataFromNotion(writeLocation="data/") -> bool:
 
 
 if __name__ == "__main__":
-    updateDataFromNotion()
+    asyncio.run(updateDataFromNotion())
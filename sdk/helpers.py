@@ -1,52 +1,40 @@
-from datetime import datetime
-from os import makedirs
+from datetime import datetime, timezone
+from os import environ, makedirs
 import os
 from os.path import exists
-from PIL import Image
-Image.MAX_IMAGE_PIXELS = None # pil is paranoid and thinks large images are a zip bomb
+from PIL import Image, features
+from sdk.compression import write_precompressed
+from sdk.metrics import EXPORT_BYTES, EXPORT_WRITE_SECONDS
+from sdk.models import SyncStatus
 
-# Iterate over Notion pages and extract data
-def propTextExtractor(property:dict) -> str | None:
-    ptype = property["type"]
-    
-    if ptype == "title":
-        if property["title"] == None: return None
-        if property["title"] == []: return None
-        return property["title"][0]["plain_text"]
-    
-    if ptype == "rich_text":
-        if property["rich_text"] == []: return None
-        return property["rich_text"][0]["plain_text"]
-    
-    if ptype == "select":
-        if property["select"] == None: return None
-        return property["select"]["name"]
-    
-    if ptype == "url":
-        if property["url"] == None: return None
-        return property["url"]
-    
-    if ptype == "last_edited_time":
-        return property["last_edited_time"]
-    
-    if ptype == "date":
-        if property["date"] == None: return (None, None)
-        return (property["date"]["start"], property["date"]["end"])
-    
-    raise Exception(f"Unknown property passed into text extractor - property {ptype}")
+# images are never decoded at more than this many pixels, larger ones are kept as downloaded (IMAGE_MAX_MEGAPIXELS)
+# every compression worker can hold one image this size, so this times COMPRESS_WORKERS bounds the memory images take
+MAX_IMAGE_PIXELS = int(float(environ.get("IMAGE_MAX_MEGAPIXELS", "40")) * 1_000_000)
+# pillow's own check looks at the size in the file's header, but jpegs are decoded at as little as 1/8 scale (64x fewer pixels),
+# so it's only left to refuse files too large for that to help
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS * 64 // 2 # pillow warns above this and refuses anything twice as large
 
-def multiplePropTextExtractor(property:dict) -> list[str] | None:
-    ptype = property["type"]
-    out = []
-    
-    
-    if ptype == "relation":
-        if property["relation"] == []: return None
-        for r in property["relation"]:
-            out.append(r["id"])
-        return out
-    
-    raise Exception(f"Unknown property passed into text extractor - property {ptype}")
+# compressed images fit in a box this size
+MAX_IMAGE_SIZE = 2000
+
+# widths of the resized copies generated next to every image, served through ?w= on the image routes
+VARIANT_WIDTHS = [160, 320, 640, 1280]
+
+# modern formats generated for every image, in order of preference when the client accepts several
+VARIANT_FORMATS = ["avif", "webp"] if features.check("avif") else ["webp"]
+
+VARIANT_MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+}
+
+# jpegs and pngs also get resized copies in their own format, so ?w= works for clients that accept neither modern format
+# extension : pillow format
+ORIGINAL_VARIANT_FORMATS = {
+    "jpg": "JPEG",
+    "jpeg": "JPEG",
+    "png": "PNG",
+}
 
 def create_human_readable_date(start_iso: str = None, end_iso: str = None) -> str:
     # Check if both start and end are None
@@ -86,6 +74,45 @@ def create_folder_if_not_existing(folder_path:str) -> bool:
         return True
     return False
 
+def current_iso_timestamp() -> str:
+    current_time = datetime.now(timezone.utc)
+    return current_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+# write to a temporary file and rename it over the old one, so readers never see a half written file
+def write_file_atomic(path:str, data:bytes) -> None:
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as fi:
+        fi.write(data)
+    os.replace(temp_path, path)
+
+# writes a json export and its precompressed .gz / .br copies
+def write_export(path:str, data:str) -> None:
+    export = os.path.basename(path)
+    with EXPORT_WRITE_SECONDS.time(export=export):
+        encoded = data.encode("utf-8")
+        write_file_atomic(path, encoded)
+        write_precompressed(path, encoded)
+    EXPORT_BYTES.set(len(encoded), export=export)
+
+def read_sync_status(path:str) -> SyncStatus | None:
+    if not exists(path):
+        return None
+    try:
+        with open(path, "r") as fi:
+            return SyncStatus.model_validate_json(fi.read())
+    except Exception:
+        return None
+
+# records that notion was just checked (and whether the export was rewritten) in the status file next to an export
+def write_sync_status(path:str, changed:bool) -> None:
+    now = current_iso_timestamp()
+    
+    previous = read_sync_status(path)
+    last_changed = previous.last_changed if previous else None
+    
+    status = SyncStatus(last_checked=now, last_changed=now if changed else last_changed)
+    write_file_atomic(path, status.model_dump_json(indent=4).encode("utf-8"))
+
 def image_filename_to_url(api_route:str, filename:str):
     path = os.getenv("API_URL")
         
@@ -94,23 +121,121 @@ def image_filename_to_url(api_route:str, filename:str):
     
     return f"{path}{api_route}/{filename}"
 
-# take care to only call this once per image (ie right after you save it)
-def attempt_compress_image(filepath:str):
-    image = Image.open(filepath)
+# saves next to the final path (keeping the extension so pillow knows the format) and then replaces it,
+# so the api never sees a half written image and notices the change from the folder's mtime
+def save_image_atomic(image:Image.Image, path:str, **kwargs) -> None:
+    folder, filename = os.path.split(path)
+    temp_path = os.path.join(folder, f".tmp-{filename}")
+    image.save(temp_path, **kwargs)
+    os.replace(temp_path, path)
+
+# the largest size with the same aspect ratio as `size` that fits in `box`
+def fit_size(size:tuple[int, int], box:tuple[int, int]) -> tuple[int, int]:
+    scale = min(1, box[0] / size[0], box[1] / size[1])
+    return (max(1, int(size[0] * scale)), max(1, int(size[1] * scale)))
+
+# opens an image without decoding it yet. jpegs are set up to decode straight at the smallest scale (1/2, 1/4, 1/8)
+# that's still at least `size`, so a 50 megapixel photo never exists in memory at full resolution
+# raises if decoding would still take more than MAX_IMAGE_PIXELS
+def open_image_bounded(path:str, size:tuple[int, int] | None = None) -> Image.Image:
+    image = Image.open(path)
+    try:
+        if size != None:
+            image.draft(None, fit_size(image.size, size))
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            raise Exception(f"{image.width}x{image.height} is over the limit of {MAX_IMAGE_PIXELS} pixels (IMAGE_MAX_MEGAPIXELS)")
+    except Exception:
+        image.close()
+        raise
+    return image
+
+# fits the downloaded image at `source` in MAX_IMAGE_SIZE and saves it to `filepath` (through a temp file, source is left as is)
+# returns False without saving anything for animated images, thumbnail would only keep the first frame so they're used as downloaded
+def attempt_compress_image(source:str, filepath:str) -> bool:
+    with open_image_bounded(source, (MAX_IMAGE_SIZE, MAX_IMAGE_SIZE)) as image:
+        if getattr(image, "is_animated", False):
+            return False
+        
+        image.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE), Image.LANCZOS)
+        
+        # Save the image with optimized settings
+        save_image_atomic(image, filepath, optimize=True, quality=95)
+    return True
+
+# name of a resized copy of an image, ie ("abc.png", 320, "webp") -> "abc-320w.webp"
+# a width of None is the full size copy -> "abc-full.webp"
+def image_variant_filename(filename:str, width:int | None, format:str) -> str:
+    stem = filename.rsplit(".", 1)[0]
+    if width == None:
+        return f"{stem}-full.{format}"
+    return f"{stem}-{width}w.{format}"
+
+# the extension resized copies in the image's own format use, or None if it doesn't get any
+def original_variant_format(filename:str) -> str | None:
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return extension if extension in ORIGINAL_VARIANT_FORMATS else None
+
+# every name a resized copy of the image could have
+def image_variant_filenames(filename:str) -> list[str]:
+    names = [image_variant_filename(filename, w, f) for f in VARIANT_FORMATS for w in VARIANT_WIDTHS + [None]]
+    original = original_variant_format(filename)
+    if original != None:
+        names += [image_variant_filename(filename, w, original) for w in VARIANT_WIDTHS]
+    return names
+
+def image_variants_exist(filepath:str) -> bool:
+    folder, filename = os.path.split(filepath)
+    return exists(os.path.join(folder, image_variant_filename(filename, None, VARIANT_FORMATS[-1])))
+
+# saves a copy of the image in every modern format at every width in VARIANT_WIDTHS smaller than the image, and at full size
+# jpegs and pngs also get the smaller widths in their own format
+# call this after attempt_compress_image so the full size copy is capped at the same size
+def generate_image_variants(filepath:str) -> list[str]:
+    folder, filename = os.path.split(filepath)
     
-    i_width, i_height = image.size
+    # remove old variants first so a smaller replacement image doesn't leave larger variants behind
+    for name in image_variant_filenames(filename):
+        old = os.path.join(folder, name)
+        if exists(old):
+            os.remove(old)
     
-    if i_width > 2000 or i_height > 2000:
-        # Calculate the new size while maintaining the aspect ratio
-        if i_width > i_height:
-            new_width = 2000
-            new_height = int((i_height * new_width) / i_width)
-        else:
-            new_height = 2000
-            new_width = int((i_width * new_height) / i_height)
+    original = original_variant_format(filename)
+    
+    with open_image_bounded(filepath) as image:
+        # resizing every frame isn't worth it, animated images only get a full size webp copy
+        if getattr(image, "is_animated", False):
+            path = os.path.join(folder, image_variant_filename(filename, None, "webp"))
+            save_image_atomic(image, path, format="WEBP", save_all=True, quality=80, method=4)
+            return [path]
+
+        if image.mode not in ["RGB", "RGBA"]:
+            has_alpha = image.mode in ["LA", "PA"] or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+    
+        i_width, i_height = image.size
+    
+        saved = []
+        for width in [None] + [w for w in VARIANT_WIDTHS if w < i_width]:
+            if width == None:
+                resized = image
+            else:
+                resized = image.resize((width, max(1, int(i_height * width / i_width))), Image.LANCZOS, reducing_gap=3.0)
         
-        # Resize the image
-        image = image.resize((new_width, new_height), Image.LANCZOS)
+            for format in VARIANT_FORMATS:
+                path = os.path.join(folder, image_variant_filename(filename, width, format))
+                if format == "avif":
+                    save_image_atomic(resized, path, format="AVIF", quality=60, speed=6)
+                else:
+                    save_image_atomic(resized, path, format="WEBP", quality=80, method=4)
+                saved.append(path)
+            
+            # the original itself is the full size copy in its own format
+            if original != None and width != None:
+                path = os.path.join(folder, image_variant_filename(filename, width, original))
+                if ORIGINAL_VARIANT_FORMATS[original] == "JPEG":
+                    save_image_atomic(resized.convert("RGB"), path, format="JPEG", optimize=True, quality=85)
+                else:
+                    save_image_atomic(resized, path, format="PNG", optimize=True)
+                saved.append(path)
     
-    # Save the image with optimized settings
-    image.save(filepath, optimize=True, quality=95)
\ No newline at end of file
+    return saved
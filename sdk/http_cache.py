@@ -0,0 +1,61 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+# helpers for conditional requests (ETag / If-None-Match, Last-Modified / If-Modified-Since)
+
+# how long clients and proxies may reuse a json response, and for how much longer they may serve it while revalidating
+JSON_CACHE_CONTROL = "public, max-age=30, stale-while-revalidate=300"
+
+# calendar apps refresh subscriptions every few hours at most, so a few minutes of staleness costs nothing
+CALENDAR_CACHE_CONTROL = "public, max-age=300"
+
+def make_etag(data:bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+# a compressed body is a different representation, so it gets its own etag ("abc" -> "abc-br")
+def encoded_etag(etag:str, encoding:str | None) -> str:
+    if encoding == None:
+        return etag
+    return etag[:-1] + f'-{encoding}"'
+
+def iso_to_http_date(iso:str | None) -> str | None:
+    if not iso:
+        return None
+    try:
+        dt = datetime.fromisoformat(iso.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo == None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+def etag_matches(if_none_match:str, etag:str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+
+    base = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        # any encoding of the same content counts as a match
+        if candidate == base or candidate.startswith(base + "-"):
+            return True
+    return False
+
+# true if the client's cached copy (described by its request headers) is still current
+def is_not_modified(headers, etag:str, last_modified:str | None) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match != None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
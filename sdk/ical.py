@@ -0,0 +1,273 @@
+import calendar
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from pydantic import BaseModel
+
+from sdk.helpers import create_folder_if_not_existing, write_export, write_file_atomic
+from sdk.models import LCSCEvent
+
+logger = logging.getLogger("lcsc.calendar")
+
+# ICALENDAR FEED
+# the backend renders the feed whenever events change, the api only ever serves the finished file
+# https://datatracker.ietf.org/doc/html/rfc5545
+
+CALENDAR_FOLDER = "calendar" # inside the data folder
+CALENDAR_FILE = "events.ics"
+CALENDAR_CACHE = "json/calendar_cache.json"
+
+RECURRENCE_HORIZON = timedelta(days=120) # how far past the latest event of a series occurrences are generated
+MAX_OCCURRENCES = 60
+
+PRODID = "-//LCSC//Notion Web API//EN"
+
+# the recurring events database only has a name and a frequency, so a series is matched to the events with the same name
+# the latest of those events is repeated at this interval until the horizon
+FREQUENCIES = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(weeks=1),
+    "biweekly": timedelta(weeks=2),
+    "fortnightly": timedelta(weeks=2),
+    "everyotherweek": timedelta(weeks=2),
+    "every2weeks": timedelta(weeks=2),
+    "monthly": "monthly",
+}
+
+class CalendarCacheEntry(BaseModel):
+    key: str            # last_edited_time of the event and the frequency it was expanded with
+    vevents: list[str]  # rendered blocks, the event itself first and then any generated occurrences
+
+class CalendarCache(BaseModel):
+    events: dict[str, CalendarCacheEntry] = {} # event id : entry
+
+
+def semester_slug(semester:str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", semester.lower()).strip("-")
+
+def calendar_path(writeLocation:str, semester:str | None = None) -> str:
+    if semester == None:
+        return f"{writeLocation}/{CALENDAR_FOLDER}/{CALENDAR_FILE}"
+    return f"{writeLocation}/{CALENDAR_FOLDER}/events-{semester_slug(semester)}.ics"
+
+def parse_frequency(frequency:str | None) -> timedelta | str | None:
+    if not frequency:
+        return None
+    return FREQUENCIES.get(re.sub(r"[^a-z0-9]", "", frequency.lower()))
+
+def add_months(dt:datetime | date, months:int) -> datetime | date:
+    month = dt.month - 1 + months
+    year = dt.year + month // 12
+    month = month % 12 + 1
+    return dt.replace(year=year, month=month, day=min(dt.day, calendar.monthrange(year, month)[1]))
+
+def escape_text(value:str) -> str:
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+# lines longer than 75 octets are continued on the next line after a space
+def fold(line:str) -> str:
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+
+    parts = []
+    current = ""
+    limit = 75
+    for char in line:
+        if len((current + char).encode("utf-8")) > limit:
+            parts.append(current)
+            current = ""
+            limit = 74 # continuation lines start with a space
+        current += char
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+# notion dates are either a date or a datetime with an offset
+def parse_notion_date(value:str | None) -> datetime | date | None:
+    if not value:
+        return None
+    try:
+        if "T" not in value:
+            return date.fromisoformat(value)
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo == None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+def format_date(value:datetime | date) -> str:
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return value.strftime("%Y%m%d")
+
+def date_property(name:str, value:datetime | date) -> str:
+    if isinstance(value, datetime):
+        return f"{name}:{format_date(value)}"
+    return f"{name};VALUE=DATE:{format_date(value)}"
+
+def render_vevent(event:LCSCEvent, uid:str, start:datetime | date, end:datetime | date | None) -> str:
+    stamp = parse_notion_date(event.last_edited_time) or datetime.now(timezone.utc)
+
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{format_date(stamp)}",
+        f"LAST-MODIFIED:{format_date(stamp)}",
+        date_property("DTSTART", start),
+    ]
+    if end != None:
+        lines.append(date_property("DTEND", end))
+    elif not isinstance(start, datetime):
+        lines.append(date_property("DTEND", start + timedelta(days=1))) # all day event
+
+    lines.append(f"SUMMARY:{escape_text(event.event_name or 'LCSC Event')}")
+    if event.location:
+        lines.append(f"LOCATION:{escape_text(event.location)}")
+
+    description = []
+    if event.registration_link:
+        description.append(f"Register: {event.registration_link}")
+    if event.information_link:
+        description.append(f"More info: {event.information_link}")
+    if description:
+        lines.append(f"DESCRIPTION:{escape_text(chr(10).join(description))}")
+    if event.information_link or event.registration_link:
+        lines.append(f"URL:{event.information_link or event.registration_link}")
+
+    lines.append("END:VEVENT")
+    return "\r\n".join(fold(line) for line in lines) + "\r\n"
+
+# the event itself, then every occurrence of its series up to the horizon if it is the latest event of a recurring series
+# taken_dates are days that already have an event of the series in notion, so they aren't generated twice
+def render_event(event:LCSCEvent, frequency:timedelta | str | None, taken_dates:set[date]) -> list[str]:
+    start = parse_notion_date(event.event_start_date)
+    if start == None:
+        return []
+    end = parse_notion_date(event.event_end_date)
+
+    vevents = [render_vevent(event, f"{event.id}@lcsc", start, end)]
+    if frequency == None:
+        return vevents
+
+    duration = end - start if end != None and type(end) == type(start) else None
+    until = start + RECURRENCE_HORIZON
+    for n in range(1, MAX_OCCURRENCES + 1):
+        occurrence = add_months(start, n) if frequency == "monthly" else start + frequency * n
+        if occurrence > until:
+            break
+        day = occurrence.date() if isinstance(occurrence, datetime) else occurrence
+        if day in taken_dates:
+            continue
+        occurrence_end = occurrence + duration if duration != None else None
+        vevents.append(render_vevent(event, f"{event.id}-{format_date(day)}@lcsc", occurrence, occurrence_end))
+
+    return vevents
+
+def render_calendar(name:str, vevents:list[str]) -> str:
+    header = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        fold(f"X-WR-CALNAME:{escape_text(name)}"),
+    ]
+    return "\r\n".join(header) + "\r\n" + "".join(vevents) + "END:VCALENDAR\r\n"
+
+
+def load_calendar_cache(path:str) -> CalendarCache:
+    try:
+        with open(path, "r") as fi:
+            return CalendarCache.model_validate_json(fi.read())
+    except FileNotFoundError:
+        return CalendarCache()
+    except Exception as e:
+        logger.error(f"Failed to read calendar cache, rendering every event again: {e}")
+        return CalendarCache()
+
+def write_if_changed(path:str, body:str) -> bool:
+    try:
+        with open(path, "r", newline="") as fi:
+            if fi.read() == body:
+                return False
+    except FileNotFoundError:
+        pass
+    write_export(path, body)
+    return True
+
+# renders the feed (and one per semester) from the current events
+# recurring_events is the page id : {"event_name", "frequency"} dict built by fetch_events
+# only events that changed since the last render are rendered again, and only files whose contents changed are rewritten
+def update_calendar(writeLocation:str, events:list[LCSCEvent], recurring_events:dict[str, dict]) -> None:
+    create_folder_if_not_existing(f"{writeLocation}/{CALENDAR_FOLDER}")
+
+    frequencies:dict[str, timedelta | str] = {}
+    for series in recurring_events.values():
+        frequency = parse_frequency(series.get("frequency"))
+        if series.get("event_name") and frequency != None:
+            frequencies[series["event_name"].strip().lower()] = frequency
+        elif series.get("frequency"):
+            logger.debug(f"Not expanding {series.get('event_name')}, unknown frequency {series.get('frequency')}")
+
+    # the latest dated event of each series is the one repeated, the earlier ones are just themselves
+    series_events:dict[str, list[LCSCEvent]] = {}
+    for e in events:
+        name = (e.event_name or "").strip().lower()
+        if name in frequencies and parse_notion_date(e.event_start_date) != None:
+            series_events.setdefault(name, []).append(e)
+
+    anchors:dict[str, timedelta | str] = {} # event id : frequency
+    taken:dict[str, set[date]] = {}         # event id : days that already have an event of its series
+    for name, series in series_events.items():
+        latest = max(series, key=lambda e: parse_notion_date(e.event_start_date).isoformat())
+        anchors[latest.id] = frequencies[name]
+        days = set()
+        for e in series:
+            start = parse_notion_date(e.event_start_date)
+            days.add(start.date() if isinstance(start, datetime) else start)
+        taken[latest.id] = days
+
+    cache_path = f"{writeLocation}/{CALENDAR_CACHE}"
+    cache = load_calendar_cache(cache_path)
+    new_cache = CalendarCache()
+    rendered = 0
+
+    by_semester:dict[str, list[str]] = {}
+    all_vevents:list[str] = []
+    # oldest first, so the feed doesn't reorder itself as events are added
+    for e in sorted(events, key=lambda e: (e.event_start_date or "", e.id)):
+        frequency = anchors.get(e.id)
+        key = f"{e.last_edited_time}|{frequency}|{sorted(taken.get(e.id, []))}"
+
+        cached = cache.events.get(e.id)
+        if cached != None and cached.key == key:
+            vevents = cached.vevents
+        else:
+            vevents = render_event(e, frequency, taken.get(e.id, set()))
+            rendered += 1
+        new_cache.events[e.id] = CalendarCacheEntry(key=key, vevents=vevents)
+
+        all_vevents += vevents
+        if e.semester:
+            by_semester.setdefault(e.semester, []).extend(vevents)
+
+    written = 0
+    written += write_if_changed(calendar_path(writeLocation), render_calendar("LCSC Events", all_vevents))
+    for semester, vevents in by_semester.items():
+        written += write_if_changed(calendar_path(writeLocation, semester), render_calendar(f"LCSC Events - {semester}", vevents))
+
+    # semesters that no longer have any events
+    expected = set(os.path.basename(calendar_path(writeLocation, s)) for s in by_semester) | {CALENDAR_FILE}
+    for name in os.listdir(f"{writeLocation}/{CALENDAR_FOLDER}"):
+        if name.endswith(".ics") and name not in expected:
+            for suffix in ["", ".gz", ".br"]:
+                if os.path.exists(f"{writeLocation}/{CALENDAR_FOLDER}/{name}{suffix}"):
+                    os.remove(f"{writeLocation}/{CALENDAR_FOLDER}/{name}{suffix}")
+
+    if rendered or len(new_cache.events) != len(cache.events):
+        write_file_atomic(cache_path, new_cache.model_dump_json().encode("utf-8"))
+    if written:
+        logger.info(f"Calendar updated ({rendered} events rendered, {written} feeds written).")
@@ -0,0 +1,113 @@
+import os
+import threading
+from collections import OrderedDict
+from os import environ
+
+from sdk.image_index import ImageFile
+from sdk.metrics import IMAGE_CACHE_BYTES, IMAGE_CACHE_ENTRIES, IMAGE_CACHE_REQUESTS
+
+# IMAGE CACHE
+# the few images almost every visitor loads (current executives, the next events) are kept in memory,
+# so serving them doesn't read the shared volume at all. off unless IMAGE_CACHE_MB is set
+
+DEFAULT_MAX_OBJECT_KB = 512 # larger images are always streamed from disk
+
+class ImageCache:
+    def __init__(self, max_bytes:int, max_object_bytes:int = DEFAULT_MAX_OBJECT_KB * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self.size = 0
+
+        self._entries:OrderedDict[str, tuple[str, bytes]] = OrderedDict() # path : (etag, body), least recently used first
+        self._lock = threading.Lock()
+
+    # entries are keyed by path and checked against the etag in the index's listing,
+    # so an image the backend replaced is read again as soon as the folder is listed again
+    def get(self, file:ImageFile) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(file.path)
+            if entry == None:
+                IMAGE_CACHE_REQUESTS.inc(result="miss")
+                return None
+            if entry[0] != file.etag:
+                self._remove(file.path)
+                IMAGE_CACHE_REQUESTS.inc(result="miss")
+                return None
+            self._entries.move_to_end(file.path)
+            IMAGE_CACHE_REQUESTS.inc(result="hit")
+            return entry[1]
+
+    def cacheable(self, file:ImageFile) -> bool:
+        return file.stat.st_size <= self.max_object_bytes
+
+    # reads the file and caches it, returns None if it was removed or changed since the index listed it
+    # blocking, call it from a thread
+    def load(self, file:ImageFile) -> bytes | None:
+        try:
+            fi = open(file.path, "rb")
+        except OSError:
+            return None
+        with fi:
+            stat = os.fstat(fi.fileno())
+            if stat.st_size != file.stat.st_size or stat.st_mtime_ns != file.stat.st_mtime_ns:
+                return None
+            body = fi.read()
+
+        with self._lock:
+            if file.path in self._entries:
+                self._remove(file.path)
+            self._entries[file.path] = (file.etag, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            self._update_metrics()
+        return body
+
+    def _remove(self, path:str) -> None:
+        _, body = self._entries.pop(path)
+        self.size -= len(body)
+        self._update_metrics()
+
+    def _update_metrics(self) -> None:
+        IMAGE_CACHE_BYTES.set(self.size)
+        IMAGE_CACHE_ENTRIES.set(len(self._entries))
+
+# IMAGE_CACHE_MB is the total budget, IMAGE_CACHE_MAX_OBJECT_KB the largest single image kept
+def image_cache_from_environ() -> ImageCache | None:
+    try:
+        max_mb = float(environ.get("IMAGE_CACHE_MB", "0"))
+        max_object_kb = float(environ.get("IMAGE_CACHE_MAX_OBJECT_KB", str(DEFAULT_MAX_OBJECT_KB)))
+    except ValueError:
+        raise Exception("IMAGE_CACHE_MB and IMAGE_CACHE_MAX_OBJECT_KB have to be numbers.")
+    if max_mb <= 0:
+        return None
+    return ImageCache(int(max_mb * 1024 * 1024), int(max_object_kb * 1024))
+
+
+# returns (start, end) inclusive for a single "bytes=" range, "unsatisfiable" if it's outside the file,
+# or None if there's no range, it's malformed or it asks for several ranges (the api sends the whole file for those)
+def parse_range(header:str | None, size:int) -> tuple[int, int] | str | None:
+    if not header or not header.strip().lower().startswith("bytes="):
+        return None
+    spec = header.strip()[6:].strip()
+    if "," in spec or "-" not in spec:
+        return None
+
+    first, last = (part.strip() for part in spec.split("-", 1))
+    try:
+        if first == "":
+            # the last n bytes
+            length = int(last)
+            if length <= 0:
+                return "unsatisfiable"
+            return (max(0, size - length), size - 1)
+        start = int(first)
+        end = int(last) if last != "" else None
+    except ValueError:
+        return None
+
+    if start < 0 or (end != None and end < start):
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    return (start, size - 1 if end == None else min(end, size - 1))
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import mimetypes
+import os
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import formatdate
+from typing import BinaryIO
+
+from sdk.export_store import CHECK_INTERVAL, file_identity
+from sdk.helpers import VARIANT_FORMATS, VARIANT_MEDIA_TYPES, VARIANT_WIDTHS, image_variant_filename, original_variant_format
+
+logger = logging.getLogger("lcsc.images")
+
+# IMAGE INDEX
+# every servable file in an image folder, kept in memory so a request is a dict lookup instead of realpath / isfile calls
+# the folder is only listed again when its mtime changes, which the backend guarantees by replacing files instead of rewriting them
+
+@dataclass
+class ImageFile:
+    path: str
+    stat: os.stat_result # from when the folder was listed, files are served with it as is (see open_listed)
+    media_type: str
+    etag: str
+    last_modified: str
+
+def image_media_type(filename:str) -> str | None:
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension in VARIANT_MEDIA_TYPES:
+        return VARIANT_MEDIA_TYPES[extension]
+    media_type = mimetypes.guess_type(filename)[0]
+    if media_type != None and media_type.startswith("image/"):
+        return media_type
+    return None
+
+# the media types an Accept header lists explicitly, leaving out any the client refuses with q=0
+# wildcards (image/*, */*) don't count, browsers that can't decode avif / webp send them too
+def accepted_media_types(accept:str) -> set[str]:
+    accepted = set()
+    for part in accept.lower().split(","):
+        media_type, *params = (p.strip() for p in part.split(";"))
+        refused = False
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    refused = float(value.strip()) <= 0
+                except ValueError:
+                    refused = True
+        if media_type and not refused:
+            accepted.add(media_type)
+    return accepted
+
+# partial downloads (.part) and files being written (.tmp-*) are left out, as is anything that isn't an image
+def scan_images(folder:str) -> dict[str, ImageFile]:
+    files = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            media_type = image_media_type(entry.name)
+            if media_type == None:
+                continue
+            files[entry.name] = image_file(entry.path, media_type, entry.stat(follow_symlinks=False))
+    return files
+
+def image_file(path:str, media_type:str, stat:os.stat_result) -> ImageFile:
+    return ImageFile(
+        path=path,
+        stat=stat,
+        media_type=media_type,
+        etag=f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+        last_modified=formatdate(stat.st_mtime, usegmt=True),
+    )
+
+# opens a listed file for sending, on a worker thread. the listing can be up to check_interval behind the folder,
+# so if the file was removed or replaced since (the backend always replaces files with a rename) this returns None
+# and the caller picks again from a fresh listing. the fstat is of the file already open, so it costs no extra lookup
+def open_listed(file:ImageFile) -> BinaryIO | None:
+    try:
+        fi = open(file.path, "rb")
+    except OSError:
+        return None
+    if file_identity(os.fstat(fi.fileno())) != file_identity(file.stat):
+        fi.close()
+        return None
+    return fi
+
+class ImageIndex:
+    def __init__(self, folder:str, check_interval:float = CHECK_INTERVAL) -> None:
+        self.folder = os.path.realpath(folder)
+        self.check_interval = check_interval
+
+        self._files:dict[str, ImageFile] = {}
+        self._folder_mtime:int | None = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def files(self) -> dict[str, ImageFile]:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self._refresh()
+        return self._files
+
+    # lists the folder again straight away (if it changed), ie after the api saved an image itself
+    def refresh(self) -> None:
+        self._last_check = time.monotonic()
+        self._refresh()
+
+    # for async code: checking the folder's mtime is a stat on the event loop every check_interval (or straight away with force),
+    # but listing it again runs on a worker thread, it's a stat for every image and its resized copies
+    async def update(self, force:bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self._changed():
+                await asyncio.to_thread(self._refresh)
+
+    def get(self, filename:str) -> ImageFile | None:
+        return self.files().get(filename)
+
+    def _changed(self) -> bool:
+        try:
+            return os.stat(self.folder).st_mtime_ns != self._folder_mtime
+        except FileNotFoundError:
+            return bool(self._files)
+
+    def _refresh(self) -> None:
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            self._files = {}
+            return
+        if mtime == self._folder_mtime:
+            return
+
+        with self._lock:
+            if mtime == self._folder_mtime:
+                return
+            try:
+                files = scan_images(self.folder)
+            except OSError as e:
+                logger.error(f"Failed to list {self.folder}, keeping the previous list: {e}")
+                return
+            self._files = files # single assignment, so readers see either the old or the new list
+            self._folder_mtime = mtime
+
+    # picks the smallest resized copy that is at least `width` wide in the best format the client accepts
+    # (jpegs and pngs have resized copies in their own format too, for clients that accept no modern format)
+    # falls back to the original image if the backend hasn't generated any copies for it
+    # returns None if there is no such image
+    def pick(self, filename:str, width:int | None, accept:str) -> tuple[ImageFile, bool] | None:
+        files = self.files()
+        original = files.get(filename)
+        if original == None:
+            return None
+
+        accepted = accepted_media_types(accept)
+        formats = [f for f in VARIANT_FORMATS if VARIANT_MEDIA_TYPES[f] in accepted]
+        original_format = original_variant_format(filename)
+
+        widths = [None]
+        if width != None:
+            widths = [w for w in VARIANT_WIDTHS if w >= width] + [None]
+
+        for w in widths:
+            for format in formats + ([original_format] if w != None and original_format != None else []):
+                variant = files.get(image_variant_filename(filename, w, format))
+                if variant != None:
+                    return variant, True
+
+        return original, False
@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from os.path import exists
+from time import perf_counter, time
+from urllib.parse import urlparse
+
+import httpx
+
+from sdk.helpers import attempt_compress_image, generate_image_variants, image_variants_exist, write_file_atomic
+from sdk.metrics import IMAGE_COMPRESS_SECONDS, IMAGE_DOWNLOAD_BYTES, IMAGE_DOWNLOADS
+from sdk.models import ImageManifest, ImageManifestEntry
+
+logger = logging.getLogger("lcsc.images")
+
+DOWNLOAD_WORKERS = 8 # concurrent image downloads
+COMPRESS_WORKERS = max(1, min(4, os.cpu_count() or 1)) # pillow releases the gil while resizing / encoding
+DOWNLOAD_TIMEOUT = httpx.Timeout(30, connect=5) # seconds
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 0.5 # seconds, doubled after every retry
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+CHUNK_SIZE = 64 * 1024
+
+COMPRESSIBLE_EXTENSIONS = ["webp", "jpg", "png", "jpeg", "gif"]
+
+@dataclass
+class ImageJob:
+    url: str            # where to download the image from (usually a signed Notion file url)
+    path: str           # where to save the image
+    label: str          # human readable name used in log messages
+    notion_name: str    # file name shown in Notion, recorded in the image manifest
+    compress: bool = True
+
+
+_clients:dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+# one client per event loop for the lifetime of the process so connections (and tls handshakes) are reused between images and syncs
+def get_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        for old_loop in [l for l in _clients if l.is_closed()]:
+            del _clients[old_loop]
+        _clients[loop] = httpx.AsyncClient(
+            timeout=DOWNLOAD_TIMEOUT,
+            limits=httpx.Limits(max_connections=DOWNLOAD_WORKERS, max_keepalive_connections=DOWNLOAD_WORKERS),
+            follow_redirects=True,
+        )
+    return _clients[loop]
+
+# compression runs on its own threads so it never holds up downloads or the event loop
+_compressors = ThreadPoolExecutor(max_workers=COMPRESS_WORKERS, thread_name_prefix="compress")
+
+def is_compressible(file_extension:str) -> bool:
+    return file_extension.lower() in COMPRESSIBLE_EXTENSIONS
+
+# IMAGE MANIFEST
+# Notion file urls are signed and expire, but the path (which contains the file's id) stays the same
+# as long as the file itself doesn't change. So we keep a manifest of what we saved for every image
+# and only download / compress again when the name or path of the source changes.
+
+def load_image_manifest(path:str) -> ImageManifest:
+    if exists(path):
+        try:
+            with open(path, "r") as fi:
+                return ImageManifest.model_validate_json(fi.read())
+        except Exception as e:
+            logger.error(f"Failed to read image manifest at {path}, all images will be downloaded again: {e}")
+    return ImageManifest()
+
+def save_image_manifest(manifest:ImageManifest, path:str) -> None:
+    write_file_atomic(path, manifest.model_dump_json(indent=4).encode("utf-8"))
+
+def source_path(url:str) -> str:
+    return urlparse(url).path
+
+def image_unchanged(manifest:ImageManifest, job:ImageJob) -> bool:
+    entry = manifest.images.get(os.path.basename(job.path))
+    if entry == None:
+        return False
+
+    if entry.notion_name != job.notion_name or entry.source_path != source_path(job.url):
+        return False
+
+    # make sure the file we saved is still there and hasn't been truncated
+    if not exists(job.path) or os.path.getsize(job.path) != entry.size:
+        return False
+    
+    # images saved before variants were introduced need to be processed once more
+    # (images that couldn't be compressed never get variants, trying again would give the same result)
+    return not job.compress or not entry.compressed or image_variants_exist(job.path)
+
+def file_sha256(path:str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as fi:
+        for chunk in iter(lambda: fi.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+# seconds to wait before retrying, from the Retry-After header if the server sent one
+def retry_delay(response:httpx.Response | None, attempt:int) -> float:
+    backoff = DOWNLOAD_BACKOFF * (2 ** attempt)
+    if response == None or "retry-after" not in response.headers:
+        return backoff
+
+    value = response.headers["retry-after"]
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return backoff
+
+# downloads to a temporary file next to job.path and returns its path, compress_image moves the result into place
+# so a failed download never replaces a good image
+# connection errors and 429 / 5xx responses are retried with exponential backoff
+async def download_image(job:ImageJob) -> str:
+    temp_path = f"{job.path}.part"
+    client = get_http_client()
+
+    try:
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            response = None
+            try:
+                async with client.stream("GET", job.url) as response:
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        with open(temp_path, "wb") as fi:
+                            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                                fi.write(chunk)
+                                IMAGE_DOWNLOAD_BYTES.inc(len(chunk))
+                        return temp_path
+            except httpx.TransportError as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                logger.debug(f"Retrying download of {os.path.basename(job.path)} after {e!r}")
+
+            if attempt == DOWNLOAD_RETRIES:
+                response.raise_for_status()
+            await asyncio.sleep(retry_delay(response, attempt))
+    except BaseException:
+        # a failed (or cancelled) download leaves nothing behind in the image folder
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+# the compressed image is written from the download to job.path, the download is only kept if it can't be compressed
+# (ie it isn't an image pillow can read or it's over the pixel limit), in which case it gets no resized copies either
+# animated images are kept as downloaded but still get their resized copies
+def compress_image(job:ImageJob, downloaded:str) -> ImageManifestEntry:
+    processed = False
+    start = perf_counter()
+    if job.compress:
+        try:
+            if attempt_compress_image(downloaded, job.path):
+                os.remove(downloaded)
+            processed = True
+        except Exception as e:
+            logger.warning(f"Failed to compress image for {job.label} ({os.path.basename(job.path)}), keeping it as is: {e}")
+    
+    if exists(downloaded):
+        os.replace(downloaded, job.path)
+    
+    if processed:
+        try:
+            generate_image_variants(job.path)
+        except Exception as e:
+            logger.warning(f"Failed to generate resized images for {job.label} ({os.path.basename(job.path)}) {e}")
+    if job.compress:
+        IMAGE_COMPRESS_SECONDS.observe(perf_counter() - start)
+
+    return ImageManifestEntry(
+        notion_name=job.notion_name,
+        source_path=source_path(job.url),
+        size=os.path.getsize(job.path),
+        sha256=file_sha256(job.path),
+        compressed=processed or not job.compress,
+    )
+
+# downloads every job concurrently and hands finished downloads off to a separate compression pool
+# the manifest is updated for every image that was saved
+# returns the jobs that could not be downloaded
+async def process_images(jobs:list[ImageJob], manifest:ImageManifest) -> list[ImageJob]:
+    if not jobs:
+        return []
+
+    failed:list[ImageJob] = []
+    downloads = asyncio.Semaphore(DOWNLOAD_WORKERS)
+    loop = asyncio.get_running_loop()
+
+    async def process(job:ImageJob) -> None:
+        async with downloads:
+            try:
+                downloaded = await download_image(job)
+                IMAGE_DOWNLOADS.inc(result="ok")
+            except Exception as e:
+                logger.error(f"Failed to download image for {job.label} ({os.path.basename(job.path)}) {e}")
+                IMAGE_DOWNLOADS.inc(result="failed")
+                failed.append(job)
+                return
+
+        # compress outside the semaphore so the next download can start straight away
+        manifest.images[os.path.basename(job.path)] = await loop.run_in_executor(_compressors, compress_image, job, downloaded)
+
+    await asyncio.gather(*(process(job) for job in jobs))
+    return failed
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from os import environ
+from os.path import exists
+
+import httpx
+
+from sdk.export_store import file_identity
+from sdk.helpers import image_variant_filenames, write_file_atomic
+from sdk.image_index import ImageIndex
+from sdk.images import ImageJob, compress_image, download_image, image_unchanged, is_compressible, source_path
+from sdk.metrics import LAZY_IMAGE_FETCHES
+from sdk.models import ImageManifest, ImageSource, ImageSourceList
+from sdk.sync_queue import SyncRequest, enqueue_sync
+
+logger = logging.getLogger("lcsc.images")
+
+# LAZY IMAGES
+# with IMAGE_MODE=lazy the backend doesn't download anything, it records where each page's image can be fetched from
+# and the api fetches, compresses and saves an image the first time it's requested (so old events nobody looks at cost nothing)
+# notion's signed urls expire after an hour, the api asks the backend for a fresh one through the sync queue
+
+IMAGE_MODES = ["eager", "lazy"]
+
+EXPIRY_MARGIN = timedelta(seconds=30) # urls this close to expiring are treated as expired
+REFRESH_WAIT = 20 # seconds the api waits for the backend to record a fresh url
+REFRESH_POLL = 0.5 # seconds between checks for the fresh url
+FAILURE_BACKOFF = 30 # seconds before an image that couldn't be fetched is tried again
+EXPIRED_STATUSES = [400, 403] # what notion's file storage answers for an expired signature
+
+def image_mode() -> str:
+    mode = environ.get("IMAGE_MODE", "eager").lower()
+    if mode not in IMAGE_MODES:
+        raise Exception(f"Unknown IMAGE_MODE {mode!r}, expected one of {', '.join(IMAGE_MODES)}.")
+    return mode
+
+# kept as json next to the exports whichever store is used, the api reads it directly
+def image_sources_path(writeLocation:str, folder:str) -> str:
+    return f"{writeLocation}/json/{folder}_sources.json"
+
+def load_image_sources(path:str) -> ImageSourceList:
+    if exists(path):
+        try:
+            with open(path, "r") as fi:
+                return ImageSourceList.model_validate_json(fi.read())
+        except Exception as e:
+            logger.error(f"Failed to read image sources at {path}, starting over: {e}")
+    return ImageSourceList()
+
+def save_image_sources(sources:ImageSourceList, path:str) -> None:
+    write_file_atomic(path, sources.model_dump_json(indent=4).encode("utf-8"))
+
+# removes a saved image and its resized copies, so the api fetches the new one
+def remove_image_files(path:str) -> None:
+    folder, filename = os.path.split(path)
+    paths = [path] + [os.path.join(folder, name) for name in image_variant_filenames(filename)]
+    for p in paths:
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+# BACKEND
+# files is page_id : the page's file ({"name", "url", "expiry_time"} from the schema) or None, for every page the sync got from notion,
+# including unchanged ones, so a sync of a single page is enough to hand out a fresh url
+# deleted_ids are pages that are gone, manifest is the eager mode manifest (images it saved are kept if they're still current)
+def update_image_sources(writeLocation:str, folder:str, files:dict[str, dict | None], deleted_ids:set[str], manifest:ImageManifest) -> None:
+    path = image_sources_path(writeLocation, folder)
+    sources = load_image_sources(path)
+    name_by_page = {source.page_id: name for name, source in sources.images.items()}
+    changed = False
+
+    for page_id in deleted_ids:
+        if page_id in name_by_page:
+            del sources.images[name_by_page.pop(page_id)]
+            changed = True
+
+    for page_id, file in files.items():
+        old_name = name_by_page.get(page_id)
+        old = sources.images.get(old_name) if old_name else None
+        if file == None:
+            if old_name:
+                del sources.images[old_name]
+                changed = True
+            continue
+
+        extension = file["name"].split(".")[-1].lower()
+        name = f"{page_id}.{extension}"
+        source = ImageSource(
+            page_id=page_id,
+            url=file["url"],
+            expiry_time=file["expiry_time"],
+            notion_name=file["name"],
+            compress=is_compressible(extension),
+        )
+        if source == old:
+            continue
+
+        # a different file in notion (not just a newly signed url) means whatever was saved is out of date
+        image_path = f"{writeLocation}/{folder}/{name}"
+        if old != None:
+            if old.notion_name != source.notion_name or source_path(old.url) != source_path(source.url):
+                remove_image_files(f"{writeLocation}/{folder}/{old_name}")
+        elif exists(image_path):
+            job = ImageJob(url=source.url, path=image_path, label=name, notion_name=source.notion_name, compress=source.compress)
+            if not image_unchanged(manifest, job):
+                remove_image_files(image_path)
+
+        if old_name and old_name != name:
+            del sources.images[old_name]
+        sources.images[name] = source
+        changed = True
+
+    if changed:
+        save_image_sources(sources, path)
+
+# API
+def is_expired(source:ImageSource) -> bool:
+    if source.expiry_time == None:
+        return False
+    try:
+        expiry = datetime.fromisoformat(source.expiry_time)
+    except ValueError:
+        return False
+    return expiry - EXPIRY_MARGIN <= datetime.now(timezone.utc)
+
+class LazyImages:
+    def __init__(self, index:ImageIndex, sources_path:str, database:str, queue_folder:str) -> None:
+        self.index = index
+        self.sources_path = sources_path
+        self.database = database          # what the sync queue calls the database, ie "events"
+        self.queue_folder = queue_folder
+
+        self._sources = ImageSourceList()
+        self._file_id:tuple | None = None
+        self._fetches:dict[str, asyncio.Future] = {} # file name : fetch in progress
+        self._failed:dict[str, float] = {}           # file name : when the last fetch failed
+
+    # reloaded whenever the backend replaces the file, reading and parsing it runs on a worker thread
+    async def sources(self) -> dict[str, ImageSource]:
+        try:
+            stat = os.stat(self.sources_path)
+        except FileNotFoundError:
+            return {}
+
+        file_id = file_identity(stat)
+        if file_id != self._file_id:
+            await asyncio.to_thread(self._load_sources, file_id)
+        return self._sources.images
+
+    def _load_sources(self, file_id:tuple) -> None:
+        try:
+            with open(self.sources_path, "r") as fi:
+                sources = ImageSourceList.model_validate_json(fi.read())
+        except Exception as e:
+            logger.error(f"Failed to load image sources {self.sources_path}, keeping the previous version: {e}")
+            return
+        self._sources = sources
+        self._file_id = file_id
+
+    async def has_source(self, filename:str) -> bool:
+        return filename in await self.sources()
+
+    # waits until the image is on disk, fetching it if it isn't
+    # every request for an image that's being fetched waits on the same fetch, so concurrent first requests only download it once
+    async def ensure(self, filename:str) -> None:
+        fetch = self._fetches.get(filename)
+        if fetch == None:
+            if self.index.get(filename) != None or not await self.has_source(filename):
+                return
+            # the listing can be a moment behind the folder (ie another worker just saved the image), so look again before fetching
+            await self.index.update(force=True)
+            if self.index.get(filename) != None:
+                return
+
+            # another request may have started the fetch while this one was checking
+            fetch = self._fetches.get(filename)
+            if fetch == None:
+                if time.monotonic() - self._failed.get(filename, float("-inf")) < FAILURE_BACKOFF:
+                    return
+                fetch = asyncio.ensure_future(self._fetch(filename))
+                self._fetches[filename] = fetch
+                fetch.add_done_callback(lambda _: self._fetches.pop(filename, None))
+
+        # shielded, so a client hanging up doesn't cancel the fetch for everyone else waiting on it
+        await asyncio.shield(fetch)
+
+    async def _fetch(self, filename:str) -> None:
+        try:
+            await self._download(filename)
+            LAZY_IMAGE_FETCHES.inc(result="ok")
+            self._failed.pop(filename, None)
+        except Exception as e:
+            logger.error(f"Failed to fetch image {filename} from Notion: {e}")
+            LAZY_IMAGE_FETCHES.inc(result="failed")
+            self._failed[filename] = time.monotonic()
+        await self.index.update(force=True)
+
+    async def _download(self, filename:str) -> None:
+        source = (await self.sources()).get(filename)
+        if source == None:
+            return
+        if is_expired(source):
+            source = await self._refresh_source(filename, source)
+
+        job = ImageJob(url=source.url, path=os.path.join(self.index.folder, filename), label=filename, notion_name=source.notion_name, compress=source.compress)
+        try:
+            downloaded = await download_image(job)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in EXPIRED_STATUSES or source.expiry_time == None:
+                raise
+            # expired sooner than notion said it would (ie clock skew), try once more with a fresh url
+            job.url = (await self._refresh_source(filename, source)).url
+            downloaded = await download_image(job)
+
+        await asyncio.to_thread(compress_image, job, downloaded)
+
+    # asks the backend to sync the image's page and waits for it to record a new url
+    async def _refresh_source(self, filename:str, source:ImageSource) -> ImageSource:
+        LAZY_IMAGE_FETCHES.inc(result="url_refreshed")
+        enqueue_sync(self.queue_folder, SyncRequest(database=self.database, page_id=source.page_id, reason=f"image url for {filename} expired"))
+
+        deadline = time.monotonic() + REFRESH_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(REFRESH_POLL)
+            fresh = (await self.sources()).get(filename)
+            if fresh == None:
+                raise Exception("the image was removed from its page")
+            if fresh.url != source.url:
+                return fresh
+        raise Exception(f"the backend didn't record a new url within {REFRESH_WAIT} seconds")
@@ -0,0 +1,171 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator, TypeVar
+
+# METRICS
+# counters, gauges and histograms rendered in the prometheus text format
+# the backend has no http server, so it writes its metrics to a file on the shared volume and the api serves them with its own on /metrics
+
+METRICS_FOLDER = "metrics" # inside the data folder
+BACKEND_METRICS_FILE = "backend.prom"
+
+# seconds, the prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape_label(value:str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(names:tuple[str, ...], values:tuple[str, ...], extra:str = "") -> str:
+    labels = [f'{n}="{escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+def format_value(value:float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+# metrics are updated from the event loop and from the image compression threads
+class Metric(ABC):
+    kind = ""
+
+    def __init__(self, name:str, help:str, labels:tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def key(self, labels:dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        ...
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name:str, help:str, labels:tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.values:dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount:float = 1, **labels:str) -> None:
+        key = self.key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{format_labels(self.labels, k)} {format_value(v)}" for k, v in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value:float, **labels:str) -> None:
+        key = self.key(labels)
+        with self._lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name:str, help:str, labels:tuple[str, ...] = (), buckets:tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.values:dict[tuple[str, ...], tuple[list[int], list[float]]] = {} # labels : (count per bucket, [sum, count])
+
+    def observe(self, value:float, **labels:str) -> None:
+        key = self.key(labels)
+        with self._lock:
+            if key not in self.values:
+                self.values[key] = ([0] * len(self.buckets), [0.0, 0])
+            counts, totals = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels:str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, totals) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = 'le="' + format_value(bound) + '"'
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(totals[0])}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {totals[1]}")
+        return lines
+
+
+M = TypeVar("M", bound=Metric)
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics:list[Metric] = []
+
+    def add(self, metric:M) -> M:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+# BACKEND
+backend_metrics = Registry()
+
+NOTION_REQUESTS = backend_metrics.add(Counter("lcsc_notion_requests_total", "Requests made to the Notion API.", ("endpoint", "result")))
+NOTION_REQUEST_SECONDS = backend_metrics.add(Histogram("lcsc_notion_request_seconds", "Time taken by each Notion API request.", ("endpoint",)))
+NOTION_RATE_LIMITED = backend_metrics.add(Counter("lcsc_notion_rate_limited_total", "Notion API requests answered with 429 Too Many Requests.", ("endpoint",)))
+
+SYNCS = backend_metrics.add(Counter("lcsc_syncs_total", "Syncs run, by how they ended.", ("database", "result")))
+SYNC_SECONDS = backend_metrics.add(Histogram("lcsc_sync_seconds", "Wall time of each sync.", ("database", "kind"), buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)))
+POLL_INTERVAL = backend_metrics.add(Gauge("lcsc_poll_interval_seconds", "Current time between polls.", ("database",)))
+PAGES_SCANNED = backend_metrics.add(Counter("lcsc_pages_scanned_total", "Pages returned by Notion during syncs.", ("database",)))
+PAGES_CHANGED = backend_metrics.add(Counter("lcsc_pages_changed_total", "Pages that were new or edited since the previous sync.", ("database",)))
+
+IMAGE_DOWNLOADS = backend_metrics.add(Counter("lcsc_image_downloads_total", "Image downloads, by whether they succeeded.", ("result",)))
+IMAGE_DOWNLOAD_BYTES = backend_metrics.add(Counter("lcsc_image_download_bytes_total", "Bytes of images downloaded from Notion."))
+IMAGE_COMPRESS_SECONDS = backend_metrics.add(Histogram("lcsc_image_compress_seconds", "Time taken to compress an image and generate its resized copies.", buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)))
+
+EXPORT_BYTES = backend_metrics.add(Gauge("lcsc_export_bytes", "Size of the last export written.", ("export",)))
+EXPORT_WRITE_SECONDS = backend_metrics.add(Histogram("lcsc_export_write_seconds", "Time taken to write (and precompress) an export.", ("export",)))
+
+
+# API
+api_metrics = Registry()
+
+HTTP_REQUESTS = api_metrics.add(Counter("lcsc_http_requests_total", "Requests served, by route and status code.", ("route", "status")))
+HTTP_REQUEST_SECONDS = api_metrics.add(Histogram("lcsc_http_request_seconds", "Time taken to serve each request.", ("route",)))
+HTTP_RESPONSE_BYTES = api_metrics.add(Counter("lcsc_http_response_bytes_total", "Bytes of response bodies sent (after compression).", ("route",)))
+EXPORT_RESPONSES = api_metrics.add(Counter("lcsc_export_responses_total", "Export responses, by encoding and whether the client's copy was still current (304).", ("export", "encoding", "result")))
+EXPORT_RELOADS = api_metrics.add(Counter("lcsc_export_reloads_total", "Times a new export file was loaded into memory.", ("export", "result")))
+IMAGE_RESPONSES = api_metrics.add(Counter("lcsc_image_responses_total", "Image responses, by the format sent and whether a resized copy was found.", ("format", "result")))
+IMAGE_CACHE_REQUESTS = api_metrics.add(Counter("lcsc_image_cache_requests_total", "Image cache lookups, by whether the image was in memory.", ("result",)))
+IMAGE_CACHE_BYTES = api_metrics.add(Gauge("lcsc_image_cache_bytes", "Bytes of images held in the image cache."))
+IMAGE_CACHE_ENTRIES = api_metrics.add(Gauge("lcsc_image_cache_entries", "Images held in the image cache."))
+LAZY_IMAGE_FETCHES = api_metrics.add(Counter("lcsc_lazy_image_fetches_total", "Images fetched from Notion on their first request (IMAGE_MODE=lazy).", ("result",)))
@@ -1,3 +1,5 @@
+from typing import Any
+
 from pydantic import BaseModel
 
 
@@ -80,11 +82,18 @@ class LCSCEvent(BaseModel):
 class ExecPageMetadata(BaseModel):
     execs_last_edited: str
     last_checked: str
+    version: int = 0 # latest change log version included in this export, pass it to /executives/changes?since=
 
 
 class EventPageMetadata(BaseModel):
     events_last_edited: str
     last_checked: str
+    version: int = 0 # latest change log version included in this export, pass it to /events/changes?since=
+
+# written next to each export on every poll, so the export itself only changes when the data does
+class SyncStatus(BaseModel):
+    last_checked: str               # last time notion was checked for updates
+    last_changed: str | None = None # last time the export was rewritten with new data
 
 class LCSCExecutiveContainer(BaseModel):
     metadata: ExecPageMetadata
@@ -93,3 +102,67 @@ class LCSCExecutiveContainer(BaseModel):
 class LCSCEventContainer(BaseModel):
     metadata: EventPageMetadata
     events: list[LCSCEvent]
+
+class ImageManifestEntry(BaseModel):
+    notion_name: str    # file name shown in Notion
+    source_path: str    # url path of the source file (without the expiring signature)
+    size: int           # size in bytes of the saved (compressed) image
+    sha256: str         # hash of the saved (compressed) image
+    compressed: bool = True # False if it couldn't be compressed (ie over the pixel limit) and was saved as downloaded
+
+class ImageManifest(BaseModel):
+    images: dict[str, ImageManifestEntry] = {} # saved file name : entry
+
+# where an image can be downloaded from, recorded instead of the image itself with IMAGE_MODE=lazy, see sdk/lazy_images.py
+class ImageSource(BaseModel):
+    page_id: str
+    url: str                        # signed notion url, stops working at expiry_time
+    expiry_time: str | None = None  # None for external urls
+    notion_name: str                # file name shown in Notion
+    compress: bool = True
+
+class ImageSourceList(BaseModel):
+    images: dict[str, ImageSource] = {} # file name : source
+
+# local copy of a related database (ie roles), see sdk/relations.py
+class RelatedPage(BaseModel):
+    last_edited_time: str
+    row: dict[str, Any] # the page's fields (from the schema) plus anything derive added
+
+class RelationCacheFile(BaseModel):
+    complete: bool = False             # whether the whole database has been queried at least once
+    last_edited: str = ""              # latest last_edited_time seen, incremental checks only ask for pages edited since
+    pages: dict[str, RelatedPage] = {} # page id : page
+
+# one page of results from the query routes, pass next_cursor back as ?cursor= to get the next page
+class LCSCEventPage(BaseModel):
+    results: list[LCSCEvent]
+    total: int
+    next_cursor: str | None
+
+class LCSCExecutivePage(BaseModel):
+    results: list[LCSCExecutive]
+    total: int
+    next_cursor: str | None
+
+# records that changed in each export, so clients can fetch just the changes since the version they have
+class ChangeLogEntry(BaseModel):
+    version: int
+    id: str
+    deleted: bool = False
+
+class ChangeLog(BaseModel):
+    version: int = 0                    # version of the newest export
+    oldest_version: int = 0             # changes since any version older than this have been dropped from the log
+    entries: list[ChangeLogEntry] = []  # oldest first
+
+# records added or edited since the requested version, and the ids of records deleted since then
+class LCSCEventChanges(BaseModel):
+    version: int
+    upserted: list[LCSCEvent]
+    deleted: list[str]
+
+class LCSCExecutiveChanges(BaseModel):
+    version: int
+    upserted: list[LCSCExecutive]
+    deleted: list[str]
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from os import environ
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from notion_client import APIErrorCode, APIResponseError, AsyncClient
+
+from sdk.metrics import NOTION_RATE_LIMITED, NOTION_REQUEST_SECONDS, NOTION_REQUESTS
+from sdk.rate_limit import TokenBucket
+
+logger = logging.getLogger("lcsc.notion")
+
+NOTION_PAGE_SIZE = 100 # largest page size the Notion API allows
+
+# Notion allows an average of 3 requests per second per integration
+NOTION_RATE_LIMIT = 3 # requests per second
+NOTION_BURST = 3
+NOTION_MAX_RETRIES = 5
+NOTION_DEFAULT_RETRY_AFTER = 1.0 # seconds, if a 429 doesn't say how long to wait
+
+# every call to Notion goes through this, no matter which database it is for
+notion_limiter = TokenBucket(NOTION_RATE_LIMIT, NOTION_BURST)
+
+_clients:dict[asyncio.AbstractEventLoop, AsyncClient] = {}
+
+# one client per event loop, shared by every sync so connections to Notion are reused
+def get_notion_client() -> AsyncClient:
+    if "NOTION_API_TOKEN" not in environ:
+        raise Exception("Please provide a Notion integration token.")
+
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        # forget clients belonging to loops that have since been closed
+        for old_loop in [l for l in _clients if l.is_closed()]:
+            del _clients[old_loop]
+        # NOTION_BASE_URL points the client somewhere else, ie the fake notion server in bench/
+        _clients[loop] = AsyncClient(auth=environ.get("NOTION_API_TOKEN"), base_url=environ.get("NOTION_BASE_URL", "https://api.notion.com"))
+    return _clients[loop]
+
+def retry_after_seconds(error:APIResponseError) -> float:
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return NOTION_DEFAULT_RETRY_AFTER
+
+# calls a Notion endpoint once the rate limiter allows it
+# if Notion still answers 429, every caller is held back for as long as Retry-After asks before trying again
+async def notion_call(method:Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    endpoint = getattr(method, "__qualname__", "unknown") # ie DatabasesEndpoint.query
+    
+    for attempt in range(NOTION_MAX_RETRIES + 1):
+        await notion_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            result = await method(*args, **kwargs)
+            NOTION_REQUESTS.inc(endpoint=endpoint, result="ok")
+            return result
+        except APIResponseError as e:
+            NOTION_REQUESTS.inc(endpoint=endpoint, result=getattr(e.code, "value", str(e.code)))
+            if e.code == APIErrorCode.RateLimited:
+                NOTION_RATE_LIMITED.inc(endpoint=endpoint)
+            if e.code != APIErrorCode.RateLimited or attempt == NOTION_MAX_RETRIES:
+                raise
+            delay = retry_after_seconds(e)
+            logger.warning(f"Rate limited by Notion, waiting {delay} seconds.")
+            notion_limiter.pause(delay)
+        except Exception:
+            NOTION_REQUESTS.inc(endpoint=endpoint, result="error")
+            raise
+        finally:
+            NOTION_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+def normalize_id(notion_id:str) -> str:
+    return notion_id.replace("-", "").lower()
+
+# fetches specific pages of a database (ie the ones a webhook said changed)
+# returns (pages that still exist, ids of pages that were deleted / archived / moved out of the database)
+async def retrieve_pages(notion:AsyncClient, database_id:str, page_ids:list[str]) -> tuple[list[dict], set[str]]:
+    pages = []
+    removed = set()
+
+    for page_id in page_ids:
+        try:
+            page = await notion_call(notion.pages.retrieve, page_id)
+        except APIResponseError as e:
+            if e.code != APIErrorCode.ObjectNotFound:
+                raise
+            removed.add(page_id)
+            continue
+
+        parent = page.get("parent", {}).get("database_id") or ""
+        if page.get("archived") or page.get("in_trash") or normalize_id(parent) != normalize_id(database_id):
+            removed.add(page["id"])
+        else:
+            pages.append(page)
+
+    return pages, removed
+
+# filter for databases.query that only matches pages edited on or after the given iso timestamp
+# (ie metadata.events_last_edited / metadata.execs_last_edited from a previous sync)
+def last_edited_filter(since:str | None) -> dict | None:
+    if not since:
+        return None
+
+    return {
+        "timestamp": "last_edited_time",
+        "last_edited_time": {"on_or_after": since},
+    }
+
+# yields every page in a database, following has_more / next_cursor until the end is reached
+# if last_edited_after is given then only pages edited on or after that time are returned
+async def query_database(notion:AsyncClient, database_id:str, last_edited_after:str | None = None, page_size:int = NOTION_PAGE_SIZE) -> AsyncIterator[dict]:
+    query = {"page_size": page_size}
+
+    filter = last_edited_filter(last_edited_after)
+    if filter:
+        query["filter"] = filter
+
+    cursor = None
+    while True:
+        if cursor:
+            query["start_cursor"] = cursor
+
+        response = await notion_call(notion.databases.query, database_id, **query)
+        for page in response["results"]:
+            yield page
+
+        if not response.get("has_more") or not response.get("next_cursor"):
+            break
+        cursor = response["next_cursor"]
@@ -0,0 +1,139 @@
+import base64
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+from sdk.models import LCSCEvent, LCSCEventContainer, LCSCExecutive, LCSCExecutiveContainer
+
+# INDEXES
+# built once whenever the api loads a new export, so filtering a request is a dict lookup or a binary search
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# notion dates are either a date ("2024-09-14") or a datetime with an offset ("2024-09-14T10:00:00.000-07:00")
+# dates without a time or offset are treated as utc
+def parse_event_time(value:str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo == None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+# cursors are opaque to clients, but are just the offset of the next result
+def encode_cursor(offset:int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor:str | None) -> int:
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        offset = int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if offset < 0:
+        raise ValueError("Invalid cursor.")
+    return offset
+
+def next_cursor(offset:int, limit:int, total:int) -> str | None:
+    if offset + limit >= total:
+        return None
+    return encode_cursor(offset + limit)
+
+
+class EventIndexes:
+    def __init__(self, container:LCSCEventContainer) -> None:
+        self.events = container.events # newest first, as sorted by the backend
+        self.by_id = {e.id: e for e in self.events}
+
+        self.by_semester:dict[str, list[LCSCEvent]] = {}
+        for e in self.events:
+            if e.semester:
+                self.by_semester.setdefault(e.semester.lower(), []).append(e)
+
+        # events with a start date, oldest first, with their start times alongside for binary searching
+        dated = [(parse_event_time(e.event_start_date), e) for e in self.events]
+        dated = sorted([d for d in dated if d[0] != None], key=lambda d: d[0])
+        self.start_times = [t for t, _ in dated]
+        self.by_start = [e for _, e in dated]
+
+    # returns (page of events, total number of matching events)
+    # events are sorted by start date, soonest first for upcoming events and newest first otherwise unless order is given
+    def query(self, semester:str | None = None, start_after:float | None = None, start_before:float | None = None,
+              when:str | None = None, order:str | None = None, offset:int = 0, limit:int = DEFAULT_LIMIT) -> tuple[list[LCSCEvent], int]:
+        if order == None:
+            order = "asc" if when == "upcoming" else "desc"
+
+        if start_after == None and start_before == None and when == None:
+            candidates = self.events if semester == None else self.by_semester.get(semester.lower(), [])
+            if order == "asc":
+                candidates = candidates[::-1]
+            return candidates[offset:offset + limit if limit != None else None], len(candidates)
+
+        lo, hi = 0, len(self.by_start)
+        if start_after != None:
+            lo = bisect_left(self.start_times, start_after)
+        if start_before != None:
+            hi = bisect_right(self.start_times, start_before)
+
+        now = datetime.now(timezone.utc).timestamp()
+        if when == "upcoming":
+            lo = max(lo, bisect_left(self.start_times, now))
+        elif when == "past":
+            hi = min(hi, bisect_left(self.start_times, now))
+        hi = max(lo, hi)
+
+        if semester != None:
+            semester = semester.lower()
+            candidates = [e for e in self.by_start[lo:hi] if e.semester and e.semester.lower() == semester]
+            if order == "desc":
+                candidates.reverse()
+            return candidates[offset:offset + limit if limit != None else None], len(candidates)
+
+        # no filtering needed, so only copy the requested page out of the index
+        total = hi - lo
+        if order == "asc":
+            return self.by_start[lo + offset:min(hi, lo + offset + limit)], total
+
+        end = hi - offset
+        start = max(lo, end - limit)
+        if end <= start:
+            return [], total
+        return self.by_start[start:end][::-1], total
+
+
+class ExecutiveIndexes:
+    def __init__(self, container:LCSCExecutiveContainer) -> None:
+        self.executives = container.executives # in the order the backend ranked them
+        self.by_id = {e.id: e for e in self.executives}
+
+        self.by_status:dict[str, list[LCSCExecutive]] = {}
+        self.by_role:dict[str, list[LCSCExecutive]] = {}
+        for e in self.executives:
+            if e.current_status:
+                self.by_status.setdefault(e.current_status.lower(), []).append(e)
+            for role in e.roles:
+                self.by_role.setdefault(role.lower(), []).append(e)
+
+    # returns (page of executives, total number of matching executives)
+    def query(self, status:str | None = None, role:str | None = None, exclude_status:str | None = None,
+              offset:int = 0, limit:int | None = DEFAULT_LIMIT) -> tuple[list[LCSCExecutive], int]:
+        candidates = self.executives
+        if role != None:
+            candidates = self.by_role.get(role.lower(), [])
+        if status != None:
+            by_status = self.by_status.get(status.lower(), [])
+            if role == None:
+                candidates = by_status
+            else:
+                ids = set(e.id for e in by_status)
+                candidates = [e for e in candidates if e.id in ids]
+        if exclude_status != None:
+            exclude_status = exclude_status.lower()
+            candidates = [e for e in candidates if (e.current_status or "").lower() != exclude_status]
+
+        return candidates[offset:offset + limit if limit != None else None], len(candidates)
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+# token bucket shared by every caller in the process
+# tokens refill at `rate` per second up to `burst`, and every call takes one token (waiting if there are none left)
+# pause() empties the bucket and holds every caller back, ie when the server answers 429 with a Retry-After
+class TokenBucket:
+    def __init__(self, rate:float, burst:float) -> None:
+        self.rate = rate
+        self.burst = burst
+
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            # no await between checking and taking the token, so this is safe without a lock on a single event loop
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds:float) -> None:
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
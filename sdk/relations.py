@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Any, Callable
+
+from notion_client import AsyncClient
+
+from sdk.models import RelatedPage, RelationCacheFile
+from sdk.notion_query import query_database
+from sdk.schema import Schema
+from sdk.store import get_store
+
+logger = logging.getLogger("lcsc.relations")
+
+# RELATED DATABASES
+# small databases other pages link to (roles, recurring events) are kept in a local lookup table
+# each one has its own change detection, so resolving a relation is a dict lookup instead of querying the whole database again
+
+class RelatedDatabase:
+    def __init__(
+        self,
+        name:str,                                                  # used to store the lookup table and in log messages, ie "roles"
+        database_id:str,
+        schema:Schema,
+        derive:Callable[[dict[str, Any]], dict[str, Any]] | None = None, # extra fields worked out once per page, ie a role's rank
+    ) -> None:
+        self.name = name
+        self.database_id = database_id
+        self.schema = schema
+        self.derive = derive
+        self._caches:dict[str, RelationCacheFile] = {} # data folder : lookup table
+
+    # the store's copy is read once per process and kept in memory
+    async def load(self, writeLocation:str) -> RelationCacheFile:
+        if writeLocation not in self._caches:
+            self._caches[writeLocation] = await asyncio.to_thread(get_store(writeLocation).load_related, self.name)
+        return self._caches[writeLocation]
+
+    async def save(self, writeLocation:str, cache:RelationCacheFile) -> None:
+        self._caches[writeLocation] = cache
+        await asyncio.to_thread(get_store(writeLocation).save_related, self.name, cache)
+
+    def extract(self, page:dict) -> RelatedPage:
+        row = self.schema.extract(page)
+        if self.derive:
+            row.update(self.derive(row))
+        return RelatedPage(last_edited_time=page["last_edited_time"], row=row)
+
+    # brings the lookup table up to date, returns whether anything in it changed
+    # a full refresh queries every page so deleted pages are noticed, otherwise only pages edited since the last check are asked for
+    async def refresh(self, notion:AsyncClient, writeLocation:str, full_sync:bool = False) -> bool:
+        await self.schema.prepare(notion, self.database_id)
+        cache = await self.load(writeLocation)
+        full_sync = full_sync or not cache.complete
+
+        if full_sync:
+            pages = {}
+            async for page in query_database(notion, self.database_id):
+                pages[page["id"]] = self.extract(page)
+            changed = pages != cache.pages
+        else:
+            pages = dict(cache.pages)
+            changed = False
+            async for page in query_database(notion, self.database_id, last_edited_after=cache.last_edited):
+                known = pages.get(page["id"])
+                if known == None or known.last_edited_time != page["last_edited_time"]:
+                    pages[page["id"]] = self.extract(page)
+                    changed = True
+
+        if changed or not cache.complete:
+            last_edited = max([p.last_edited_time for p in pages.values()] + [cache.last_edited])
+            await self.save(writeLocation, RelationCacheFile(complete=True, last_edited=last_edited, pages=pages))
+            if changed:
+                logger.info(f"{self.name.capitalize()} changed, {len(pages)} cached.")
+        return changed
+
+    # the lookup table as is, only queried if there's nothing cached yet
+    async def rows(self, notion:AsyncClient, writeLocation:str) -> dict[str, dict[str, Any]]:
+        if not (await self.load(writeLocation)).complete:
+            await self.refresh(notion, writeLocation, full_sync=True)
+        return {id: page.row for id, page in (await self.load(writeLocation)).pages.items()}
+
+    # rows for the given ids, refreshing once if any of them aren't cached yet (ie a page linked to a role made since the last check)
+    # ids that still aren't found are left out
+    async def resolve(self, notion:AsyncClient, writeLocation:str, ids:set[str]) -> dict[str, dict[str, Any]]:
+        rows = await self.rows(notion, writeLocation)
+        if ids - set(rows):
+            await self.refresh(notion, writeLocation)
+            rows = await self.rows(notion, writeLocation)
+            for id in ids - set(rows):
+                logger.warning(f"Linked page {id} isn't in the {self.name} database (or isn't shared with the integration).")
+        return rows
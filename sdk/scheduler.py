@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable
+
+from sdk.metrics import POLL_INTERVAL, SYNC_SECONDS, SYNCS
+
+logger = logging.getLogger("lcsc.scheduler")
+
+# runs one database's sync over and over on its own asyncio task
+# so a slow sync of one database never delays the others
+class SyncPipeline:
+    def __init__(
+        self,
+        name:str,                                   # used in log messages, ie "event" or "executive"
+        fetch:Callable[..., Awaitable[bool]],       # updateDataFromNotion, returns True if anything changed
+        interval:float,                             # seconds between the start of two syncs (the shortest interval if max_interval is set)
+        max_interval:float | None = None,           # if set, the interval grows towards this while nothing changes
+        backoff:float = 1.5,                        # how much the interval grows by each time
+        quiet_polls:int = 5,                        # how many syncs without changes before the interval starts growing
+        jitter:float = 0,                           # each sync starts up to this many seconds early / late
+        deadline:float | None = None,               # a sync taking longer than this is cancelled
+        full_sync_interval:float = 0,               # seconds between full syncs, 0 makes every sync a full sync
+        log_frequency:int = 20,                     # only log every nth "no updates" message
+        on_update:Callable[[], None] | None = None, # called after a sync that changed something
+    ) -> None:
+        self.name = name
+        self.fetch = fetch
+        self.interval = interval
+        self.max_interval = max_interval if max_interval != None else interval
+        self.backoff = backoff
+        self.quiet_polls = quiet_polls
+        self.jitter = jitter
+        self.deadline = deadline
+        self.full_sync_interval = full_sync_interval
+        self.log_frequency = log_frequency
+        self.on_update = on_update
+
+        # counted in time rather than syncs, because the adaptive interval stretches syncs out to up to max_interval apart
+        self.last_full_sync:float | None = None # time.monotonic() of the last full sync, None until the first one succeeds
+        self.log_count = log_frequency # so the first sync is logged
+        
+        self.current_interval = interval
+        self.polls_without_changes = 0
+        
+        # requests to sync before the next scheduled run (see trigger)
+        self._wake = asyncio.Event()
+        self._pending_pages:set[str] = set()
+        self._pending_database = False
+
+    # wakes the pipeline up to sync straight away, either just the given page or the whole database
+    def trigger(self, page_id:str | None = None) -> None:
+        if page_id == None:
+            self._pending_database = True
+        else:
+            self._pending_pages.add(page_id)
+        self._wake.set()
+
+    # runs a single sync, returns whether anything changed (None if the sync failed)
+    # page_ids limits the sync to those pages, these runs don't count towards full syncs or the adaptive interval
+    async def run_once(self, page_ids:list[str] | None = None) -> bool | None:
+        if page_ids:
+            logger.info(f"Syncing {len(page_ids)} changed {self.name} page(s).")
+            full_sync = False
+            kind = "targeted"
+        else:
+            if self.log_count >= self.log_frequency:
+                logger.info(f"Checking {self.name}s page for updates.")
+            full_sync = self.full_sync_due()
+            kind = "full" if full_sync else "incremental"
+
+        start = time.perf_counter()
+        try:
+            changed = await asyncio.wait_for(self.fetch(full_sync=full_sync, page_ids=page_ids), timeout=self.deadline)
+        except asyncio.TimeoutError:
+            logger.error(f"Syncing {self.name}s took longer than {self.deadline} seconds and was cancelled.")
+            SYNCS.inc(database=self.name, result="timeout")
+            self.last_full_sync = None # retry with a full sync
+            return None
+        except Exception as e:
+            logger.exception(f"Failed to sync {self.name}s: {e}")
+            SYNCS.inc(database=self.name, result="failed")
+            self.last_full_sync = None
+            return None
+        finally:
+            SYNC_SECONDS.observe(time.perf_counter() - start, database=self.name, kind=kind)
+
+        SYNCS.inc(database=self.name, result="changed" if changed else "unchanged")
+        if full_sync:
+            self.last_full_sync = time.monotonic()
+
+        if not page_ids:
+            self.adapt_interval(changed)
+            POLL_INTERVAL.set(self.current_interval, database=self.name)
+
+        if changed:
+            if self.on_update:
+                self.on_update()
+        else:
+            if self.log_count >= self.log_frequency:
+                logger.info(f"No new {self.name} updates found.")
+                self.log_count = 0
+            self.log_count += 1
+
+        return changed
+
+    def full_sync_due(self) -> bool:
+        return self.last_full_sync == None or time.monotonic() - self.last_full_sync >= self.full_sync_interval
+
+    # poll quickly while things are being edited, and back off during long quiet periods (ie overnight)
+    def adapt_interval(self, changed:bool) -> None:
+        if changed:
+            self.polls_without_changes = 0
+            if self.current_interval != self.interval:
+                logger.info(f"Changes found, checking {self.name}s every {self.interval} seconds again.")
+            self.current_interval = self.interval
+            return
+
+        self.polls_without_changes += 1
+        if self.polls_without_changes >= self.quiet_polls and self.current_interval < self.max_interval:
+            self.current_interval = min(self.max_interval, self.current_interval * self.backoff)
+            logger.debug(f"No changes for {self.polls_without_changes} checks, checking {self.name}s every {self.current_interval:.0f} seconds.")
+
+    # syncs every `current_interval` seconds forever, or sooner when triggered
+    # runs are scheduled from when the pipeline started, so the period doesn't drift by however long each sync takes
+    async def run_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
+
+        while True:
+            page_ids = None
+            if self._wake.is_set():
+                self._wake.clear()
+                if not self._pending_database:
+                    page_ids = sorted(self._pending_pages)
+                self._pending_pages = set()
+                self._pending_database = False
+
+            await self.run_once(page_ids)
+
+            next_run += self.current_interval
+            now = loop.time()
+            if next_run < now:
+                # the sync took longer than the interval, skip the runs we missed instead of running back to back
+                missed = int((now - next_run) // self.current_interval) + 1
+                next_run += missed * self.current_interval
+
+            delay = next_run - now + random.uniform(-self.jitter, self.jitter)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0, delay))
+                next_run = loop.time() # triggered, so the schedule starts over from now
+            except asyncio.TimeoutError:
+                pass
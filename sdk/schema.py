@@ -0,0 +1,149 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from notion_client import AsyncClient
+
+from sdk.notion_query import notion_call
+
+logger = logging.getLogger("lcsc.schema")
+
+# PROPERTY MAPPING
+# each database declares which notion columns it reads and which field each one ends up in
+# the declaration is checked against the database once (databases.retrieve) and compiled into one accessor per column,
+# so extracting a page is a flat loop instead of dispatching on every property's type
+
+def extract_title(property:dict) -> str | None:
+    return property["title"][0]["plain_text"] if property["title"] else None
+
+def extract_rich_text(property:dict) -> str | None:
+    return property["rich_text"][0]["plain_text"] if property["rich_text"] else None
+
+def extract_select(property:dict) -> str | None:
+    return property["select"]["name"] if property["select"] else None
+
+def extract_status(property:dict) -> str | None:
+    return property["status"]["name"] if property["status"] else None
+
+def extract_url(property:dict) -> str | None:
+    return property["url"]
+
+def extract_last_edited_time(property:dict) -> str | None:
+    return property["last_edited_time"]
+
+def extract_date(property:dict) -> tuple[str | None, str | None]:
+    if property["date"] == None:
+        return (None, None)
+    return (property["date"]["start"], property["date"]["end"])
+
+def extract_relation(property:dict) -> list[str]:
+    return [r["id"] for r in property["relation"]]
+
+# the first file as {"name", "url", "expiry_time"}, or None
+# files uploaded to notion have signed urls that expire, external files don't (expiry_time is None)
+def extract_files(property:dict) -> dict | None:
+    if not property["files"]:
+        return None
+    file = property["files"][0]
+    if "file" in file:
+        return {"name": file["name"], "url": file["file"]["url"], "expiry_time": file["file"].get("expiry_time")}
+    return {"name": file["name"], "url": file["external"]["url"], "expiry_time": None}
+
+EXTRACTORS:dict[str, Callable[[dict], Any]] = {
+    "title": extract_title,
+    "rich_text": extract_rich_text,
+    "select": extract_select,
+    "status": extract_status,
+    "url": extract_url,
+    "last_edited_time": extract_last_edited_time,
+    "date": extract_date,
+    "relation": extract_relation,
+    "files": extract_files,
+}
+
+# columns holding a single piece of text can be any of these in notion
+TEXT = ("title", "rich_text", "select", "status", "url")
+
+# what an optional column is filled in with when it's missing from the database
+DEFAULTS:dict[str, Callable[[], Any]] = {
+    "date": lambda: (None, None),
+    "relation": list,
+}
+
+# an accessor takes a page's properties and returns one field
+def accessor(notion_name:str, extractor:Callable[[dict], Any]) -> Callable[[dict], Any]:
+    return lambda properties: extractor(properties[notion_name])
+
+def missing(default:Callable[[], Any]) -> Callable[[dict], Any]:
+    return lambda properties: default()
+
+@dataclass
+class Column:
+    notion_name: str                 # name of the column in notion
+    field: str                       # key the value is stored under in the extracted row
+    types: tuple[str, ...] = TEXT    # notion property types this column may have
+    required: bool = True            # whether the sync should fail if the column is missing
+
+@dataclass
+class Schema:
+    name: str                        # used in error messages, ie "events"
+    columns: list[Column]
+    accessors: list[tuple[str, Callable[[dict], Any]]] | None = field(default=None, repr=False) # (field, accessor), set by compile
+
+    # checks the columns against the database's properties and picks the extractor for each one
+    def compile(self, properties:dict[str, dict]) -> None:
+        accessors = []
+        problems = []
+        for column in self.columns:
+            property = properties.get(column.notion_name)
+            if property == None:
+                if column.required:
+                    problems.append(f"column {column.notion_name!r} is missing")
+                else:
+                    logger.warning(f"Optional column {column.notion_name!r} is missing from the {self.name} database.")
+                    accessors.append((column.field, missing(DEFAULTS.get(column.types[0], lambda: None))))
+                continue
+
+            if property["type"] not in column.types or property["type"] not in EXTRACTORS:
+                problems.append(f"column {column.notion_name!r} is a {property['type']}, expected one of {', '.join(column.types)}")
+                continue
+            accessors.append((column.field, accessor(column.notion_name, EXTRACTORS[property["type"]])))
+
+        if problems:
+            raise Exception(f"The {self.name} database doesn't match what the sync expects: {'; '.join(problems)}.")
+        self.accessors = accessors
+
+    # compiles the schema from the live database the first time it's needed
+    async def prepare(self, notion:AsyncClient, database_id:str) -> None:
+        if self.accessors != None:
+            return
+        database = await notion_call(notion.databases.retrieve, database_id)
+        self.compile(database["properties"])
+
+    # returns field : value for one page
+    def extract(self, page:dict) -> dict[str, Any]:
+        if self.accessors == None:
+            raise Exception(f"The {self.name} schema has to be prepared before extracting pages.")
+
+        p = page["properties"]
+        try:
+            return {field: get(p) for field, get in self.accessors}
+        except (KeyError, TypeError) as e:
+            # a column was renamed or changed type since the schema was compiled, check the database again on the next sync
+            self.accessors = None
+            raise Exception(f"Page {page.get('id')} doesn't match the {self.name} schema ({e!r}), the database has probably changed.")
+
+    # a single field, for when only one column of a page is needed
+    def extract_field(self, page:dict, field:str) -> Any:
+        if self.accessors == None:
+            raise Exception(f"The {self.name} schema has to be prepared before extracting pages.")
+
+        get = next(get for f, get in self.accessors if f == field)
+        try:
+            return get(page["properties"])
+        except (KeyError, TypeError) as e:
+            self.accessors = None
+            raise Exception(f"Page {page.get('id')} doesn't match the {self.name} schema ({e!r}), the database has probably changed.")
+
+    def extract_all(self, pages:list[dict]) -> list[dict[str, Any]]:
+        return [self.extract(page) for page in pages]
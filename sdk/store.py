@@ -0,0 +1,479 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from os import environ
+from os.path import exists
+from typing import Any, Callable
+
+from pydantic import BaseModel
+
+from sdk.images import load_image_manifest, save_image_manifest
+from sdk.helpers import write_file_atomic
+from sdk.models import (
+    ImageManifest,
+    ImageManifestEntry,
+    LCSCEvent,
+    LCSCEventContainer,
+    LCSCExecutive,
+    LCSCExecutiveContainer,
+    RelationCacheFile
+)
+from sdk.queries import DEFAULT_LIMIT, parse_event_time
+
+logger = logging.getLogger("lcsc.store")
+
+# STORES
+# where the backend keeps what it synced between runs: events, executives, the related databases (roles, recurring events) and image manifests
+# the json store is the original layout (one file each, rewritten whole). the sqlite store keeps one row per record,
+# so a sync only writes the rows that changed and the api can query it without loading everything
+# either way the json exports are still written after every change, the api's /all routes, etags and streams are built on them
+
+STORE_KINDS = ["json", "sqlite"]
+SQLITE_FILE = "store.sqlite3" # inside the data folder
+
+def store_kind() -> str:
+    kind = environ.get("LCSC_STORE", "json").lower()
+    if kind not in STORE_KINDS:
+        raise Exception(f"Unknown LCSC_STORE {kind!r}, expected one of {', '.join(STORE_KINDS)}.")
+    return kind
+
+class Store(ABC):
+    @abstractmethod
+    def load_events(self) -> LCSCEventContainer | None:
+        ...
+
+    # container is the complete new export, changed / removed are the ids that differ from what was saved before
+    @abstractmethod
+    def save_events(self, container:LCSCEventContainer, changed:list[str], removed:list[str]) -> None:
+        ...
+
+    @abstractmethod
+    def load_executives(self) -> LCSCExecutiveContainer | None:
+        ...
+
+    @abstractmethod
+    def save_executives(self, container:LCSCExecutiveContainer, changed:list[str], removed:list[str]) -> None:
+        ...
+
+    # name is the related database's name, ie "roles"
+    @abstractmethod
+    def load_related(self, name:str) -> RelationCacheFile:
+        ...
+
+    @abstractmethod
+    def save_related(self, name:str, cache:RelationCacheFile) -> None:
+        ...
+
+    # name is the image folder, ie "event_images"
+    @abstractmethod
+    def load_manifest(self, name:str) -> ImageManifest:
+        ...
+
+    @abstractmethod
+    def save_manifest(self, name:str, manifest:ImageManifest) -> None:
+        ...
+
+
+def load_export(path:str, model:type[BaseModel]) -> Any:
+    if not exists(path):
+        return None
+    with open(path, "r") as fi:
+        data = fi.read()
+    if not data:
+        return None
+    try:
+        return model.model_validate_json(data)
+    except Exception as e:
+        logger.error(f"Failed to read existing local data at {path}: {e}")
+        return None
+
+class JSONStore(Store):
+    def __init__(self, writeLocation:str) -> None:
+        self.writeLocation = writeLocation
+
+    def load_events(self) -> LCSCEventContainer | None:
+        return load_export(f"{self.writeLocation}/json/events_export.json", LCSCEventContainer)
+
+    # nothing to do, the export the fetcher writes next (write_export) is the store
+    def save_events(self, container:LCSCEventContainer, changed:list[str], removed:list[str]) -> None:
+        pass
+
+    def load_executives(self) -> LCSCExecutiveContainer | None:
+        return load_export(f"{self.writeLocation}/json/execs_export.json", LCSCExecutiveContainer)
+
+    # same as save_events, persisted by write_export
+    def save_executives(self, container:LCSCExecutiveContainer, changed:list[str], removed:list[str]) -> None:
+        pass
+
+    def load_related(self, name:str) -> RelationCacheFile:
+        path = f"{self.writeLocation}/json/{name}_cache.json"
+        try:
+            with open(path, "r") as fi:
+                return RelationCacheFile.model_validate_json(fi.read())
+        except FileNotFoundError:
+            return RelationCacheFile()
+        except Exception as e:
+            logger.error(f"Failed to read the {name} cache, querying the database again: {e}")
+            return RelationCacheFile()
+
+    def save_related(self, name:str, cache:RelationCacheFile) -> None:
+        write_file_atomic(f"{self.writeLocation}/json/{name}_cache.json", cache.model_dump_json().encode("utf-8"))
+
+    def load_manifest(self, name:str) -> ImageManifest:
+        return load_image_manifest(f"{self.writeLocation}/json/{name}_manifest.json")
+
+    def save_manifest(self, name:str, manifest:ImageManifest) -> None:
+        save_image_manifest(manifest, f"{self.writeLocation}/json/{name}_manifest.json")
+
+
+# SQLITE
+# wal mode, so the api can read while the backend writes (both containers share the data volume on the same host)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,          -- order of the export, newest first (sparse, see assign_positions)
+    semester TEXT COLLATE NOCASE,
+    event_start_date TEXT,
+    start_time REAL,                    -- event_start_date as a timestamp, for date filters
+    last_edited_time TEXT NOT NULL,
+    data TEXT NOT NULL                  -- the event as json
+);
+CREATE INDEX IF NOT EXISTS events_position ON events (position);
+CREATE INDEX IF NOT EXISTS events_semester ON events (semester, position);
+CREATE INDEX IF NOT EXISTS events_event_start_date ON events (event_start_date);
+CREATE INDEX IF NOT EXISTS events_start_time ON events (start_time, position);
+
+CREATE TABLE IF NOT EXISTS executives (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,          -- order of the export, as ranked by the backend (sparse, see assign_positions)
+    current_status TEXT COLLATE NOCASE,
+    last_edited_time TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS executives_position ON executives (position);
+CREATE INDEX IF NOT EXISTS executives_current_status ON executives (current_status, position);
+
+CREATE TABLE IF NOT EXISTS executive_roles (
+    executive_id TEXT NOT NULL REFERENCES executives (id) ON DELETE CASCADE,
+    role TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (executive_id, role)
+);
+CREATE INDEX IF NOT EXISTS executive_roles_role ON executive_roles (role);
+
+-- pages of the related databases, ie roles and recurring events
+CREATE TABLE IF NOT EXISTS related_pages (
+    database TEXT NOT NULL,
+    id TEXT NOT NULL,
+    last_edited_time TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (database, id)
+);
+
+CREATE TABLE IF NOT EXISTS image_manifests (
+    manifest TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (manifest, filename)
+);
+
+-- export metadata and related database state, name : json
+CREATE TABLE IF NOT EXISTS metadata (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+def sqlite_path(writeLocation:str) -> str:
+    return f"{writeLocation}/{SQLITE_FILE}"
+
+POSITION_GAP = 1 << 20 # between neighbouring positions when they're spread out, so records can be inserted between them
+
+# positions only have to sort like the export, so they're spread out: changed and new records are given positions between
+# their neighbours' and every other record keeps its own (records that didn't change can't have changed order among themselves)
+# positions: id : position already saved, returns id : position for every record whose position has to be written
+def assign_positions(records:list, positions:dict[str, int], changed_ids:set[str]) -> dict[str, int]:
+    assigned:dict[str, int] = {}
+    pending:list[str] = [] # records waiting for a position, between `last` and the next record that keeps its own
+    last:int | None = None
+
+    def place(upper:int | None) -> bool:
+        if last == None and upper == None:
+            new = [i * POSITION_GAP for i in range(len(pending))]
+        elif last == None:
+            new = [upper - (len(pending) - i) * POSITION_GAP for i in range(len(pending))]
+        elif upper == None:
+            new = [last + (i + 1) * POSITION_GAP for i in range(len(pending))]
+        else:
+            step = (upper - last) // (len(pending) + 1)
+            if step == 0:
+                return False
+            new = [last + (i + 1) * step for i in range(len(pending))]
+        assigned.update(zip(pending, new))
+        pending.clear()
+        return True
+
+    for r in records:
+        position = positions.get(r.id)
+        if r.id in changed_ids or position == None or (last != None and position <= last):
+            pending.append(r.id)
+            continue
+        if pending and not place(position):
+            break
+        last = position
+    else:
+        if not pending or place(None):
+            return assigned
+
+    # no room left between two neighbours, spread every record out again
+    return {r.id: i * POSITION_GAP for i, r in enumerate(records)}
+
+def event_columns(e:LCSCEvent) -> dict[str, Any]:
+    return {"semester": e.semester, "event_start_date": e.event_start_date, "start_time": parse_event_time(e.event_start_date)}
+
+def executive_columns(e:LCSCExecutive) -> dict[str, Any]:
+    return {"current_status": e.current_status}
+
+class SQLiteStore(Store):
+    def __init__(self, writeLocation:str) -> None:
+        self.path = sqlite_path(writeLocation)
+        created = not exists(self.path)
+
+        # the fetchers call the store from worker threads (both databases at once), so the connection is shared behind a lock
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL") # safe in wal mode, a crash can only lose the last transaction
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+
+        # carry over what the json store already had, so switching doesn't mean downloading every image again
+        if created:
+            self.import_store(JSONStore(writeLocation))
+
+    def import_store(self, other:Store) -> None:
+        events = other.load_events()
+        if events != None:
+            self.save_events(events, [e.id for e in events.events], [])
+        executives = other.load_executives()
+        if executives != None:
+            self.save_executives(executives, [e.id for e in executives.executives], [])
+        for name in ["roles", "recurring_events"]:
+            related = other.load_related(name)
+            if related.complete:
+                self.save_related(name, related)
+        for name in ["event_images", "exec_images"]:
+            manifest = other.load_manifest(name)
+            if manifest.images:
+                self.save_manifest(name, manifest)
+        logger.info(f"Created {self.path} from the json store.")
+
+    def load_metadata(self, name:str) -> str | None:
+        row = self.connection.execute("SELECT data FROM metadata WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def load_records(self, table:str, metadata:str, container:type[BaseModel], field:str) -> Any:
+        meta = self.load_metadata(metadata)
+        if meta == None:
+            return None
+        rows = self.connection.execute(f"SELECT data FROM {table} ORDER BY position").fetchall()
+        return container.model_validate({"metadata": json.loads(meta), field: [json.loads(r[0]) for r in rows]})
+
+    # upserts the changed records and deletes the removed ones, the rest are only written if there was no room to place a new one
+    # all in one transaction, so readers see either the old or the new data
+    def save_records(self, table:str, metadata_name:str, metadata:BaseModel, records:list, changed:list[str], removed:list[str],
+                     columns:Callable[[Any], dict[str, Any]]) -> None:
+        changed_ids = set(changed)
+        with self.connection:
+            positions = dict(self.connection.execute(f"SELECT id, position FROM {table}").fetchall())
+
+            self.connection.executemany(f"DELETE FROM {table} WHERE id = ?", [(id,) for id in removed])
+
+            assigned = assign_positions(records, positions, changed_ids)
+            upserts = []
+            moves = []
+            for r in records:
+                if r.id in changed_ids or r.id not in positions:
+                    upserts.append((r, assigned[r.id]))
+                elif r.id in assigned and assigned[r.id] != positions[r.id]:
+                    moves.append((assigned[r.id], r.id))
+
+            if upserts:
+                names = list(columns(upserts[0][0]).keys())
+                placeholders = ", ".join(["?"] * (len(names) + 4))
+                updates = ", ".join(f"{n} = excluded.{n}" for n in names + ["position", "last_edited_time", "data"])
+                self.connection.executemany(
+                    f"INSERT INTO {table} (id, {', '.join(names)}, position, last_edited_time, data) VALUES ({placeholders}) "
+                    f"ON CONFLICT (id) DO UPDATE SET {updates}",
+                    [(r.id, *columns(r).values(), position, r.last_edited_time, r.model_dump_json()) for r, position in upserts],
+                )
+            self.connection.executemany(f"UPDATE {table} SET position = ? WHERE id = ?", moves)
+
+            if table == "executives":
+                for r, _ in upserts:
+                    self.connection.execute("DELETE FROM executive_roles WHERE executive_id = ?", (r.id,))
+                    self.connection.executemany("INSERT OR IGNORE INTO executive_roles (executive_id, role) VALUES (?, ?)", [(r.id, role) for role in r.roles])
+
+            self.connection.execute("INSERT OR REPLACE INTO metadata (name, data) VALUES (?, ?)", (metadata_name, metadata.model_dump_json()))
+
+    def load_events(self) -> LCSCEventContainer | None:
+        with self.lock:
+            return self.load_records("events", "events", LCSCEventContainer, "events")
+
+    def save_events(self, container:LCSCEventContainer, changed:list[str], removed:list[str]) -> None:
+        with self.lock:
+            self.save_records("events", "events", container.metadata, container.events, changed, removed, event_columns)
+
+    def load_executives(self) -> LCSCExecutiveContainer | None:
+        with self.lock:
+            return self.load_records("executives", "executives", LCSCExecutiveContainer, "executives")
+
+    def save_executives(self, container:LCSCExecutiveContainer, changed:list[str], removed:list[str]) -> None:
+        with self.lock:
+            self.save_records("executives", "executives", container.metadata, container.executives, changed, removed, executive_columns)
+
+    def load_related(self, name:str) -> RelationCacheFile:
+        with self.lock:
+            meta = self.load_metadata(f"related:{name}")
+            if meta == None:
+                return RelationCacheFile()
+            rows = self.connection.execute("SELECT id, last_edited_time, data FROM related_pages WHERE database = ?", (name,)).fetchall()
+            pages = {id: {"last_edited_time": edited, "row": json.loads(data)} for id, edited, data in rows}
+            return RelationCacheFile.model_validate({**json.loads(meta), "pages": pages})
+
+    def save_related(self, name:str, cache:RelationCacheFile) -> None:
+        with self.lock:
+            previous = self.load_related(name).pages
+            with self.connection:
+                self.connection.executemany("DELETE FROM related_pages WHERE database = ? AND id = ?", [(name, id) for id in previous if id not in cache.pages])
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO related_pages (database, id, last_edited_time, data) VALUES (?, ?, ?, ?)",
+                    [(name, id, page.last_edited_time, json.dumps(page.row)) for id, page in cache.pages.items() if previous.get(id) != page],
+                )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO metadata (name, data) VALUES (?, ?)",
+                    (f"related:{name}", cache.model_dump_json(exclude={"pages"})),
+                )
+
+    def load_manifest(self, name:str) -> ImageManifest:
+        with self.lock:
+            rows = self.connection.execute("SELECT filename, data FROM image_manifests WHERE manifest = ?", (name,)).fetchall()
+            return ImageManifest(images={filename: ImageManifestEntry.model_validate_json(data) for filename, data in rows})
+
+    def save_manifest(self, name:str, manifest:ImageManifest) -> None:
+        with self.lock:
+            previous = self.load_manifest(name).images
+            with self.connection:
+                self.connection.executemany("DELETE FROM image_manifests WHERE manifest = ? AND filename = ?", [(name, f) for f in previous if f not in manifest.images])
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO image_manifests (manifest, filename, data) VALUES (?, ?, ?)",
+                    [(name, f, entry.model_dump_json()) for f, entry in manifest.images.items() if previous.get(f) != entry],
+                )
+
+
+_stores:dict[tuple[str, str], Store] = {}
+
+# one store per data folder for the lifetime of the process
+def get_store(writeLocation:str) -> Store:
+    kind = store_kind()
+    key = (kind, os.path.abspath(writeLocation))
+    if key not in _stores:
+        _stores[key] = SQLiteStore(writeLocation) if kind == "sqlite" else JSONStore(writeLocation)
+    return _stores[key]
+
+
+# READING (api)
+# every thread gets its own read only connection, so requests run in the threadpool can query at the same time
+
+class SQLiteReader:
+    def __init__(self, path:str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection | None:
+        connection = getattr(self._local, "connection", None)
+        if connection == None:
+            if not exists(self.path):
+                return None # the backend hasn't synced yet
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            connection.execute("PRAGMA query_only=ON")
+            self._local.connection = connection
+        return connection
+
+    # same arguments and results as EventIndexes.query, or None if the backend hasn't created the database yet
+    def query_events(self, semester:str | None = None, start_after:float | None = None, start_before:float | None = None,
+                     when:str | None = None, order:str | None = None, offset:int = 0, limit:int | None = DEFAULT_LIMIT) -> tuple[list[LCSCEvent], int] | None:
+        if order == None:
+            order = "asc" if when == "upcoming" else "desc"
+
+        where = []
+        params:list[Any] = []
+        if semester != None:
+            where.append("semester = ?")
+            params.append(semester)
+
+        if start_after == None and start_before == None and when == None:
+            # every event in the export's order, newest first
+            order_by = "position DESC" if order == "asc" else "position"
+        else:
+            where.append("start_time IS NOT NULL")
+            if start_after != None:
+                where.append("start_time >= ?")
+                params.append(start_after)
+            if start_before != None:
+                where.append("start_time <= ?")
+                params.append(start_before)
+            now = datetime.now(timezone.utc).timestamp()
+            if when == "upcoming":
+                where.append("start_time >= ?")
+                params.append(now)
+            elif when == "past":
+                where.append("start_time < ?")
+                params.append(now)
+            order_by = "start_time, position" if order == "asc" else "start_time DESC, position DESC"
+
+        return self.query("events", LCSCEvent, where, params, order_by, offset, limit)
+
+    # same arguments and results as ExecutiveIndexes.query, or None if the backend hasn't created the database yet
+    def query_executives(self, status:str | None = None, role:str | None = None, exclude_status:str | None = None,
+                         offset:int = 0, limit:int | None = DEFAULT_LIMIT) -> tuple[list[LCSCExecutive], int] | None:
+        where = []
+        params:list[Any] = []
+        if status != None:
+            where.append("current_status = ?")
+            params.append(status)
+        if role != None:
+            where.append("id IN (SELECT executive_id FROM executive_roles WHERE role = ?)")
+            params.append(role)
+        if exclude_status != None:
+            where.append("(current_status IS NULL OR current_status != ?)")
+            params.append(exclude_status)
+
+        return self.query("executives", LCSCExecutive, where, params, "position", offset, limit)
+
+    def query(self, table:str, model:type[BaseModel], where:list[str], params:list[Any], order_by:str, offset:int, limit:int | None) -> tuple[list, int] | None:
+        connection = self.connection()
+        if connection == None:
+            return None
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+        # one read transaction, so the page and the total come from the same version of the data
+        try:
+            with connection:
+                connection.execute("BEGIN")
+                if connection.execute("SELECT 1 FROM metadata WHERE name = ?", (table,)).fetchone() == None:
+                    return None
+                total = connection.execute(f"SELECT COUNT(*) FROM {table} {clause}", params).fetchone()[0]
+                rows = connection.execute(
+                    f"SELECT data FROM {table} {clause} ORDER BY {order_by} LIMIT ? OFFSET ?",
+                    params + [limit if limit != None else -1, offset],
+                ).fetchall()
+        except sqlite3.OperationalError as e:
+            # ie the backend is still creating the tables
+            logger.error(f"Failed to query {table}: {e}")
+            return None
+        return [model.model_validate_json(r[0]) for r in rows], total
@@ -0,0 +1,106 @@
+import hashlib
+import hmac
+import logging
+import os
+import time
+import uuid
+from typing import Literal
+
+from pydantic import BaseModel
+
+from sdk.helpers import create_folder_if_not_existing, write_file_atomic
+
+logger = logging.getLogger("lcsc.queue")
+
+# SYNC QUEUE
+# the api and the backend run in different containers and only share the data volume,
+# so sync requests are handed over as small files in a folder on that volume
+
+QUEUE_FOLDER = "queue" # inside the data folder
+
+class SyncRequest(BaseModel):
+    database: Literal["events", "executives"]
+    page_id: str | None = None  # None means the whole database should be checked
+    reason: str = ""            # for log messages, ie the webhook event type
+
+def enqueue_sync(queue_folder:str, request:SyncRequest) -> None:
+    create_folder_if_not_existing(queue_folder)
+
+    # names sort by time, so requests are handled in the order they arrived
+    name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.json"
+    write_file_atomic(os.path.join(queue_folder, name), request.model_dump_json().encode("utf-8"))
+
+# reads and removes every queued request
+def drain_queue(queue_folder:str) -> list[SyncRequest]:
+    try:
+        names = sorted(n for n in os.listdir(queue_folder) if n.endswith(".json"))
+    except FileNotFoundError:
+        return []
+
+    requests = []
+    for name in names:
+        path = os.path.join(queue_folder, name)
+        try:
+            with open(path, "r") as fi:
+                requests.append(SyncRequest.model_validate_json(fi.read()))
+        except Exception as e:
+            logger.error(f"Ignoring unreadable sync request {name}: {e}")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    return requests
+
+# WEBHOOKS
+# turns a notion webhook event into the sync it calls for (or None if it isn't about one of our databases)
+# https://developers.notion.com/reference/webhooks-events-delivery
+def sync_request_from_webhook(event:dict) -> SyncRequest | None:
+    # imported here so reading the queue doesn't pull in the notion / image code
+    from sdk.fetch_events import EVENTS_DB_ID, RECURRING_EVENTS_LIST_DB_ID
+    from sdk.fetch_execs import EXECUTIVES_DB_ID, ROLES_DB_ID
+    from sdk.notion_query import normalize_id
+
+    # pages can be synced one by one, changes to the lookup databases (recurring events, roles) affect every page
+    page_databases = {
+        normalize_id(EVENTS_DB_ID): "events",
+        normalize_id(EXECUTIVES_DB_ID): "executives",
+    }
+    lookup_databases = {
+        normalize_id(RECURRING_EVENTS_LIST_DB_ID): "events",
+        normalize_id(ROLES_DB_ID): "executives",
+    }
+
+    # anything that isn't shaped like notion's events is ignored rather than trusted
+    entity = as_dict(event.get("entity"))
+    parent = as_dict(as_dict(event.get("data")).get("parent"))
+    event_type = str(event.get("type", ""))
+
+    if entity.get("type") == "database":
+        database_id = entity.get("id")
+    else:
+        # pages and data sources both name the database they belong to as their parent
+        database_id = parent.get("id")
+    if not database_id or not isinstance(database_id, str):
+        return None
+    database_id = normalize_id(database_id)
+
+    if database_id in page_databases and entity.get("type") == "page" and isinstance(entity.get("id"), str):
+        return SyncRequest(database=page_databases[database_id], page_id=entity.get("id"), reason=event_type)
+    if database_id in page_databases:
+        return SyncRequest(database=page_databases[database_id], reason=event_type)
+    if database_id in lookup_databases:
+        return SyncRequest(database=lookup_databases[database_id], reason=event_type)
+    return None
+
+def as_dict(value) -> dict:
+    return value if isinstance(value, dict) else {}
+
+# notion signs each webhook with the verification token it sent when the subscription was set up
+def notion_signature(secret:str, body:bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+def verify_notion_signature(secret:str, body:bytes, signature:str | None) -> bool:
+    if not signature:
+        return False
+    return hmac.compare_digest(notion_signature(secret, body), signature)
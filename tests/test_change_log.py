@@ -0,0 +1,79 @@
+import asyncio
+
+from sdk.change_log import ChangeLogReader, changes_since, covers, diff_records, load_change_log, record_changes
+from sdk.models import ChangeLog
+from tests.test_export_store import make_event
+
+
+def test_diff_records():
+    old = [make_event("a"), make_event("b"), make_event("c")]
+    edited = make_event("b").model_copy(update={"event_name": "renamed"})
+    assert diff_records(old, [old[0], edited, make_event("d")]) == (["b", "d"], ["c"])
+    assert diff_records(old, old) == ([], [])
+
+def test_record_changes(tmp_path):
+    path = str(tmp_path / "changes.json")
+    assert record_changes(path, ["a", "b"], []) == 1
+    assert record_changes(path, ["a"], ["b"]) == 2
+
+    log = load_change_log(path)
+    assert (log.version, log.oldest_version) == (2, 0)
+    assert changes_since(log, 0, 2) == (["a"], ["b"])
+    assert changes_since(log, 1, 2) == (["a"], ["b"])
+    assert changes_since(log, 0, 1) == (["a", "b"], [])
+    assert changes_since(log, 2, 2) == ([], [])
+
+def test_ids_are_ordered_by_last_change(tmp_path):
+    path = str(tmp_path / "changes.json")
+    record_changes(path, ["a", "b", "c"], [])
+    record_changes(path, ["a"], [])
+    assert changes_since(load_change_log(path), 0, 2) == (["b", "c", "a"], [])
+
+def test_trimming_drops_whole_versions(tmp_path):
+    path = str(tmp_path / "changes.json")
+    record_changes(path, ["a", "b"], [], size=4)
+    record_changes(path, ["c", "d"], [], size=4)
+    record_changes(path, ["e"], [], size=4)
+
+    log = load_change_log(path)
+    assert [e.version for e in log.entries] == [2, 2, 3]
+    assert log.oldest_version == 1
+    assert changes_since(log, 1, 3) == (["c", "d", "e"], [])
+
+def test_log_behind_the_export_starts_over(tmp_path):
+    path = str(tmp_path / "changes.json")
+    record_changes(path, ["a"], [])
+    assert record_changes(path, ["b"], [], export_version=7) == 8
+
+    log = load_change_log(path)
+    assert (log.version, log.oldest_version) == (8, 7)
+    assert [e.id for e in log.entries] == ["b"]
+
+def test_unreadable_log_starts_over(tmp_path):
+    path = tmp_path / "changes.json"
+    path.write_text("not json")
+    assert load_change_log(str(path)) == ChangeLog()
+    assert record_changes(str(path), ["a"], []) == 1
+
+def test_since_cutoff():
+    log = ChangeLog(version=10, oldest_version=4)
+    assert covers(log, 4, 10)
+    assert covers(log, 10, 10)
+    assert not covers(log, 3, 10)  # trimmed, the api answers 410
+    assert not covers(log, 11, 10) # from the future
+    assert not covers(None, 4, 10)
+
+def test_reader_rereads_only_when_needed(tmp_path, monkeypatch):
+    path = str(tmp_path / "changes.json")
+    record_changes(path, ["a"], [])
+    reader = ChangeLogReader(path, check_interval=float("inf"))
+    loads = []
+    monkeypatch.setattr(reader, "get", lambda get=reader.get: loads.append(1) or get())
+
+    assert asyncio.run(reader.get_async(1)).version == 1
+    record_changes(path, ["b"], [])
+    # within the check interval the cached log is enough for the export it covers
+    assert asyncio.run(reader.get_async(1)).version == 1
+    # but a newer export means the newer log is on disk
+    assert asyncio.run(reader.get_async(2)).version == 2
+    assert len(loads) == 2
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+from sdk.export_store import ExportStore
+from sdk.models import EventPageMetadata, LCSCEvent, LCSCEventContainer
+
+
+def make_event(id:str) -> LCSCEvent:
+    return LCSCEvent(
+        event_name=f"Event {id}", semester="2024 Fall", event_date=None, event_start_date="2024-09-01", event_end_date=None,
+        location=None, thumbnail=None, registration_link=None, information_link=None, id=id, last_edited_time="2024-08-01T00:00:00.000Z",
+    )
+
+def write_export(path, ids:list[str], last_checked:str = "2024-08-02T00:00:00.000Z") -> None:
+    container = LCSCEventContainer(
+        metadata=EventPageMetadata(events_last_edited="2024-08-01T00:00:00.000Z", last_checked=last_checked),
+        events=[make_event(id) for id in ids],
+    )
+    path.write_text(container.model_dump_json())
+
+
+def test_get_async_loads_new_exports_off_the_event_loop(tmp_path):
+    path = tmp_path / "events_export.json"
+    write_export(path, ["a", "b"])
+
+    loaded_on = []
+    def build_indexes(container):
+        loaded_on.append(threading.current_thread())
+        return {e.id for e in container.events}
+    store = ExportStore(str(path), LCSCEventContainer, build_indexes, check_interval=0, records=lambda c: c.events)
+
+    async def main():
+        first = await store.get_async()
+        write_export(path, ["a"], last_checked="2024-08-03T00:00:00.000Z")
+        second = await store.get_async()
+        unchanged = await store.get_async()
+        return threading.current_thread(), first, second, unchanged
+
+    loop_thread, first, second, unchanged = asyncio.run(main())
+
+    assert first.indexes == {"a", "b"}
+    assert second.indexes == {"a"}
+    assert unchanged is second
+    assert second.changes == (first.etag, [], ["b"])
+    assert len(loaded_on) == 2 and loop_thread not in loaded_on
+
+
+def test_get_async_keeps_serving_the_last_good_export(tmp_path):
+    path = tmp_path / "events_export.json"
+    write_export(path, ["a"])
+    store = ExportStore(str(path), LCSCEventContainer, check_interval=0)
+
+    good = asyncio.run(store.get_async())
+    path.write_text("{not json")
+
+    assert asyncio.run(store.get_async()) is good
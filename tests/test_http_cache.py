@@ -0,0 +1,55 @@
+from sdk.export_store import ExportStore
+from sdk.http_cache import encoded_etag, etag_matches, is_not_modified, iso_to_http_date
+from sdk.models import LCSCEventContainer
+
+from tests.test_export_store import write_export
+
+ETAG = '"abc123"'
+LAST_MODIFIED = "Fri, 02 Aug 2024 00:00:00 GMT"
+
+
+def test_etag_matching():
+    assert etag_matches('"abc123"', ETAG)
+    assert etag_matches('W/"abc123"', ETAG)
+    assert etag_matches('"other", "abc123-br"', ETAG) # compressed copies are the same content
+    assert etag_matches("*", ETAG)
+    assert not etag_matches('"abc"', ETAG)
+    assert not etag_matches('"abc1234"', ETAG)
+
+def test_encoded_etag():
+    assert encoded_etag(ETAG, None) == ETAG
+    assert encoded_etag(ETAG, "gzip") == '"abc123-gzip"'
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    # a current If-Modified-Since doesn't save a stale etag
+    assert not is_not_modified({"if-none-match": '"old"', "if-modified-since": LAST_MODIFIED}, ETAG, LAST_MODIFIED)
+    # and an old If-Modified-Since doesn't override a matching etag
+    assert is_not_modified({"if-none-match": ETAG, "if-modified-since": "Thu, 01 Jan 2015 00:00:00 GMT"}, ETAG, LAST_MODIFIED)
+
+def test_if_modified_since():
+    assert is_not_modified({"if-modified-since": LAST_MODIFIED}, ETAG, LAST_MODIFIED)
+    assert is_not_modified({"if-modified-since": "Sat, 03 Aug 2024 00:00:00 GMT"}, ETAG, LAST_MODIFIED)
+    assert not is_not_modified({"if-modified-since": "Thu, 01 Aug 2024 23:59:59 GMT"}, ETAG, LAST_MODIFIED)
+    assert not is_not_modified({"if-modified-since": "not a date"}, ETAG, LAST_MODIFIED)
+    assert not is_not_modified({"if-modified-since": LAST_MODIFIED}, ETAG, None)
+    assert not is_not_modified({}, ETAG, LAST_MODIFIED)
+
+def test_iso_to_http_date():
+    assert iso_to_http_date("2024-08-02T00:00:00.000Z") == LAST_MODIFIED
+    assert iso_to_http_date("") == None
+    assert iso_to_http_date("yesterday") == None
+
+def test_deleted_page_is_modified_since(tmp_path):
+    path = tmp_path / "events_export.json"
+    write_export(path, ["a", "b"], last_checked="2024-08-02T00:00:00.000Z")
+    store = ExportStore(str(path), LCSCEventContainer, check_interval=0)
+    before = store.get()
+    headers = {"if-modified-since": before.last_modified}
+    assert is_not_modified(headers, before.etag, before.last_modified)
+
+    # deleting a page edits nothing, so the newest last_edited_time stays the same, but the export is rewritten
+    write_export(path, ["a"], last_checked="2024-08-05T00:00:00.000Z")
+    after = store.get()
+
+    assert after.etag != before.etag
+    assert not is_not_modified(headers, after.etag, after.last_modified)
@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta, timezone
+
+from sdk.ical import calendar_path, escape_text, fold, parse_frequency, render_vevent, update_calendar
+from sdk.models import LCSCEvent
+
+
+def event(id:str, name:str, start:str | None, end:str | None = None, semester:str | None = "2024 Fall", **fields) -> LCSCEvent:
+    return LCSCEvent(**{
+        "event_name": name, "semester": semester, "event_date": None, "event_start_date": start, "event_end_date": end, "location": None,
+        "thumbnail": None, "registration_link": None, "information_link": None, "id": id, "last_edited_time": "2024-08-01T12:00:00.000Z",
+        **fields,
+    })
+
+def unfold(text:str) -> list[str]:
+    return text.replace("\r\n ", "").split("\r\n")
+
+
+def test_fold_multibyte_line():
+    line = "SUMMARY:" + "é" * 40 + "漢字" * 20
+    folded = fold(line)
+
+    physical = folded.split("\r\n")
+    assert len(physical) > 1
+    assert all(len(p.encode("utf-8")) <= 75 for p in physical)
+    assert all(p.startswith(" ") for p in physical[1:])
+    assert folded.replace("\r\n ", "") == line
+
+def test_short_lines_are_not_folded():
+    assert fold("SUMMARY:" + "a" * 67) == "SUMMARY:" + "a" * 67
+
+def test_escaping():
+    assert escape_text("a,b;c\\d") == "a\\,b\\;c\\\\d"
+    assert escape_text("one\r\ntwo\nthree") == "one\\ntwo\\nthree"
+
+    vevent = render_vevent(
+        event("e1", "Games, snacks; fun", "2024-09-05", location="Room\n101", registration_link="https://example.com/r"),
+        "e1@lcsc", date(2024, 9, 5), None,
+    )
+    lines = unfold(vevent)
+    assert "SUMMARY:Games\\, snacks\\; fun" in lines
+    assert "LOCATION:Room\\n101" in lines
+    assert "DESCRIPTION:Register: https://example.com/r" in lines
+    assert "DTSTART;VALUE=DATE:20240905" in lines
+    assert "DTEND;VALUE=DATE:20240906" in lines # all day events end the next day
+
+def test_weekly_series_expansion(tmp_path):
+    events = [
+        event("a", "Club Night", "2024-08-29T18:00:00.000-07:00", "2024-08-29T20:00:00.000-07:00"),
+        event("b", "Club Night", "2024-09-05T18:00:00.000-07:00", "2024-09-05T20:00:00.000-07:00"),
+        event("c", "Club Night", "2024-09-19T18:00:00.000-07:00", semester="2025 Spring"), # already in notion, not generated again
+        event("d", "Orientation", "2024-09-01"),
+    ]
+    recurring = {"r1": {"event_name": " club night ", "frequency": "Weekly"}}
+    assert parse_frequency("Weekly") == timedelta(weeks=1)
+
+    (tmp_path / "json").mkdir()
+    update_calendar(str(tmp_path), events, recurring)
+    with open(calendar_path(str(tmp_path)), newline="") as fi:
+        lines = unfold(fi.read())
+
+    # the latest of the series (c) is the one repeated, every week for 120 days
+    uids = [l.removeprefix("UID:") for l in lines if l.startswith("UID:")]
+    generated = [u for u in uids if u.startswith("c-")]
+    assert len(generated) == 17
+    assert generated[0] == "c-20240926@lcsc" and generated[-1] == "c-20250116@lcsc"
+    assert set(uids) - set(generated) == {"a@lcsc", "b@lcsc", "c@lcsc", "d@lcsc"}
+
+    first = lines.index("UID:c-20240926@lcsc")
+    start = datetime(2024, 9, 27, 1, tzinfo=timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    assert lines[first + 3] == f"DTSTART:{start}"
+
+    # each semester gets its own feed
+    with open(calendar_path(str(tmp_path), "2024 Fall"), newline="") as fi:
+        fall = fi.read()
+    assert "UID:a@lcsc" in fall and "UID:c-" not in fall
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from sdk.image_cache import ImageCache, parse_range
+from sdk.image_index import ImageIndex
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=10-", (10, 99)),
+    ("bytes=90-200", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    (" Bytes=5-5 ", (5, 5)),
+    ("bytes=0-", (0, 99)),
+    ("bytes=100-", "unsatisfiable"),
+    ("bytes=-0", "unsatisfiable"),
+    ("bytes=0-1,5-9", None),
+    ("bytes=9-5", None),
+    ("bytes=a-b", None),
+    ("bytes=5", None),
+    ("items=0-9", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+def images(folder, sizes:dict[str, int]) -> ImageIndex:
+    for name, size in sizes.items():
+        with open(os.path.join(folder, name), "wb") as fo:
+            fo.write(name[0].encode() * size)
+    index = ImageIndex(str(folder))
+    index.refresh()
+    return index
+
+def test_least_recently_used_is_evicted(tmp_path):
+    index = images(tmp_path, {"a.png": 40, "b.png": 40, "c.png": 40})
+    a, b, c = (index.get(name) for name in ["a.png", "b.png", "c.png"])
+    cache = ImageCache(max_bytes=100)
+
+    assert cache.load(a) == b"a" * 40
+    cache.load(b)
+    assert cache.get(a) != None # a is now the most recently used
+    cache.load(c)
+
+    assert cache.size == 80
+    assert cache.get(b) == None
+    assert cache.get(a) != None and cache.get(c) != None
+
+def test_large_images_are_not_cached(tmp_path):
+    index = images(tmp_path, {"a.png": 10, "b.png": 60})
+    cache = ImageCache(max_bytes=100, max_object_bytes=50)
+    assert cache.cacheable(index.get("a.png"))
+    assert not cache.cacheable(index.get("b.png"))
+
+def test_replaced_image_is_read_again(tmp_path):
+    index = images(tmp_path, {"a.png": 10})
+    cache = ImageCache(max_bytes=100)
+    old = index.get("a.png")
+    cache.load(old)
+
+    with open(tmp_path / "new.tmp", "wb") as fo:
+        fo.write(b"x" * 20)
+    os.replace(tmp_path / "new.tmp", tmp_path / "a.png")
+
+    # the listing it was loaded from is stale, so it isn't cached
+    assert cache.load(old) == None
+    index.refresh()
+    new = index.get("a.png")
+    assert cache.get(new) == None
+    assert cache.size == 0
+    assert cache.load(new) == b"x" * 20
+
+def test_deleted_image_is_not_loaded(tmp_path):
+    index = images(tmp_path, {"a.png": 10})
+    cache = ImageCache(max_bytes=100)
+    os.remove(tmp_path / "a.png")
+    assert cache.load(index.get("a.png")) == None
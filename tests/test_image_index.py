@@ -0,0 +1,73 @@
+import asyncio
+import os
+
+from sdk.image_index import ImageIndex, open_listed
+
+
+def write(path, data:bytes) -> None:
+    with open(path, "wb") as fo:
+        fo.write(data)
+
+def stale_index(folder) -> ImageIndex:
+    # never lists the folder again on its own, like an index between two checks
+    index = ImageIndex(str(folder), check_interval=float("inf"))
+    index.refresh()
+    return index
+
+
+def test_unchanged_file_is_opened(tmp_path):
+    write(tmp_path / "a.png", b"image")
+    index = stale_index(tmp_path)
+    fi = open_listed(index.get("a.png"))
+    with fi:
+        assert fi.read() == b"image"
+
+def test_replaced_file_is_not_opened(tmp_path):
+    write(tmp_path / "a.png", b"old")
+    index = stale_index(tmp_path)
+    listed = index.get("a.png")
+
+    write(tmp_path / "new.tmp", b"replaced")
+    os.replace(tmp_path / "new.tmp", tmp_path / "a.png")
+    assert open_listed(listed) == None
+
+    # picked again from a fresh listing, with headers for the new file
+    asyncio.run(index.update(force=True))
+    file = index.get("a.png")
+    assert file.stat.st_size == len(b"replaced")
+    assert file.etag != listed.etag
+    with open_listed(file) as fi:
+        assert fi.read() == b"replaced"
+
+def test_deleted_file_is_not_found(tmp_path):
+    write(tmp_path / "a.png", b"image")
+    index = stale_index(tmp_path)
+    listed = index.get("a.png")
+
+    os.remove(tmp_path / "a.png")
+    assert open_listed(listed) == None
+    assert index.get("a.png") != None # not until the folder is listed again
+
+    asyncio.run(index.update(force=True))
+    assert index.get("a.png") == None
+
+def test_deleted_variant_falls_back_to_the_original(tmp_path):
+    write(tmp_path / "a.png", b"image")
+    write(tmp_path / "a-full.webp", b"variant")
+    index = stale_index(tmp_path)
+    assert index.pick("a.png", None, "image/webp")[0].path.endswith("a-full.webp")
+
+    os.remove(tmp_path / "a-full.webp")
+    asyncio.run(index.update(force=True))
+    file, is_variant = index.pick("a.png", None, "image/webp")
+    assert file.path.endswith("a.png") and not is_variant
+
+def test_update_waits_for_the_interval(tmp_path):
+    index = ImageIndex(str(tmp_path), check_interval=60)
+    asyncio.run(index.update())
+    write(tmp_path / "a.png", b"image")
+
+    asyncio.run(index.update())
+    assert index.get("a.png") == None
+    asyncio.run(index.update(force=True))
+    assert index.get("a.png") != None
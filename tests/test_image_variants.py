@@ -0,0 +1,73 @@
+import os
+
+from PIL import Image
+
+from sdk.helpers import VARIANT_FORMATS, image_variant_filename
+from sdk.image_index import ImageIndex, accepted_media_types
+from sdk.images import ImageJob, compress_image
+
+
+def save_download(folder, name, image, **kwargs):
+    downloaded = os.path.join(folder, f"{name}.part")
+    image.save(downloaded, **kwargs)
+    return ImageJob(url=f"https://files.example/{name}", path=os.path.join(folder, name), label=name, notion_name=name), downloaded
+
+
+def test_animated_image_keeps_its_frames(tmp_path):
+    frames = [Image.new("RGB", (64, 48), color) for color in [(255, 0, 0), (0, 255, 0), (0, 0, 255)]]
+    job, downloaded = save_download(tmp_path, "a.gif", frames[0], format="GIF", save_all=True, append_images=frames[1:], duration=100, loop=0)
+
+    entry = compress_image(job, downloaded)
+
+    assert entry.compressed
+    assert not os.path.exists(downloaded)
+    with Image.open(job.path) as saved:
+        assert saved.n_frames == 3
+    with Image.open(tmp_path / image_variant_filename("a.gif", None, "webp")) as full:
+        assert full.is_animated and full.n_frames == 3
+
+
+def test_large_image_is_capped_and_gets_width_variants(tmp_path):
+    job, downloaded = save_download(tmp_path, "b.jpg", Image.new("RGB", (3000, 1500), (10, 20, 30)), format="JPEG")
+
+    compress_image(job, downloaded)
+
+    with Image.open(job.path) as saved:
+        assert saved.size == (2000, 1000)
+    names = set(os.listdir(tmp_path))
+    for format in VARIANT_FORMATS:
+        assert {f"b-160w.{format}", f"b-1280w.{format}", f"b-full.{format}"} <= names
+    assert {"b-160w.jpg", "b-1280w.jpg"} <= names
+    assert "b-full.jpg" not in names
+
+
+def test_width_is_honoured_without_modern_formats(tmp_path):
+    job, downloaded = save_download(tmp_path, "c.png", Image.new("RGBA", (800, 400), (0, 0, 0, 0)), format="PNG")
+    compress_image(job, downloaded)
+    index = ImageIndex(str(tmp_path), check_interval=0)
+
+    file, is_variant = index.pick("c.png", 160, "image/png,image/*")
+    assert is_variant and os.path.basename(file.path) == "c-160w.png"
+
+    file, is_variant = index.pick("c.png", 160, "image/webp")
+    assert is_variant and os.path.basename(file.path) == "c-160w.webp"
+
+    # wider than any resized copy, the original is the best fit
+    file, is_variant = index.pick("c.png", 2000, "image/png")
+    assert not is_variant and os.path.basename(file.path) == "c.png"
+
+
+def test_accept_header_q_values():
+    assert accepted_media_types("image/avif,image/webp,image/*,*/*;q=0.8") == {"image/avif", "image/webp", "image/*", "*/*"}
+    assert accepted_media_types("image/avif;q=0, image/webp; q=0.5") == {"image/webp"}
+    assert accepted_media_types("Image/WebP;level=1;q=0.000") == set()
+    assert accepted_media_types("image/webp;q=oops") == set()
+    assert accepted_media_types("") == set()
+
+def test_refused_format_is_not_picked(tmp_path):
+    for name in ["d.png", "d-full.webp", "d-full.avif"]:
+        (tmp_path / name).write_bytes(b"image")
+    index = ImageIndex(str(tmp_path))
+
+    assert index.pick("d.png", None, "image/avif;q=0,image/webp")[0].path.endswith("d-full.webp")
+    assert index.pick("d.png", None, "image/avif;q=0,image/webp;q=0")[0].path.endswith("d.png")
@@ -0,0 +1,56 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import sdk.images as images
+from sdk.images import ImageJob, download_image
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b"x" * 1024
+        raise httpx.ReadError("connection dropped")
+
+
+def use_transport(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(images, "get_http_client", lambda: client)
+    monkeypatch.setattr(images, "DOWNLOAD_BACKOFF", 0)
+
+
+def test_download_keeps_part_file_until_compressed(tmp_path, monkeypatch):
+    use_transport(monkeypatch, lambda request: httpx.Response(200, content=b"image"))
+    job = ImageJob(url="https://files.example/a.png", path=str(tmp_path / "a.png"), label="a", notion_name="a.png")
+
+    downloaded = asyncio.run(download_image(job))
+
+    assert downloaded == f"{job.path}.part"
+    assert open(downloaded, "rb").read() == b"image"
+    assert not os.path.exists(job.path)
+
+
+def test_failed_download_leaves_no_part_file(tmp_path, monkeypatch):
+    use_transport(monkeypatch, lambda request: httpx.Response(200, stream=BrokenStream()))
+    job = ImageJob(url="https://files.example/a.png", path=str(tmp_path / "a.png"), label="a", notion_name="a.png")
+
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(download_image(job))
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_gives_up_after_retries(tmp_path, monkeypatch):
+    calls = []
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+    use_transport(monkeypatch, handler)
+    job = ImageJob(url="https://files.example/a.png", path=str(tmp_path / "a.png"), label="a", notion_name="a.png")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(download_image(job))
+
+    assert len(calls) == images.DOWNLOAD_RETRIES + 1
+    assert os.listdir(tmp_path) == []
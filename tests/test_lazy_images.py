@@ -0,0 +1,109 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import sdk.lazy_images as lazy_images
+from sdk.image_index import ImageIndex
+from sdk.lazy_images import LazyImages, save_image_sources
+from sdk.models import ImageSource, ImageSourceList
+from sdk.sync_queue import drain_queue
+
+NAME = "page-1.png"
+
+
+def source(url:str, expires_in:timedelta | None = timedelta(hours=1)) -> ImageSource:
+    expiry_time = None if expires_in == None else (datetime.now(timezone.utc) + expires_in).isoformat()
+    return ImageSource(page_id="page-1", url=url, expiry_time=expiry_time, notion_name="photo.png", compress=False)
+
+def lazy(tmp_path, image_source:ImageSource) -> LazyImages:
+    folder = tmp_path / "event_images"
+    folder.mkdir()
+    sources_path = str(tmp_path / "event_images_sources.json")
+    save_image_sources(ImageSourceList(images={NAME: image_source}), sources_path)
+    # never lists the folder again on its own, like an index between two checks
+    index = ImageIndex(str(folder), check_interval=float("inf"))
+    index.refresh()
+    return LazyImages(index, sources_path, "events", str(tmp_path / "queue"))
+
+@pytest.fixture
+def downloads(monkeypatch):
+    urls = []
+
+    async def download_image(job):
+        urls.append(job.url)
+        await asyncio.sleep(0.01)
+        with open(f"{job.path}.part", "wb") as fo:
+            fo.write(job.url.encode())
+        return f"{job.path}.part"
+
+    monkeypatch.setattr(lazy_images, "download_image", download_image)
+    monkeypatch.setattr(lazy_images, "compress_image", lambda job, downloaded: os.replace(downloaded, job.path))
+    return urls
+
+
+def test_concurrent_requests_fetch_once(tmp_path, downloads):
+    images = lazy(tmp_path, source("https://files/photo.png?sig=1"))
+
+    async def requests():
+        await asyncio.gather(*(images.ensure(NAME) for _ in range(5)))
+    asyncio.run(requests())
+
+    assert downloads == ["https://files/photo.png?sig=1"]
+    assert images.index.get(NAME) != None
+
+def test_image_saved_since_listing_is_not_fetched(tmp_path, downloads):
+    images = lazy(tmp_path, source("https://files/photo.png?sig=1"))
+    # ie saved by another worker, the index hasn't listed the folder since
+    with open(os.path.join(images.index.folder, NAME), "wb") as fo:
+        fo.write(b"image")
+
+    asyncio.run(images.ensure(NAME))
+    assert downloads == []
+    assert images.index.get(NAME) != None
+
+def test_failed_fetch_backs_off(tmp_path, monkeypatch):
+    images = lazy(tmp_path, source("https://files/photo.png?sig=1"))
+    attempts = []
+
+    async def download_image(job):
+        attempts.append(job.url)
+        raise Exception("connection reset")
+    monkeypatch.setattr(lazy_images, "download_image", download_image)
+
+    asyncio.run(images.ensure(NAME))
+    asyncio.run(images.ensure(NAME))
+    # not tried again straight away, and the api answers 503 since the image does exist in notion
+    assert attempts == ["https://files/photo.png?sig=1"]
+    assert images.index.get(NAME) == None
+    assert asyncio.run(images.has_source(NAME))
+
+    monkeypatch.setattr(lazy_images, "FAILURE_BACKOFF", 0)
+    asyncio.run(images.ensure(NAME))
+    assert len(attempts) == 2
+
+def test_expired_url_is_refreshed_through_the_queue(tmp_path, downloads, monkeypatch):
+    monkeypatch.setattr(lazy_images, "REFRESH_POLL", 0.01)
+    images = lazy(tmp_path, source("https://files/photo.png?sig=old", expires_in=timedelta(minutes=-5)))
+
+    async def backend():
+        # stands in for the backend: handles the queued sync by recording a freshly signed url
+        while not (requests := drain_queue(images.queue_folder)):
+            await asyncio.sleep(0.01)
+        assert requests[0].database == "events" and requests[0].page_id == "page-1"
+        save_image_sources(ImageSourceList(images={NAME: source("https://files/photo.png?sig=new")}), images.sources_path)
+
+    async def run():
+        await asyncio.gather(images.ensure(NAME), backend())
+    asyncio.run(run())
+
+    assert downloads == ["https://files/photo.png?sig=new"]
+    with open(os.path.join(images.index.folder, NAME), "rb") as fi:
+        assert fi.read() == b"https://files/photo.png?sig=new"
+
+def test_unknown_image_is_not_fetched(tmp_path, downloads):
+    images = lazy(tmp_path, source("https://files/photo.png?sig=1"))
+    asyncio.run(images.ensure("page-2.png"))
+    assert downloads == []
+    assert not asyncio.run(images.has_source("page-2.png"))
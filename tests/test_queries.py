@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from sdk.models import EventPageMetadata, ExecPageMetadata, LCSCEvent, LCSCEventContainer, LCSCExecutive, LCSCExecutiveContainer
+from sdk.queries import EventIndexes, ExecutiveIndexes, decode_cursor, encode_cursor, next_cursor, parse_event_time
+
+
+def event(id:str, start:str | None, semester:str | None = "2024 Fall") -> LCSCEvent:
+    return LCSCEvent(
+        event_name=id, semester=semester, event_date=None, event_start_date=start, event_end_date=None, location=None,
+        thumbnail=None, registration_link=None, information_link=None, id=id, last_edited_time="2024-01-01T00:00:00.000Z",
+    )
+
+def executive(id:str, status:str | None, roles:list[str]) -> LCSCExecutive:
+    return LCSCExecutive(
+        name=id, pronouns=None, profile_picture=None, social_media_links={}, bio=None, roles=roles, prior_roles=[],
+        first_term=None, last_term=None, current_status=status, id=id, last_edited_time="2024-01-01T00:00:00.000Z",
+    )
+
+def event_indexes(events:list[LCSCEvent]) -> EventIndexes:
+    # the backend sorts newest first
+    events = sorted(events, key=lambda e: e.event_start_date or "", reverse=True)
+    return EventIndexes(LCSCEventContainer(metadata=EventPageMetadata(events_last_edited="", last_checked=""), events=events))
+
+def ids(records) -> list[str]:
+    return [r.id for r in records]
+
+
+def test_cursor_round_trip():
+    for offset in [0, 1, 50, 12345]:
+        assert decode_cursor(encode_cursor(offset)) == offset
+    assert "=" not in encode_cursor(1)
+    assert decode_cursor(None) == 0
+    assert decode_cursor("") == 0
+
+@pytest.mark.parametrize("cursor", ["not a cursor!", encode_cursor(-5), "YWJj"])
+def test_invalid_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_next_cursor():
+    assert decode_cursor(next_cursor(0, 50, 120)) == 50
+    assert next_cursor(100, 50, 120) == None
+    assert next_cursor(70, 50, 120) == None
+
+def test_parse_event_time():
+    assert parse_event_time("2024-09-14") == datetime(2024, 9, 14, tzinfo=timezone.utc).timestamp()
+    assert parse_event_time("2024-09-14T10:00:00.000-07:00") == datetime(2024, 9, 14, 17, tzinfo=timezone.utc).timestamp()
+    assert parse_event_time(None) == None
+    assert parse_event_time("soon") == None
+
+
+def test_events_by_semester_and_order():
+    indexes = event_indexes([
+        event("a", "2024-09-01"), event("b", "2024-10-01"), event("c", "2025-01-10", "2025 Spring"), event("d", None),
+    ])
+
+    page, total = indexes.query(semester="2024 FALL")
+    assert (ids(page), total) == (["b", "a", "d"], 3)
+    page, total = indexes.query(semester="2024 fall", order="asc")
+    assert ids(page) == ["d", "a", "b"]
+    assert indexes.query(semester="1999 Fall") == ([], 0)
+
+def test_events_date_range_and_pages():
+    indexes = event_indexes([event(str(day), f"2024-09-{day:02}") for day in range(1, 11)])
+    after, before = parse_event_time("2024-09-03"), parse_event_time("2024-09-07")
+
+    page, total = indexes.query(start_after=after, start_before=before, order="asc", offset=0, limit=2)
+    assert (ids(page), total) == (["3", "4"], 5)
+    page, total = indexes.query(start_after=after, start_before=before, order="asc", offset=4, limit=2)
+    assert ids(page) == ["7"]
+    page, total = indexes.query(start_after=after, start_before=before, offset=0, limit=2)
+    assert (ids(page), total) == (["7", "6"], 5)
+    page, total = indexes.query(start_after=after, start_before=before, offset=4, limit=2)
+    assert ids(page) == ["3"]
+    assert indexes.query(start_after=after, start_before=before, offset=10, limit=2) == ([], 5)
+
+def test_upcoming_and_past_events():
+    now = datetime.now(timezone.utc)
+    days = lambda n: (now + timedelta(days=n)).isoformat()
+    indexes = event_indexes([event("past", days(-3)), event("soon", days(1)), event("later", days(5)), event("other", days(2), "2025 Spring")])
+
+    assert ids(indexes.query(when="upcoming")[0]) == ["soon", "other", "later"]
+    assert ids(indexes.query(when="upcoming", semester="2024 Fall")[0]) == ["soon", "later"]
+    assert ids(indexes.query(when="past")[0]) == ["past"]
+
+
+def test_executive_filters():
+    executives = [
+        executive("a", "Active", ["President"]),
+        executive("b", "Active", ["Director of Tech"]),
+        executive("c", "Retired", ["Director of Tech"]),
+        executive("d", None, []),
+    ]
+    indexes = ExecutiveIndexes(LCSCExecutiveContainer(metadata=ExecPageMetadata(execs_last_edited="", last_checked=""), executives=executives))
+
+    assert ids(indexes.query(status="active")[0]) == ["a", "b"]
+    assert ids(indexes.query(role="director of tech")[0]) == ["b", "c"]
+    assert ids(indexes.query(role="Director of Tech", status="Retired")[0]) == ["c"]
+    assert ids(indexes.query(exclude_status="active")[0]) == ["c", "d"]
+    assert indexes.query(offset=1, limit=2) == (executives[1:3], 4)
+    assert indexes.query(limit=None) == (executives, 4)
@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import pytest
+
+from sdk import fetch_execs, notion_query
+from sdk.relations import RelatedDatabase
+from sdk.schema import Column, Schema
+
+DATABASE_ID = "roles-db"
+
+
+def text(type:str, value:str | None) -> dict:
+    return {"type": type, type: [{"plain_text": value}] if value else []}
+
+def role_page(n:int, name:str, edited:str = "2024-01-01T00:00:00.000Z") -> dict:
+    return {"id": f"role-{n}", "last_edited_time": edited, "properties": {"Name": text("title", name)}}
+
+# answers databases.retrieve / databases.query from in memory pages, including the last edited filter incremental syncs send
+class FakeNotion:
+    def __init__(self, databases:dict[str, list[dict]]) -> None:
+        self.databases = self
+        self.pages = databases
+        self.queries:list[tuple[str, str | None]] = [] # (database, on_or_after)
+
+    async def retrieve(self, database_id:str) -> dict:
+        pages = self.pages[database_id]
+        return {"properties": {name: {"type": p["type"]} for name, p in pages[0]["properties"].items()} if pages else {}}
+
+    async def query(self, database_id:str, page_size:int, filter:dict | None = None, start_cursor:str | None = None) -> dict:
+        since = filter["last_edited_time"]["on_or_after"] if filter else None
+        self.queries.append((database_id, since))
+        results = [p for p in self.pages[database_id] if since == None or p["last_edited_time"] >= since]
+        return {"results": results, "has_more": False, "next_cursor": None}
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    async def acquire() -> None:
+        pass
+    monkeypatch.setattr(notion_query.notion_limiter, "acquire", acquire)
+
+def roles_database(write_location) -> RelatedDatabase:
+    (write_location / "json").mkdir(exist_ok=True)
+    return RelatedDatabase("roles", DATABASE_ID, Schema("roles", [Column("Name", "name")]), derive=lambda row: {"loud": row["name"].upper()})
+
+
+def test_refresh_detects_changes(tmp_path):
+    roles = [role_page(1, "President"), role_page(2, "Treasurer")]
+    notion = FakeNotion({DATABASE_ID: roles})
+    related = roles_database(tmp_path)
+
+    async def run():
+        assert await related.refresh(notion, str(tmp_path))
+        assert not await related.refresh(notion, str(tmp_path))
+
+        roles[1] = role_page(2, "Secretary", edited="2024-02-01T00:00:00.000Z")
+        assert await related.refresh(notion, str(tmp_path))
+        return await related.rows(notion, str(tmp_path))
+    rows = asyncio.run(run())
+
+    assert rows["role-2"] == {"name": "Secretary", "loud": "SECRETARY"}
+    # the first refresh pulls everything, later ones only what was edited since
+    assert notion.queries == [(DATABASE_ID, None), (DATABASE_ID, "2024-01-01T00:00:00.000Z"), (DATABASE_ID, "2024-01-01T00:00:00.000Z")]
+    # and the lookup table is saved for the next run
+    with open(tmp_path / "json" / "roles_cache.json") as fi:
+        assert json.load(fi)["last_edited"] == "2024-02-01T00:00:00.000Z"
+
+def test_full_refresh_notices_deleted_pages(tmp_path):
+    roles = [role_page(1, "President"), role_page(2, "Treasurer")]
+    notion = FakeNotion({DATABASE_ID: roles})
+    related = roles_database(tmp_path)
+
+    async def run():
+        await related.refresh(notion, str(tmp_path))
+        del roles[1]
+        assert not await related.refresh(notion, str(tmp_path)) # an incremental refresh can't tell
+        assert await related.refresh(notion, str(tmp_path), full_sync=True)
+        return await related.rows(notion, str(tmp_path))
+    assert set(asyncio.run(run())) == {"role-1"}
+
+def test_resolve_requeries_on_cache_miss(tmp_path):
+    roles = [role_page(1, "President")]
+    notion = FakeNotion({DATABASE_ID: roles})
+    related = roles_database(tmp_path)
+
+    async def run():
+        await related.refresh(notion, str(tmp_path))
+        queries = len(notion.queries)
+
+        # everything cached, notion isn't asked
+        assert set(await related.resolve(notion, str(tmp_path), {"role-1"})) == {"role-1"}
+        assert len(notion.queries) == queries
+
+        # a role made since the last check is fetched, one that doesn't exist is left out after a single retry
+        roles.append(role_page(2, "Treasurer", edited="2024-03-01T00:00:00.000Z"))
+        rows = await related.resolve(notion, str(tmp_path), {"role-1", "role-2", "role-9"})
+        assert set(rows) == {"role-1", "role-2"}
+        assert len(notion.queries) == queries + 1
+    asyncio.run(run())
+
+
+def exec_page(n:int, role_ids:list[str], edited:str = "2024-01-01T00:00:00.000Z") -> dict:
+    properties = {name: text("rich_text", None) for name in ["Pronouns", "Bio", "LinkedIn", "Instagram", "Github", "Website", "Term Start", "Last Term", "Status"]}
+    properties.update({
+        "Name": text("title", f"Exec {n}"),
+        "Candid": {"type": "files", "files": []},
+        "Role": {"type": "relation", "relation": [{"id": id} for id in role_ids]},
+        "Prior Roles": {"type": "relation", "relation": []},
+    })
+    return {"id": f"exec-{n}", "last_edited_time": edited, "properties": properties}
+
+def test_renamed_role_re_extracts_every_executive(tmp_path, monkeypatch):
+    monkeypatch.setenv("NOTION_API_TOKEN", "test")
+    monkeypatch.delenv("LCSC_STORE", raising=False)
+    monkeypatch.delenv("IMAGE_MODE", raising=False)
+    for folder in ["json", "exec_images"]:
+        (tmp_path / folder).mkdir()
+
+    roles = [role_page(1, "President"), role_page(2, "Director of Tech")]
+    executives = [exec_page(1, ["role-1"]), exec_page(2, ["role-2"])]
+    notion = FakeNotion({fetch_execs.ROLES_DB_ID: roles, fetch_execs.EXECUTIVES_DB_ID: executives})
+    monkeypatch.setattr(fetch_execs, "get_notion_client", lambda: notion)
+
+    def export() -> dict[str, list[str]]:
+        with open(tmp_path / "json" / "execs_export.json") as fi:
+            return {e["name"]: e["roles"] for e in json.load(fi)["executives"]}
+
+    async def run():
+        await fetch_execs.updateDataFromNotion(str(tmp_path))
+        assert export() == {"Exec 1": ["President"], "Exec 2": ["Director of Tech"]}
+
+        # neither executive's page changed, only the role they link to
+        roles[1] = role_page(2, "Tech Lead", edited="2024-02-01T00:00:00.000Z")
+        notion.queries.clear()
+        assert await fetch_execs.updateDataFromNotion(str(tmp_path), full_sync=False)
+        assert export() == {"Exec 1": ["President"], "Exec 2": ["Tech Lead"]}
+        # so the executives were queried in full rather than since the last edit
+        assert (fetch_execs.EXECUTIVES_DB_ID, None) in notion.queries
+    asyncio.run(run())
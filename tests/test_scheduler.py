@@ -0,0 +1,58 @@
+import asyncio
+
+from sdk import scheduler
+from sdk.scheduler import SyncPipeline
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def pipeline(results:list) -> tuple[SyncPipeline, list]:
+    calls = []
+    async def fetch(full_sync:bool, page_ids:list[str] | None = None) -> bool:
+        calls.append(full_sync)
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return SyncPipeline("event", fetch, interval=60, full_sync_interval=3600), calls
+
+
+def test_full_syncs_follow_elapsed_time(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    sync, calls = pipeline([False] * 5)
+
+    async def run():
+        await sync.run_once()
+        clock.now += 1800
+        await sync.run_once()
+        clock.now += 1799
+        await sync.run_once()
+        clock.now += 1
+        await sync.run_once()
+        await sync.run_once(page_ids=["a"])
+    asyncio.run(run())
+
+    assert calls == [True, False, False, True, False]
+
+def test_failed_sync_retries_with_full_sync(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    sync, calls = pipeline([False, Exception("notion is down"), False, False])
+
+    async def run():
+        await sync.run_once()
+        clock.now += 60
+        assert await sync.run_once() == None
+        clock.now += 60
+        await sync.run_once()
+        clock.now += 60
+        await sync.run_once()
+    asyncio.run(run())
+
+    assert calls == [True, False, True, False]
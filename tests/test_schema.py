@@ -0,0 +1,104 @@
+import pytest
+
+from sdk.schema import Column, Schema
+
+
+PROPERTIES = {
+    "Name": {"type": "title"},
+    "Status": {"type": "status"},
+    "Date": {"type": "date"},
+    "Photo": {"type": "files"},
+    "Roles": {"type": "relation"},
+}
+
+def schema() -> Schema:
+    return Schema("people", [
+        Column("Name", "name"),
+        Column("Status", "status"),
+        Column("Date", "date", types=("date",)),
+        Column("Photo", "photo", types=("files",)),
+        Column("Roles", "roles", types=("relation",), required=False),
+        Column("Team", "teams", types=("relation",), required=False),
+        Column("Pronouns", "pronouns", required=False),
+    ])
+
+def page(**properties) -> dict:
+    return {"id": "page-1", "properties": {
+        "Name": {"type": "title", "title": [{"plain_text": "Ada"}, {"plain_text": " ignored"}]},
+        "Status": {"type": "status", "status": {"name": "Active"}},
+        "Date": {"type": "date", "date": {"start": "2024-09-14", "end": None}},
+        "Photo": {"type": "files", "files": []},
+        "Roles": {"type": "relation", "relation": [{"id": "r1"}, {"id": "r2"}]},
+        **properties,
+    }}
+
+
+def test_extract():
+    s = schema()
+    s.compile(PROPERTIES)
+    assert s.extract(page()) == {
+        "name": "Ada", "status": "Active", "date": ("2024-09-14", None), "photo": None,
+        "roles": ["r1", "r2"], "teams": [], "pronouns": None,
+    }
+    assert s.extract_field(page(), "roles") == ["r1", "r2"]
+
+def test_empty_values():
+    s = schema()
+    s.compile(PROPERTIES)
+    row = s.extract(page(
+        Name={"type": "title", "title": []},
+        Status={"type": "status", "status": None},
+        Date={"type": "date", "date": None},
+        Roles={"type": "relation", "relation": []},
+    ))
+    assert (row["name"], row["status"], row["date"], row["roles"]) == (None, None, (None, None), [])
+
+def test_files():
+    s = schema()
+    s.compile(PROPERTIES)
+    uploaded = {"name": "a.png", "file": {"url": "https://files/a.png?sig", "expiry_time": "2024-09-14T10:00:00.000Z"}}
+    external = {"name": "b.jpg", "external": {"url": "https://example.com/b.jpg"}}
+
+    assert s.extract_field(page(Photo={"type": "files", "files": [uploaded, external]}), "photo") == {
+        "name": "a.png", "url": "https://files/a.png?sig", "expiry_time": "2024-09-14T10:00:00.000Z",
+    }
+    assert s.extract_field(page(Photo={"type": "files", "files": [external]}), "photo") == {
+        "name": "b.jpg", "url": "https://example.com/b.jpg", "expiry_time": None,
+    }
+
+def test_text_columns_accept_any_text_type():
+    s = schema()
+    s.compile({**PROPERTIES, "Status": {"type": "select"}, "Pronouns": {"type": "rich_text"}})
+    row = s.extract(page(
+        Status={"type": "select", "select": {"name": "Retired"}},
+        Pronouns={"type": "rich_text", "rich_text": [{"plain_text": "she/her"}]},
+    ))
+    assert (row["status"], row["pronouns"]) == ("Retired", "she/her")
+
+def test_compile_reports_every_problem():
+    s = schema()
+    properties = {k: v for k, v in PROPERTIES.items() if k != "Name"}
+    properties["Date"] = {"type": "rich_text"}
+    with pytest.raises(Exception) as e:
+        s.compile(properties)
+    assert "'Name' is missing" in str(e.value)
+    assert "'Date' is a rich_text, expected one of date" in str(e.value)
+    assert s.accessors == None
+
+def test_extract_before_compile():
+    with pytest.raises(Exception, match="prepared"):
+        schema().extract(page())
+
+def test_changed_database_resets_the_schema():
+    s = schema()
+    s.compile(PROPERTIES)
+    properties = page()["properties"]
+    del properties["Status"]
+    with pytest.raises(Exception, match="page-1"):
+        s.extract({"id": "page-1", "properties": properties})
+    assert s.accessors == None
+
+    s.compile(PROPERTIES)
+    with pytest.raises(Exception, match="page-1"):
+        s.extract_field(page(Roles={"type": "relation", "relation": None}), "roles")
+    assert s.accessors == None
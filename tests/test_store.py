@@ -0,0 +1,91 @@
+import sqlite3
+
+import pytest
+
+from sdk import store as store_module
+from sdk.change_log import diff_records
+from sdk.models import EventPageMetadata, LCSCEventContainer
+from sdk.store import SQLiteReader, SQLiteStore, assign_positions, sqlite_path
+from tests.test_export_store import make_event
+
+
+def container(events) -> LCSCEventContainer:
+    return LCSCEventContainer(metadata=EventPageMetadata(events_last_edited="", last_checked=""), events=events)
+
+def dated(id:str, day:int, semester:str = "2024 Fall"):
+    return make_event(id).model_copy(update={"event_start_date": f"2024-09-{day:02}", "semester": semester})
+
+# saves the events in the order given (newest first, like the backend), with whatever differs from what's saved now
+def save(store:SQLiteStore, events:list) -> None:
+    previous = store.load_events()
+    changed, removed = diff_records(previous.events if previous else [], events)
+    store.save_events(container(events), changed, removed)
+
+def positions(store:SQLiteStore) -> dict[str, int]:
+    return dict(store.connection.execute("SELECT id, position FROM events").fetchall())
+
+
+def test_upsert_and_delete(tmp_path):
+    store = SQLiteStore(str(tmp_path))
+    assert store.load_events() == None
+
+    save(store, [dated("c", 3), dated("b", 2), dated("a", 1)])
+    edited = dated("b", 2).model_copy(update={"event_name": "renamed"})
+    save(store, [dated("d", 4), edited, dated("a", 1)])
+
+    loaded = store.load_events().events
+    assert [e.id for e in loaded] == ["d", "b", "a"]
+    assert loaded[1].event_name == "renamed"
+    assert store.connection.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 3
+
+def test_inserting_only_writes_new_rows(tmp_path):
+    store = SQLiteStore(str(tmp_path))
+    events = [dated(str(day), day) for day in range(20, 0, -1)]
+    save(store, events)
+    before = positions(store)
+
+    # a new newest event, and one in the middle
+    events = [dated("new", 28)] + events[:10] + [dated("middle", 10)] + events[10:]
+    save(store, events)
+    after = positions(store)
+
+    assert [e.id for e in store.load_events().events] == [e.id for e in events]
+    assert {id: after[id] for id in before} == before
+
+def test_positions_are_spread_out_again_when_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, "POSITION_GAP", 2)
+    store = SQLiteStore(str(tmp_path))
+    events = [dated("b", 20), dated("a", 1)]
+    save(store, events)
+
+    for day in range(2, 8):
+        events.insert(1, dated(f"x{day}", day))
+        save(store, events)
+        assert [e.id for e in store.load_events().events] == [e.id for e in events]
+
+def test_assign_positions():
+    records = [make_event(id) for id in ["a", "b", "c"]]
+    assert assign_positions(records, {}, set()) == {"a": 0, "b": 1 << 20, "c": 2 << 20}
+    # unchanged records keep their positions, a changed one moves between its new neighbours
+    assert assign_positions(records, {"a": 10, "b": 0, "c": 30}, {"b"}) == {"b": 20}
+    assert assign_positions(records[1:], {"b": 5, "c": 6}, set()) == {}
+
+
+def test_reader_sees_committed_writes(tmp_path):
+    store = SQLiteStore(str(tmp_path))
+    assert store.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    reader = SQLiteReader(sqlite_path(str(tmp_path)))
+    assert reader.query_events() == None # nothing synced yet
+
+    save(store, [dated("b", 2), dated("a", 1, semester="2024 Spring")])
+    events, total = reader.query_events(semester="2024 fall")
+    assert ([e.id for e in events], total) == (["b"], 1)
+
+    # the reader keeps its connection open, every query sees the latest commit
+    save(store, [dated("c", 3), dated("b", 2), dated("a", 1, semester="2024 Spring")])
+    events, total = reader.query_events(order="asc")
+    assert ([e.id for e in events], total) == (["a", "b", "c"], 3)
+
+    # and it can't write
+    with pytest.raises(sqlite3.OperationalError):
+        reader.connection().execute("DELETE FROM events")
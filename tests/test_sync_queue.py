@@ -0,0 +1,62 @@
+import pytest
+
+from sdk.fetch_events import EVENTS_DB_ID, RECURRING_EVENTS_LIST_DB_ID
+from sdk.fetch_execs import EXECUTIVES_DB_ID
+from sdk.sync_queue import SyncRequest, drain_queue, enqueue_sync, notion_signature, sync_request_from_webhook, verify_notion_signature
+
+SECRET = "secret_abc"
+BODY = b'{"type": "page.content_updated"}'
+
+
+def test_signatures():
+    signature = notion_signature(SECRET, BODY)
+    assert signature.startswith("sha256=")
+    assert verify_notion_signature(SECRET, BODY, signature)
+
+    assert not verify_notion_signature(SECRET, BODY + b" ", signature)
+    assert not verify_notion_signature("secret_other", BODY, signature)
+    assert not verify_notion_signature(SECRET, BODY, signature.removeprefix("sha256="))
+    assert not verify_notion_signature(SECRET, BODY, None)
+    assert not verify_notion_signature(SECRET, BODY, "")
+
+
+def test_page_event():
+    event = {
+        "type": "page.properties_updated",
+        "entity": {"id": "page-1", "type": "page"},
+        "data": {"parent": {"id": "0260157b-f43c-4c96-aefe-c1764d428030", "type": "database"}},
+    }
+    assert sync_request_from_webhook(event) == SyncRequest(database="events", page_id="page-1", reason="page.properties_updated")
+
+def test_database_events():
+    event = {"type": "database.schema_updated", "entity": {"id": EXECUTIVES_DB_ID.upper(), "type": "database"}}
+    assert sync_request_from_webhook(event) == SyncRequest(database="executives", reason="database.schema_updated")
+
+    # a recurring event changing affects every event
+    event = {"type": "page.created", "entity": {"id": "page-2", "type": "page"}, "data": {"parent": {"id": RECURRING_EVENTS_LIST_DB_ID}}}
+    assert sync_request_from_webhook(event) == SyncRequest(database="events", reason="page.created")
+
+@pytest.mark.parametrize("event", [
+    {},
+    {"entity": {"id": "page-1", "type": "page"}, "data": {"parent": {"id": "somewhere-else"}}},
+    {"entity": "page", "data": ["parent"]},
+    {"entity": {"type": "database", "id": 12}},
+    {"data": {"parent": "0260157bf43c4c96aefec1764d428030"}},
+])
+def test_unrelated_or_malformed_events(event):
+    assert sync_request_from_webhook(event) == None
+
+def test_page_event_without_page_id_syncs_database():
+    event = {"type": "page.deleted", "entity": {"id": None, "type": "page"}, "data": {"parent": {"id": EVENTS_DB_ID}}}
+    assert sync_request_from_webhook(event) == SyncRequest(database="events", reason="page.deleted")
+
+
+def test_queue_round_trip(tmp_path):
+    folder = str(tmp_path / "queue")
+    enqueue_sync(folder, SyncRequest(database="events", page_id="a"))
+    enqueue_sync(folder, SyncRequest(database="executives"))
+    (tmp_path / "queue" / "0-broken.json").write_text("{")
+
+    assert drain_queue(folder) == [SyncRequest(database="events", page_id="a"), SyncRequest(database="executives")]
+    assert drain_queue(folder) == []
+    assert drain_queue(str(tmp_path / "missing")) == []
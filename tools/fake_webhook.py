@@ -0,0 +1,59 @@
+import argparse
+import json
+import sys
+import uuid
+from datetime import datetime, timezone
+from os import environ
+
+import httpx
+from dotenv import load_dotenv
+
+sys.path.append('.')
+from sdk.fetch_events import EVENTS_DB_ID
+from sdk.fetch_execs import EXECUTIVES_DB_ID
+from sdk.sync_queue import notion_signature
+
+# sends a signed webhook event shaped like the ones notion sends, so the webhook route can be tried without a real subscription
+# ie: python tools/fake_webhook.py --database executives --page-id <id of an executive's page>
+
+DATABASE_IDS = {
+    "events": EVENTS_DB_ID,
+    "executives": EXECUTIVES_DB_ID,
+}
+
+def fake_event(event_type:str, database_id:str, page_id:str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "workspace_id": str(uuid.uuid4()),
+        "subscription_id": str(uuid.uuid4()),
+        "integration_id": str(uuid.uuid4()),
+        "type": event_type,
+        "authors": [{"id": str(uuid.uuid4()), "type": "person"}],
+        "attempt_number": 1,
+        "entity": {"id": page_id, "type": "page"},
+        "data": {"parent": {"id": database_id, "type": "database"}},
+    }
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Send a fake Notion webhook event to the api.")
+    parser.add_argument("--url", default="http://localhost:5000/webhooks/notion")
+    parser.add_argument("--database", choices=DATABASE_IDS.keys(), default="events")
+    parser.add_argument("--page-id", required=True)
+    parser.add_argument("--type", default="page.properties_updated", help="ie page.created, page.deleted, page.content_updated")
+    parser.add_argument("--secret", default=environ.get("NOTION_WEBHOOK_SECRET"))
+    args = parser.parse_args()
+
+    if not args.secret:
+        print("Pass --secret or set NOTION_WEBHOOK_SECRET.")
+        sys.exit(1)
+
+    body = json.dumps(fake_event(args.type, DATABASE_IDS[args.database], args.page_id)).encode("utf-8")
+    response = httpx.post(
+        args.url,
+        content=body,
+        headers={"Content-Type": "application/json", "X-Notion-Signature": notion_signature(args.secret, body)},
+    )
+    print(response.status_code, response.text)